@@ -0,0 +1,386 @@
+import csv, glob, json, multiprocessing, os, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import Resources.Lib.SurveyParser as SurveyParser
+import Resources.Lib.SurveyCache as SurveyCache
+from Resources.Lib.SurveyAnswers import AnswerModel, CHOICE_TYPES, VALUE_TYPES, questionKey, rowQuestionKey
+from Resources.Lib.SurveyResultsWriter import LongCSVWriter
+
+
+# Files handed to a worker at a time, small enough to balance the load across workers
+CHUNK_SIZE = 64
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.aggregate.npz'
+
+# Slider and rating questions with more possible answers have them counted in this many bins at most
+MAX_VALUE_BINS = 1000
+
+
+def valueStep(item) -> int:
+    """
+    Return the width of the histogram bins of a slider or rating question: its step, or
+    a multiple of it for questions with more than MAX_VALUE_BINS possible answers.
+    """
+    step = item.choices[2] if item.type == 'rating' else 1
+    count = (item.choices[1] - item.choices[0]) // step + 1
+    return step * -(-count // MAX_VALUE_BINS)
+
+
+def valueBins(item) -> np.ndarray:
+    """Return the first answer of each histogram bin of a slider or rating question, every possible answer unless there are too many."""
+    return np.arange(item.choices[0], item.choices[1] + 1, valueStep(item))
+
+
+#
+# SurveyAggregate
+#
+class SurveyAggregate:
+    """
+    Totals of the answers of many respondents to one questionnaire, as NumPy arrays:
+      answered: (questions,) number of respondents who answered each question
+      choice_counts: (questions, choices) times each choice was picked, for
+        multi_single, dropdown and multi_multi questions
+      histograms: (questions, bins) times each value was picked, for slider and rating
+        questions, with bins given by valueBins, one per possible answer unless a
+        question has more than MAX_VALUE_BINS
+      coselection: (multi_multi questions, choices, choices) times two choices were
+        picked together, the diagonal being the choice counts; `coselection_rows` maps
+        question index to the first axis
+    Rows of questions of other types stay zero. Aggregates of disjoint sets of files are
+    combined with merge.
+    """
+    def __init__(self, items:list) -> None:
+        self.items = items
+        self.types = [item.type for item in items]
+        size = len(items)
+        choice_width = max([len(item.choices) for item in items if item.type in CHOICE_TYPES + ('multi_multi',)], default=0)
+        bin_width = max([len(valueBins(item)) for item in items if item.type in VALUE_TYPES], default=0)
+        multi = [index for index, type in enumerate(self.types) if type == 'multi_multi']
+        multi_width = max([len(items[index].choices) for index in multi], default=0)
+
+        self.respondents = 0
+        self.answered = np.zeros(size, dtype=np.int64)
+        self.choice_counts = np.zeros((size, choice_width), dtype=np.int64)
+        self.histograms = np.zeros((size, bin_width), dtype=np.int64)
+        self.coselection = np.zeros((len(multi), multi_width, multi_width), dtype=np.int64)
+        self.coselection_rows = {index: row for row, index in enumerate(multi)}
+        # (file, reason) of the files that could not be read or did not belong to the questionnaire
+        self.skipped = []
+        self.question_keys = {questionKey(item.text) for item in items}
+
+        types = np.array(self.types)
+        self._choice_rows = np.flatnonzero(np.isin(types, CHOICE_TYPES))
+        self._multi_rows = np.array(multi, dtype=np.int64)
+        self._value_rows = np.flatnonzero(np.isin(types, VALUE_TYPES))
+        self._value_minimum = np.array([items[index].choices[0] for index in self._value_rows], dtype=np.int64)
+        self._value_step = np.array([valueStep(items[index]) for index in self._value_rows], dtype=np.int64)
+
+    def addModel(self, answers:AnswerModel, sign:int=1) -> None:
+        """Add the answers of one respondent, or remove them with a `sign` of -1."""
+        self.respondents += sign
+        self.answered += sign * answers.answered
+
+        rows = self._choice_rows[answers.answered[self._choice_rows]]
+        np.add.at(self.choice_counts, (rows, answers.choice_index[rows]), sign)
+
+        if len(self._multi_rows):
+            masks = answers.multi_mask[self._multi_rows].astype(np.int64)
+            self.choice_counts[self._multi_rows, :masks.shape[1]] += sign * masks
+            self.coselection[:, :masks.shape[1], :masks.shape[1]] += sign * np.einsum('ri,rj->rij', masks, masks)
+
+        answered = answers.answered[self._value_rows]
+        bins = (answers.numbers[self._value_rows] - self._value_minimum) // self._value_step
+        np.add.at(self.histograms, (self._value_rows[answered], bins[answered]), sign)
+
+    def readFile(self, results_path:str) -> tuple:
+        """
+        Read a results file into an AnswerModel. Returns (answers, problem): answers is None
+        when the file has no answer to this questionnaire, problem describes what was wrong.
+        Files with questions this questionnaire does not have are results of another one,
+        even if some rows match, e.g. the name and anonymity questions most surveys start with.
+        """
+        answers = AnswerModel(self.items)
+        try:
+            with open(results_path, newline='') as csvFile:
+                rows = list(csv.reader(csvFile))
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            return None, str(e)
+
+        foreign = sum(1 for row in rows if row and rowQuestionKey(row) not in self.question_keys)
+        if foreign:
+            return None, f"{foreign} rows are not questions of this questionnaire"
+        unmatched = answers.fromCSVRows(rows)
+
+        if not answers.answered.any():
+            return None, "no answer matches the questionnaire"
+        if unmatched:
+            return answers, f"{len(unmatched)} rows do not match the questionnaire"
+        return answers, None
+
+    def addFile(self, results_path:str) -> bool:
+        """Add the answers of a results file. Returns False, and records why, if it has no answer to this questionnaire."""
+        answers, problem = self.readFile(results_path)
+        if problem:
+            self.skipped.append((results_path, problem))
+        if answers is None:
+            return False
+        self.addModel(answers)
+        return True
+
+    def fileRecord(self, answers:AnswerModel) -> dict:
+        """Return the part of a respondent's answers the totals depend on, small enough to keep for every file."""
+        return {
+            'answered': answers.answered.copy(),
+            'choice_index': answers.choice_index[self._choice_rows].astype(np.int16),
+            'numbers': answers.numbers[self._value_rows].astype(np.int32),
+            'multi_mask': answers.multi_mask[self._multi_rows].copy(),
+        }
+
+    def modelFromRecord(self, record:dict) -> AnswerModel:
+        answers = AnswerModel(self.items)
+        answers.answered[:] = record['answered']
+        answers.choice_index[self._choice_rows] = record['choice_index']
+        answers.numbers[self._value_rows] = record['numbers']
+        answers.multi_mask[self._multi_rows] = record['multi_mask']
+        return answers
+
+    def merge(self, other) -> None:
+        self.mergeArrays(other._arrays())
+
+    def counts(self, index:int) -> dict:
+        """Return {choice: count} of a multi_single, dropdown or multi_multi question."""
+        return dict(zip(self.items[index].choices, self.choice_counts[index].tolist()))
+
+    def histogram(self, index:int) -> tuple:
+        """Return (values, counts) of a slider or rating question, values being the first answer of each bin."""
+        values = valueBins(self.items[index])
+        return values, self.histograms[index, :len(values)]
+
+    def coselectionMatrix(self, index:int) -> np.ndarray:
+        """Return the (choices, choices) co-selection counts of a multi_multi question."""
+        size = len(self.items[index].choices)
+        return self.coselection[self.coselection_rows[index], :size, :size]
+
+    def _arrays(self) -> dict:
+        return {
+            'respondents': self.respondents,
+            'answered': self.answered,
+            'choice_counts': self.choice_counts,
+            'histograms': self.histograms,
+            'coselection': self.coselection,
+            'skipped': self.skipped,
+        }
+
+    def mergeArrays(self, arrays:dict) -> None:
+        """Merge the _arrays of another aggregate of the same questionnaire."""
+        self.respondents += arrays['respondents']
+        self.answered += arrays['answered']
+        self.choice_counts += arrays['choice_counts']
+        self.histograms += arrays['histograms']
+        self.coselection += arrays['coselection']
+        self.skipped.extend(arrays['skipped'])
+
+
+def resultsFiles(results_dir:str) -> list:
+    """Return the results files of a directory in the results format that can be loaded back."""
+    paths = glob.glob(os.path.join(results_dir, '*.csv'))
+    return sorted(path for path in paths if not path.lower().endswith(LongCSVWriter.suffix))
+
+
+def _aggregateFiles(questionnaire_path:str, results_paths:list) -> dict:
+    aggregate = SurveyAggregate(SurveyParser.readSurveyItems(questionnaire_path))
+    for path in results_paths:
+        aggregate.addFile(path)
+    # Plain arrays pickle faster than the aggregate and its items
+    return aggregate._arrays()
+
+
+def aggregateResults(questionnaire_path:str, results_paths:list, workers:int=None) -> SurveyAggregate:
+    """
+    Aggregate the results files of a questionnaire, split in chunks over a pool of
+    `workers` processes (all cores by default, 1 to run in this process).
+    """
+    items = SurveyParser.readSurveyItems(questionnaire_path)
+    aggregate = SurveyAggregate(items)
+    workers = workers or os.cpu_count() or 1
+    chunks = [results_paths[start:start + CHUNK_SIZE] for start in range(0, len(results_paths), CHUNK_SIZE)]
+    if workers == 1 or len(chunks) <= 1:
+        for path in results_paths:
+            aggregate.addFile(path)
+        return aggregate
+
+    # Forking the Slicer application is unsafe, spawned workers start afresh with this sys.path
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+        futures = [pool.submit(_aggregateFiles, questionnaire_path, chunk) for chunk in chunks]
+        for future in futures:
+            aggregate.mergeArrays(future.result())
+    return aggregate
+
+
+def _readFileRecords(questionnaire_path:str, results_paths:list) -> list:
+    aggregate = SurveyAggregate(SurveyParser.readSurveyItems(questionnaire_path))
+    records = []
+    for path in results_paths:
+        answers, problem = aggregate.readFile(path)
+        records.append((path, aggregate.fileRecord(answers) if answers is not None else None, problem))
+    return records
+
+
+def _fileState(path:str) -> dict:
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+#
+# IncrementalAggregate
+#
+class IncrementalAggregate:
+    """
+    The SurveyAggregate of a results directory, kept up to date by update() which only
+    reads the files that are new or changed since the last update. It is persisted in
+    `<results dir>/.<questionnaire>.aggregate.npz` with an index of every processed file
+    (size, mtime, content hash) and the fileRecord of each, so that the contribution of a
+    changed or deleted file can be taken out of the totals again.
+    """
+    def __init__(self, questionnaire_path:str, results_dir:str, index_path:str=None) -> None:
+        self.questionnaire_path = questionnaire_path
+        self.results_dir = results_dir
+        stem = os.path.splitext(os.path.basename(questionnaire_path))[0]
+        self.index_path = index_path or os.path.join(results_dir, f".{stem}{INDEX_SUFFIX}")
+        self.items = SurveyParser.readSurveyItems(questionnaire_path)
+        self.questionnaire_hash = SurveyCache.contentHash(questionnaire_path)
+        self.aggregate = SurveyAggregate(self.items)
+        # path -> {size, mtime_ns, sha256, problem}, and path -> fileRecord of the files counted
+        self.files = {}
+        self.records = {}
+        self.load()
+
+    def load(self) -> bool:
+        """Load the persisted index. Returns False, starting empty, if there is none for this questionnaire."""
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                if meta['version'] != INDEX_VERSION or meta['questionnaire'] != self.questionnaire_hash:
+                    return False
+                arrays = {name: data[name] for name in ('answered', 'choice_counts', 'histograms', 'coselection')}
+                records = {name: data['file_' + name] for name in ('answered', 'choice_index', 'numbers', 'multi_mask')}
+        except (OSError, KeyError, ValueError):
+            return False
+
+        arrays['respondents'] = meta['respondents']
+        arrays['skipped'] = []
+        self.aggregate = SurveyAggregate(self.items)
+        self.aggregate.mergeArrays(arrays)
+        self.files = meta['files']
+        self.records = {path: {name: values[row] for name, values in records.items()}
+                        for row, path in enumerate(meta['recorded'])}
+        self._updateSkipped()
+        return True
+
+    def save(self) -> None:
+        recorded = list(self.records)
+        empty = self.aggregate.fileRecord(AnswerModel(self.items))
+        records = {name: np.stack([self.records[path][name] for path in recorded]) if recorded else empty[name][np.newaxis][:0]
+                   for name in empty}
+        meta = {
+            'version': INDEX_VERSION,
+            'questionnaire': self.questionnaire_hash,
+            'respondents': self.aggregate.respondents,
+            'files': self.files,
+            'recorded': recorded,
+        }
+        temporary_path = self.index_path + '.tmp.npz'
+        np.savez(temporary_path, meta=np.array(json.dumps(meta)),
+                 answered=self.aggregate.answered, choice_counts=self.aggregate.choice_counts,
+                 histograms=self.aggregate.histograms, coselection=self.aggregate.coselection,
+                 **{'file_' + name: values for name, values in records.items()})
+        os.replace(temporary_path, self.index_path)
+
+    def _updateSkipped(self) -> None:
+        self.aggregate.skipped = [(path, state['problem']) for path, state in sorted(self.files.items()) if state['problem']]
+
+    def _remove(self, path:str) -> None:
+        record = self.records.pop(path, None)
+        if record is not None:
+            self.aggregate.addModel(self.aggregate.modelFromRecord(record), sign=-1)
+        self.files.pop(path, None)
+
+    def update(self, workers:int=None) -> dict:
+        """
+        Fold new and changed results files into the totals, take deleted ones out, and save
+        the index. Returns the paths that were added, changed and removed.
+        """
+        current = set(resultsFiles(self.results_dir))
+        removed = sorted(set(self.files) - current)
+        added = []
+        changed = []
+        touched = False
+        states = {}
+        for path in sorted(current):
+            try:
+                state = _fileState(path)
+            except OSError:
+                continue
+            known = self.files.get(path)
+            if known is None:
+                added.append(path)
+            elif known['size'] != state['size'] or known['mtime_ns'] != state['mtime_ns']:
+                state['sha256'] = SurveyCache.contentHash(path)
+                if state['sha256'] == known['sha256']:
+                    # Touched but not modified, saved so that it is not hashed again next time
+                    known.update(state)
+                    touched = True
+                    continue
+                changed.append(path)
+            else:
+                continue
+            states[path] = state
+
+        for path in removed + changed:
+            self._remove(path)
+
+        to_read = added + changed
+        for path, record, problem in self._readRecords(to_read, workers):
+            state = states[path]
+            if 'sha256' not in state:
+                state['sha256'] = SurveyCache.contentHash(path)
+            state['problem'] = problem
+            self.files[path] = state
+            if record is not None:
+                self.records[path] = record
+                self.aggregate.addModel(self.aggregate.modelFromRecord(record))
+
+        self._updateSkipped()
+        if removed or to_read or touched:
+            self.save()
+        return {'added': added, 'changed': changed, 'removed': removed}
+
+    def _readRecords(self, paths:list, workers:int=None) -> list:
+        workers = workers or os.cpu_count() or 1
+        chunks = [paths[start:start + CHUNK_SIZE] for start in range(0, len(paths), CHUNK_SIZE)]
+        if workers == 1 or len(chunks) <= 1:
+            return _readFileRecords(self.questionnaire_path, paths)
+
+        context = multiprocessing.get_context('spawn')
+        records = []
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+            for chunk_records in pool.map(_readFileRecords, [self.questionnaire_path] * len(chunks), chunks):
+                records.extend(chunk_records)
+        return records
+
+    def watch(self, interval:float=10.0, callback=None, iterations:int=None, workers:int=None) -> None:
+        """
+        Update every `interval` seconds, calling `callback(self, changes)` after updates that
+        changed anything, until `iterations` updates were made (forever by default). This
+        blocks; in the Slicer GUI use SurveyLoaderLogic.watchResults instead.
+        """
+        count = 0
+        while iterations is None or count < iterations:
+            changes = self.update(workers)
+            if callback and any(changes.values()):
+                callback(self, changes)
+            count += 1
+            if iterations is None or count < iterations:
+                time.sleep(interval)
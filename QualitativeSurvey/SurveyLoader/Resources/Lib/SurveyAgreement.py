@@ -0,0 +1,177 @@
+import numpy as np
+from Resources.Lib.SurveyAnswers import CHOICE_TYPES
+from Resources.Lib.SurveyAggregate import SurveyAggregate, valueBins, valueStep
+
+
+DEFAULT_BOOTSTRAP = 1000
+DEFAULT_CONFIDENCE = 0.95
+# Bootstrap resamples computed together, bounding memory to about BATCH * items * categories values
+BOOTSTRAP_BATCH = 100
+
+
+def defaultQuestions(items:list) -> list:
+    """The questions readers are compared on by default: single choice questions that show images."""
+    return [index for index, item in enumerate(items) if item.images and item.type in CHOICE_TYPES]
+
+
+def categoryCount(items:list, questions:list) -> int:
+    """Number of categories of a rating matrix of `questions`, enough for the question with the most."""
+    return max([len(items[index].choices) if items[index].type in CHOICE_TYPES else len(valueBins(items[index]))
+                for index in questions], default=0)
+
+
+def ratingMatrix(models:list, items:list, questions:list) -> np.ndarray:
+    """
+    Return the (raters, items) category of every answer to `questions`, -1 when unanswered.
+    Categories are choice indices, or for slider and rating questions the index of the
+    valueBins bin of the value.
+    """
+    questions = np.asarray(questions, dtype=np.int64)
+    ratings = np.full((len(models), len(questions)), -1, dtype=np.int64)
+    choice = np.isin([items[index].type for index in questions], CHOICE_TYPES)
+    minimum = np.array([0 if is_choice else items[index].choices[0] for index, is_choice in zip(questions, choice)], dtype=np.int64)
+    step = np.array([1 if is_choice else valueStep(items[index]) for index, is_choice in zip(questions, choice)], dtype=np.int64)
+    for rater, answers in enumerate(models):
+        values = np.where(choice, answers.choice_index[questions], (answers.numbers[questions] - minimum) // step)
+        ratings[rater] = np.where(answers.answered[questions], values, -1)
+    return ratings
+
+
+def readResults(items:list, results_paths:list) -> tuple:
+    """
+    Read the results files of one questionnaire into AnswerModels. Returns (answers, paths,
+    skipped): the models and files read, and (path, problem) of the others like SurveyAggregate.
+    """
+    reader = SurveyAggregate(items)
+    models, paths = [], []
+    for path in results_paths:
+        answers, problem = reader.readFile(path)
+        if problem:
+            reader.skipped.append((path, problem))
+        if answers is not None:
+            models.append(answers)
+            paths.append(path)
+    return models, paths, reader.skipped
+
+
+def ratingsFromFiles(items:list, results_paths:list, questions:list) -> tuple:
+    """ratingMatrix of the results files of one questionnaire, one rater per file. Returns (ratings, rater paths, skipped)."""
+    models, paths, skipped = readResults(items, results_paths)
+    return ratingMatrix(models, items, questions), paths, skipped
+
+
+def countMatrix(ratings:np.ndarray, categories:int) -> np.ndarray:
+    """Return the (items, categories) number of raters who put each item in each category."""
+    counts = np.zeros((ratings.shape[1], categories), dtype=np.int64)
+    raters, columns = np.nonzero(ratings >= 0)
+    np.add.at(counts, (columns, ratings[raters, columns]), 1)
+    return counts
+
+
+def fleissKappa(counts:np.ndarray) -> np.ndarray:
+    """
+    Fleiss' kappa of an (..., items, categories) count matrix, over a leading batch of
+    resamples if any. Items may have different numbers of raters; those with fewer than
+    two are ignored.
+    """
+    counts = counts * (counts.sum(-1, keepdims=True) >= 2)
+    raters = counts.sum(-1)
+    pairs = np.maximum(raters * (raters - 1), 1)
+    rated = raters >= 2
+    observed = ((counts * (counts - 1)).sum(-1) / pairs).sum(-1) / np.maximum(rated.sum(-1), 1)
+    proportions = counts.sum(-2) / np.maximum(raters.sum(-1, keepdims=True), 1)
+    expected = (proportions ** 2).sum(-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (observed - expected) / (1 - expected)
+
+
+def krippendorffAlpha(counts:np.ndarray, metric:str='nominal') -> np.ndarray:
+    """
+    Krippendorff's alpha of an (..., items, categories) count matrix, from its coincidence
+    matrix. `metric` is 'nominal', or 'interval' for categories that are equally spaced
+    values such as ratings.
+    """
+    categories = counts.shape[-1]
+    if metric == 'nominal':
+        distance = 1.0 - np.eye(categories)
+    elif metric == 'interval':
+        values = np.arange(categories)
+        distance = (values[:, None] - values[None, :]) ** 2.0
+    else:
+        raise ValueError(f"unknown metric {metric!r}, expected 'nominal' or 'interval'")
+
+    counts = counts * (counts.sum(-1, keepdims=True) >= 2)
+    raters = counts.sum(-1)
+    weights = 1.0 / np.maximum(raters - 1, 1)
+    coincidences = np.einsum('...u,...uc,...uk->...ck', weights, counts, counts)
+    coincidences -= np.einsum('...u,...uc->...c', weights, counts)[..., None] * np.eye(categories)
+    totals = coincidences.sum(-1)
+    pairable = totals.sum(-1)
+    observed = (coincidences * distance).sum((-2, -1))
+    expected = np.einsum('...c,...k,ck->...', totals, totals, distance)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1.0 - (pairable - 1) * observed / expected
+
+
+def cohenKappaPairs(ratings:np.ndarray, categories:int) -> np.ndarray:
+    """
+    Return the (raters, raters) Cohen's kappa of every pair of raters, each over the items
+    both rated; NaN for pairs without common items or without any variation.
+    """
+    rated = (ratings >= 0).astype(np.float64)
+    onehot = np.zeros(ratings.shape + (categories,))
+    raters, columns = np.nonzero(ratings >= 0)
+    onehot[raters, columns, ratings[raters, columns]] = 1.0
+
+    common = rated @ rated.T
+    agreements = np.einsum('aik,bik->ab', onehot, onehot)
+    # Category proportions of each rater over the items shared with the other rater
+    marginals = np.einsum('aik,bi->abk', onehot, rated)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed = agreements / common
+        expected = np.einsum('abk,bak->ab', marginals, marginals) / common ** 2
+        return (observed - expected) / (1 - expected)
+
+
+def bootstrapInterval(counts:np.ndarray, statistic, resamples:int=DEFAULT_BOOTSTRAP,
+                      confidence:float=DEFAULT_CONFIDENCE, seed:int=0) -> tuple:
+    """
+    Percentile confidence interval of `statistic(counts)` over items resampled with
+    replacement. Resamples are drawn and evaluated BOOTSTRAP_BATCH at a time as one
+    (batch, items, categories) array.
+    """
+    rng = np.random.default_rng(seed)
+    items = counts.shape[0]
+    values = []
+    for start in range(0, resamples, BOOTSTRAP_BATCH):
+        batch = min(BOOTSTRAP_BATCH, resamples - start)
+        values.append(statistic(counts[rng.integers(0, items, size=(batch, items))]))
+    values = np.concatenate(values)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return float('nan'), float('nan')
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(values, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def agreement(ratings:np.ndarray, categories:int, metric:str='nominal', resamples:int=DEFAULT_BOOTSTRAP,
+              confidence:float=DEFAULT_CONFIDENCE, seed:int=0) -> dict:
+    """Every agreement statistic of a rating matrix, with bootstrap confidence intervals over items."""
+    counts = countMatrix(ratings, categories)
+    cohen = cohenKappaPairs(ratings, categories)
+    pairs = cohen[np.triu_indices(len(ratings), 1)]
+    pairs = pairs[np.isfinite(pairs)]
+    result = {
+        'raters': int(ratings.shape[0]),
+        'items': int(ratings.shape[1]),
+        'fleiss_kappa': float(fleissKappa(counts)),
+        'krippendorff_alpha': float(krippendorffAlpha(counts, metric)),
+        'cohen_kappa': cohen,
+        'mean_cohen_kappa': float(pairs.mean()) if len(pairs) else float('nan'),
+    }
+    if resamples:
+        result['fleiss_kappa_interval'] = bootstrapInterval(counts, fleissKappa, resamples, confidence, seed)
+        result['krippendorff_alpha_interval'] = bootstrapInterval(
+            counts, lambda batch: krippendorffAlpha(batch, metric), resamples, confidence, seed)
+    return result
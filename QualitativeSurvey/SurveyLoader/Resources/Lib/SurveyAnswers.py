@@ -0,0 +1,382 @@
+import numpy as np
+from Resources.Lib.SurveyParser import surveyShape
+
+
+UNANSWERED = "Question Unanswered"
+
+CHOICE_TYPES = ('multi_single', 'dropdown')
+VALUE_TYPES = ('slider', 'rating')
+
+# Returned by AnswerModel._parseAnswers for answers that do not match the question
+INVALID = object()
+
+
+def formatCSVRow(question:str, answers:list) -> str:
+    formatted_question = "'" + question.strip()
+    csv_string = '"{}",'.format(formatted_question)
+
+    for answer in answers:
+        if answer == '' or answer is None:
+            csv_string += '"{}",'.format(UNANSWERED)
+        else:
+            formatted_answer = "'" + answer.strip()
+            csv_string += '"{}",'.format(formatted_answer)
+    return csv_string[:-1]+"\n" if csv_string[-1] == "," else csv_string+"\n"
+
+
+def questionKey(text:str) -> str:
+    """Key of a question in results files, which only keep the question text."""
+    return text.strip()
+
+
+def rowQuestionKey(row:list):
+    """Return the questionKey of a results row, or None when the row is malformed."""
+    if not row or len(row[0]) < 1 or row[0][0] != "'":
+        return None
+    return questionKey(row[0][1:])
+
+
+def parseCSVAnswer(answer:str):
+    """Return the answer text of a results cell, '' when unanswered, or None when malformed."""
+    if answer == UNANSWERED:
+        return ""
+    elif len(answer) < 2 or answer[0] != "'":
+        return None
+    return answer[1:]
+
+
+#
+# AnswerModel
+#
+class AnswerModel:
+    """
+    Answers to every question of a questionnaire, kept without any Qt objects so that
+    they can be read, validated, saved and resumed headless.
+
+    Each question has one compact value depending on its type (see getValue):
+      multi_single, dropdown: index of the chosen choice, -1 when unanswered
+      multi_multi: bitmask of the chosen choice indices, 0 when unanswered
+      slider, rating: the chosen int, None when unanswered
+      open: the answer text, '' when unanswered
+
+    The values are held in NumPy arrays over all questions (`answered`, `choice_index`,
+    `multi_mask`, `numbers`) so that completeness queries are single vectorized
+    operations. Only open answers are kept as Python strings, in `texts`.
+
+    Question widgets are views over this model (see QuestionWidget.bindModel). `items` may
+    be an IndexedSurvey, whose items are then only read for the questions that are used.
+    """
+    def __init__(self, items:list) -> None:
+        self.items = items
+        self.types, multi_width = surveyShape(items)
+        size = len(self.types)
+        self.answered = np.zeros(size, dtype=bool)
+        self.choice_index = np.full(size, -1, dtype=np.int32)
+        self.multi_mask = np.zeros((size, multi_width), dtype=bool)
+        self.numbers = np.zeros(size, dtype=np.int64)
+        self.texts = {}
+        self.observers = []
+        self._question_index = None
+
+    def __len__(self) -> int:
+        return len(self.answered)
+
+    @staticmethod
+    def _emptyValue(type:str):
+        if type in CHOICE_TYPES:
+            return -1
+        elif type == 'multi_multi':
+            return 0
+        elif type in VALUE_TYPES:
+            return None
+        return ""
+
+    def iterItems(self, indices):
+        """
+        Yield (index, item) for the increasing question `indices`, reading the items in one
+        pass over the questionnaire, which an IndexedSurvey does sequentially instead of
+        seeking to each question.
+        """
+        indices = iter(indices)
+        wanted = next(indices, None)
+        if wanted is None:
+            return
+        for index, item in enumerate(self.items):
+            if index == wanted:
+                yield index, item
+                wanted = next(indices, None)
+                if wanted is None:
+                    return
+
+    def addObserver(self, callback) -> None:
+        """
+        `callback(index)` is called whenever the answer to question `index` changes, and
+        `callback(None)` once when many answers changed at once (see fromCSVRows).
+        """
+        self.observers.append(callback)
+
+    def _notify(self, index) -> None:
+        for callback in self.observers:
+            callback(index)
+
+    def getValue(self, index:int):
+        type = self.types[index]
+        if type in CHOICE_TYPES:
+            return int(self.choice_index[index])
+        elif type == 'multi_multi':
+            return sum(1 << int(i) for i in np.flatnonzero(self.multi_mask[index]))
+        elif type in VALUE_TYPES:
+            return int(self.numbers[index]) if self.answered[index] else None
+        return self.texts.get(index, "")
+
+    def setValue(self, index:int, value) -> None:
+        if self.getValue(index) == value:
+            return
+        self._store(index, value)
+        self._notify(index)
+
+    def _store(self, index:int, value) -> None:
+        type = self.types[index]
+        if type in CHOICE_TYPES:
+            self.choice_index[index] = value
+        elif type == 'multi_multi':
+            self.multi_mask[index] = [value >> i & 1 for i in range(self.multi_mask.shape[1])]
+        elif type in VALUE_TYPES:
+            self.numbers[index] = value if value is not None else 0
+        elif value:
+            self.texts[index] = value
+        else:
+            self.texts.pop(index, None)
+        self.answered[index] = value != self._emptyValue(type)
+
+    def isValidValue(self, index:int, value, item=None) -> bool:
+        """
+        Return whether `value` is a value of question `index` (see getValue), e.g. a choice
+        index within its choices. `item` is its SurveyItem when it was already read.
+        """
+        if not 0 <= index < len(self):
+            return False
+        item = item if item is not None else self.items[index]
+        if item.type == 'open':
+            return isinstance(value, str)
+        if item.type in VALUE_TYPES and value is None:
+            return True
+        if not isinstance(value, int) or isinstance(value, bool):
+            return False
+        if item.type in CHOICE_TYPES:
+            return -1 <= value < len(item.choices)
+        elif item.type == 'multi_multi':
+            return 0 <= value < 1 << len(item.choices)
+        elif item.type in VALUE_TYPES:
+            if not item.choices[0] <= value <= item.choices[1]:
+                return False
+            return item.type != 'rating' or (value - item.choices[0]) % item.choices[2] == 0
+        return False
+
+    def clear(self, index:int) -> None:
+        self.setValue(index, self._emptyValue(self.types[index]))
+
+    def isAnswered(self, index:int) -> bool:
+        return bool(self.answered[index])
+
+    def unanswered(self) -> list:
+        return np.flatnonzero(~self.answered).tolist()
+
+    def nextUnanswered(self, index:int, order=None):
+        """
+        Return the first unanswered question after `index`, wrapping around, or None if all
+        are answered. `order` lists the question indices in the order they are shown, if not
+        the order of the questionnaire.
+        """
+        if order is not None:
+            order = np.asarray(order)
+            unanswered = np.flatnonzero(~self.answered[order])
+            if len(unanswered) == 0:
+                return None
+            position = np.searchsorted(unanswered, np.flatnonzero(order == index)[0], side='right')
+            return int(order[unanswered[position % len(unanswered)]])
+        unanswered = np.flatnonzero(~self.answered)
+        if len(unanswered) == 0:
+            return None
+        position = np.searchsorted(unanswered, index, side='right')
+        return int(unanswered[position % len(unanswered)])
+
+    def isComplete(self) -> bool:
+        return bool(self.answered.all())
+
+    def percentComplete(self) -> float:
+        return 100.0 * np.count_nonzero(self.answered) / len(self) if len(self) else 100.0
+
+    def getAnswers(self, index:int, item=None) -> list:
+        """
+        Return the answers as text, in the format of QuestionWidget.getAnswers. `item` is the
+        SurveyItem of question `index` when it was already read.
+        """
+        item = item if item is not None else self.items[index]
+        value = self.getValue(index)
+        if item.type in CHOICE_TYPES:
+            return [item.choices[value]] if value >= 0 else [None]
+        elif item.type == 'multi_multi':
+            answers = [choice for i, choice in enumerate(item.choices) if value >> i & 1]
+            return answers if answers else [None]
+        elif item.type in VALUE_TYPES:
+            return [str(value)] if value is not None else [None]
+        return [value]
+
+    def setAnswers(self, index:int, answers:list) -> bool:
+        """Set the answers from text, in the format of QuestionWidget.getAnswers. Returns False if they do not match the question."""
+        value = self._parseAnswers(self.items[index], answers)
+        if value is INVALID:
+            return False
+        self.setValue(index, value)
+        return True
+
+    @staticmethod
+    def _parseAnswers(item, answers:list):
+        answers = [answer for answer in answers if answer not in (None, "")]
+        if item.type == 'open':
+            return answers[0] if answers else ""
+        elif not answers:
+            return AnswerModel._emptyValue(item.type)
+
+        if item.type in CHOICE_TYPES:
+            if len(answers) != 1 or answers[0] not in item.choices:
+                return INVALID
+            return item.choices.index(answers[0])
+        elif item.type == 'multi_multi':
+            mask = 0
+            for answer in answers:
+                if answer not in item.choices:
+                    return INVALID
+                mask |= 1 << item.choices.index(answer)
+            return mask
+        elif item.type in VALUE_TYPES:
+            try:
+                value = int(answers[0])
+            except ValueError:
+                return INVALID
+            if not item.choices[0] <= value <= item.choices[1]:
+                return INVALID
+            if item.type == 'rating' and (value - item.choices[0]) % item.choices[2] != 0:
+                return INVALID
+            return value
+        return INVALID
+
+    def questionIndex(self) -> dict:
+        """Map each questionKey to the indices of the questions with that key, in questionnaire order."""
+        if self._question_index is None:
+            question_index = {}
+            for index, item in enumerate(self.items):
+                question_index.setdefault(questionKey(item.text), []).append(index)
+            self._question_index = question_index
+        return self._question_index
+
+    def matchCSVRows(self, rows) -> tuple:
+        """
+        Match results rows to questions by their question text rather than their position, so
+        that rows that were skipped (e.g. the name of anonymous readers) or reordered do not
+        shift the others. Rows of a repeated question text go to the questions whose choices
+        or range accept their answer, in order when several do, so that reordered repeated
+        questions with different choices are still matched.
+        Returns ([(row number, question index, row)], [(row number, reason)] of the rows that match no question).
+        """
+        question_index = self.questionIndex()
+        rows_of = {}
+        mismatches = []
+        for row_number, row in enumerate(rows, 1):
+            if not row:
+                continue
+            key = rowQuestionKey(row)
+            if key is None:
+                mismatches.append((row_number, "not a saved answer"))
+            elif key not in question_index:
+                mismatches.append((row_number, f"question \"{key}\" is not in the questionnaire"))
+            else:
+                rows_of.setdefault(key, []).append((row_number, row))
+
+        # The questions of repeated texts are read in one pass, their choices decide the matches
+        repeated = sorted(index for key in rows_of for index in question_index[key] if len(question_index[key]) > 1)
+        repeated = dict(self.iterItems(repeated))
+
+        matches = []
+        for key, key_rows in rows_of.items():
+            candidates = question_index[key]
+            if len(candidates) == 1:
+                fitting = [candidates] * len(key_rows)
+            else:
+                fitting = [[index for index in candidates if self._valueFromCSV(index, row, repeated[index]) is not INVALID]
+                           for row_number, row in key_rows]
+            # Rows that fit fewer questions choose first, rows that fit none take what is left
+            unused = list(candidates)
+            for num in sorted(range(len(key_rows)), key=lambda num: (not fitting[num], len(fitting[num]), num)):
+                row_number, row = key_rows[num]
+                if not unused:
+                    mismatches.append((row_number, f"question \"{key}\" appears more often than in the questionnaire"))
+                    continue
+                index = next((index for index in unused if index in fitting[num]), unused[0])
+                unused.remove(index)
+                matches.append((row_number, index, row))
+        return sorted(matches, key=lambda match: match[0]), sorted(mismatches)
+
+    def toCSV(self, index:int, item=None) -> str:
+        item = item if item is not None else self.items[index]
+        return formatCSVRow(item.text, self.getAnswers(index, item))
+
+    def fromCSV(self, index:int, data:list, item=None) -> bool:
+        """Qt-free equivalent of QuestionWidget.fromCSV for one results row, `item` is the SurveyItem of question `index` if read."""
+        item = item if item is not None else self.items[index]
+        if len(data) < 2 or data[0] != "'" + item.text.strip():
+            return False
+        value = self._valueFromCSV(index, data, item)
+        if value is INVALID:
+            return False
+        self.setValue(index, value)
+        return True
+
+    def _valueFromCSV(self, index:int, data:list, item=None):
+        # The question text of `data` is assumed to match question `index`, whose SurveyItem `item` may already be read
+        if len(data) < 2 or (len(data) != 2 and self.types[index] != 'multi_multi'):
+            return INVALID
+        answers = [parseCSVAnswer(each) for each in data[1:]]
+        if None in answers:
+            return INVALID
+        return self._parseAnswers(item if item is not None else self.items[index], answers)
+
+    def fromCSVRows(self, rows) -> list:
+        """
+        Restore a whole results file at once, matching rows as matchCSVRows does. Values are
+        stored in bulk per type and observers are told once with None, so no widget is
+        involved and the cost only depends on the number of rows and one pass over the items.
+        Returns the (row number, reason) of the rows that could not be restored.
+        """
+        matches, mismatches = self.matchCSVRows(rows)
+        choice_indices, choice_values = [], []
+        number_indices, number_values = [], []
+        matches.sort(key=lambda match: match[1])
+        items = self.iterItems(index for row_number, index, row in matches)
+        for (row_number, index, row), (item_index, item) in zip(matches, items):
+            value = self._valueFromCSV(index, row, item)
+            if value is INVALID:
+                mismatches.append((row_number, f"answer does not fit question {index + 1}"))
+                continue
+
+            type = self.types[index]
+            if type in CHOICE_TYPES:
+                choice_indices.append(index)
+                choice_values.append(value)
+            elif type in VALUE_TYPES and value is not None:
+                number_indices.append(index)
+                number_values.append(value)
+            else:
+                self._store(index, value)
+
+        if choice_indices:
+            self.choice_index[choice_indices] = choice_values
+            self.answered[choice_indices] = np.array(choice_values) >= 0
+        if number_indices:
+            self.numbers[number_indices] = number_values
+            self.answered[number_indices] = True
+
+        if matches:
+            self._notify(None)
+        return sorted(mismatches)
@@ -0,0 +1,191 @@
+import hashlib, os, pickle
+import Resources.Lib.SurveyParser as SurveyParser
+import Resources.Lib.SurveyImageIO as SurveyImageIO
+
+
+# Increased whenever what is cached changes meaning, so that older caches are recompiled:
+# 2 reads questions CSVs as UTF-8 (SurveyParser.SURVEY_ENCODING), 3 adds image statistics
+CACHE_VERSION = 3
+CACHE_SUFFIX = '.surveycache'
+
+
+class _PlainUnpickler(pickle.Unpickler):
+    # Compiled surveys only hold builtin types, refuse anything that would import code
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a compiled survey")
+
+
+#
+# CompiledSurvey
+#
+class CompiledSurvey:
+    """
+    A questions CSV compiled into everything needed to open it: the parsed items, the
+    validation errors, and for every referenced image its absolute path, Slicer file
+    type, header metadata and, once precomputed, display statistics. It is cached next to
+    the questionnaire (see loadCompiledSurvey) and invalidated when the CSV content or
+    CACHE_VERSION changes.
+    """
+    def __init__(self, csv_path:str, items:list, errors:list, images:dict, signature:dict) -> None:
+        self.csv_path = csv_path
+        self.items = items
+        self.errors = errors
+        self.images = images
+        self.signature = signature
+
+    def imageInfo(self, name:str):
+        return self.images.get(name)
+
+    def toData(self) -> dict:
+        return {
+            'version': CACHE_VERSION,
+            'signature': self.signature,
+            'items': [(item.text, item.type, item.images, item.choices) for item in self.items],
+            'errors': self.errors,
+            'images': self.images,
+        }
+
+    @classmethod
+    def fromData(cls, csv_path:str, data:dict):
+        items = [SurveyParser.SurveyItem(*each) for each in data['items']]
+        # The questionnaire directory may have moved since it was compiled
+        questionnaire_dir = os.path.dirname(os.path.abspath(csv_path))
+        for name, info in data['images'].items():
+            info['path'] = os.path.join(questionnaire_dir, name)
+        return cls(csv_path, items, data['errors'], data['images'], data['signature'])
+
+
+def cachePath(csv_path:str) -> str:
+    return str(csv_path) + CACHE_SUFFIX
+
+
+def contentHash(path:str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fileSignature(path:str) -> dict:
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def describeImage(path:str, file_type_resolver=None, statistics:bool=False) -> dict:
+    info = {'path': path, 'exists': os.path.exists(path), 'file_type': None, 'header': None, 'statistics': None}
+    if not info['exists']:
+        return info
+
+    info.update(_fileSignature(path))
+    if file_type_resolver is not None:
+        info['file_type'] = file_type_resolver(path) or None
+    if SurveyImageIO.canRead(path):
+        try:
+            info['header'] = SurveyImageIO.readImageHeader(path)
+            if statistics:
+                info['statistics'] = SurveyImageIO.imageStatistics(SurveyImageIO.readImage(path).array)
+        except (OSError, SurveyImageIO.UnsupportedImageError):
+            pass
+    return info
+
+
+def compileSurvey(csv_path:str, file_type_resolver=None) -> CompiledSurvey:
+    """Parse and validate a questions CSV and describe every image it references."""
+    signature = _fileSignature(csv_path)
+    signature['sha256'] = contentHash(csv_path)
+    items, errors = SurveyParser.parseSurveyCSV(csv_path)
+
+    questionnaire_dir = os.path.dirname(os.path.abspath(csv_path))
+    images = {}
+    for item in items:
+        for name in item.images:
+            if name not in images:
+                images[name] = describeImage(os.path.join(questionnaire_dir, name), file_type_resolver)
+    return CompiledSurvey(csv_path, items, errors, images, signature)
+
+
+def readCompiledSurvey(csv_path:str):
+    """Return the cached compiled survey of `csv_path`, or None if there is no usable cache."""
+    try:
+        with open(cachePath(csv_path), 'rb') as file:
+            data = _PlainUnpickler(file).load()
+        if data.get('version') != CACHE_VERSION:
+            return None
+        return CompiledSurvey.fromData(csv_path, data)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def writeCompiledSurvey(compiled:CompiledSurvey) -> bool:
+    """Write the cache atomically next to the questionnaire. Returns False if the directory is not writable."""
+    path = cachePath(compiled.csv_path)
+    temporary_path = path + '.tmp'
+    try:
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(compiled.toData(), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+        return True
+    except OSError as e:
+        print(f"Could not write survey cache {path}: {e}")
+        return False
+
+
+def loadCompiledSurvey(csv_path:str, file_type_resolver=None) -> CompiledSurvey:
+    """
+    Return the compiled survey of `csv_path`, from its cache when the CSV is unchanged.
+    The cache is trusted when size and mtime match, otherwise the content hash decides.
+    Image descriptions are refreshed for images that changed since they were cached.
+    """
+    compiled = readCompiledSurvey(csv_path)
+    signature = _fileSignature(csv_path)
+    if compiled is not None and compiled.signature['size'] == signature['size']:
+        if compiled.signature['mtime_ns'] != signature['mtime_ns']:
+            if contentHash(csv_path) != compiled.signature['sha256']:
+                compiled = None
+            else:
+                compiled.signature.update(signature)
+                writeCompiledSurvey(compiled)
+    else:
+        compiled = None
+
+    if compiled is None:
+        compiled = compileSurvey(csv_path, file_type_resolver)
+        writeCompiledSurvey(compiled)
+    elif _refreshImages(compiled, file_type_resolver):
+        writeCompiledSurvey(compiled)
+    return compiled
+
+
+def precomputeStatistics(csv_path:str, file_type_resolver=None) -> CompiledSurvey:
+    """
+    Compute the display statistics (see SurveyImageIO.imageStatistics) of every image of
+    the survey that does not have them yet, and store them in its compiled survey cache.
+    Statistics are kept up to date afterwards, and recomputed for images that change.
+    """
+    compiled = loadCompiledSurvey(csv_path, file_type_resolver)
+    changed = False
+    for name, info in compiled.images.items():
+        if info['exists'] and info.get('statistics') is None and SurveyImageIO.canRead(info['path']):
+            try:
+                info['statistics'] = SurveyImageIO.imageStatistics(SurveyImageIO.readImage(info['path']).array)
+            except (OSError, SurveyImageIO.UnsupportedImageError):
+                continue
+            changed = True
+    if changed:
+        writeCompiledSurvey(compiled)
+    return compiled
+
+
+def _refreshImages(compiled:CompiledSurvey, file_type_resolver=None) -> bool:
+    changed = False
+    for name, info in compiled.images.items():
+        exists = os.path.exists(info['path'])
+        if exists and info['exists']:
+            stale = _fileSignature(info['path']) != {'size': info['size'], 'mtime_ns': info['mtime_ns']}
+        else:
+            stale = exists != info['exists']
+        if stale:
+            compiled.images[name] = describeImage(info['path'], file_type_resolver, info.get('statistics') is not None)
+            changed = True
+    return changed
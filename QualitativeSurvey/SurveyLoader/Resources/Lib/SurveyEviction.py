@@ -0,0 +1,138 @@
+import os
+from array import array
+from collections import OrderedDict
+import numpy as np
+import Resources.Lib.SurveyImageIO as SurveyImageIO
+
+
+POLICIES = ('belady', 'lru')
+
+
+#
+# ImageUses
+#
+class ImageUses:
+    """
+    Reverse index from image path to the positions of the questions showing it, in the
+    order the questions are shown, built from the images of every SurveyItem. Because a
+    survey knows which images each question needs, the cache can evict the image whose
+    next use is furthest ahead (Belady's policy) rather than the least recently used one.
+
+    The items are read in one pass, which an IndexedSurvey does sequentially, and only the
+    positions of each image are kept, not the images of each question.
+    """
+    def __init__(self, items, image_path=lambda name: name, order:list=None) -> None:
+        # With an `order` of display, uses are counted in display positions rather than question indices
+        # and a question shown several times is used at each of its positions
+        if order is not None:
+            order = np.asarray(order, dtype=np.int64)
+            by_question = np.argsort(order, kind='stable')
+            starts = np.searchsorted(order[by_question], np.arange(len(items) + 1))
+        questions = {}
+        for num, item in enumerate(items):
+            positions = [num] if order is None else by_question[starts[num]:starts[num + 1]].tolist()
+            if not positions:
+                continue
+            for name in item.images:
+                questions.setdefault(image_path(name), array('q')).extend(positions)
+        self.questions = {path: np.unique(np.frombuffer(uses, dtype=np.int64)) for path, uses in questions.items()}
+
+    def __contains__(self, path:str) -> bool:
+        return path in self.questions
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def nextUse(self, path:str, position:int) -> float:
+        """Return how many questions after `position` the image is next shown, inf if it is not shown again."""
+        nums = self.questions.get(path)
+        if nums is None:
+            return np.inf
+        following = np.searchsorted(nums, position, side='right')
+        return float(nums[following] - position) if following < len(nums) else np.inf
+
+    def lastUse(self, path:str, position:int) -> float:
+        """Return how many questions before `position` the image was last shown, inf if it never was."""
+        nums = self.questions.get(path)
+        if nums is None:
+            return np.inf
+        preceding = np.searchsorted(nums, position, side='left')
+        return float(position - nums[preceding - 1]) if preceding > 0 else np.inf
+
+    def evictionOrder(self, paths:list, position:int) -> list:
+        """
+        Order `paths` from the first to evict when at question `position`: furthest next use
+        first, then, among images not shown again ahead, the one shown furthest back, since
+        readers moving back through the survey are more likely to revisit recent questions.
+        """
+        return sorted(paths, key=lambda path: (self.nextUse(path, position), self.lastUse(path, position)), reverse=True)
+
+
+def imageBytes(path:str) -> int:
+    """Estimate the memory a loaded image takes: its voxels according to its header, else its file size."""
+    try:
+        fields = SurveyImageIO.readImageHeader(path)
+        sizes = fields.get('sizes', fields.get('dimsize', '')).split()
+        element = fields.get('type', fields.get('elementtype'))
+        dtype = SurveyImageIO.NRRD_TYPES.get(element, SurveyImageIO.METAIMAGE_TYPES.get(element))
+        if sizes and dtype:
+            return int(np.prod([int(each) for each in sizes])) * np.dtype(dtype).itemsize
+    except (OSError, ValueError, KeyError, SurveyImageIO.UnsupportedImageError):
+        pass
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def simulateCache(items, sequence:list, sizes:dict, budget_bytes:int, policy:str='belady',
+                  image_path=lambda name: name, uses:ImageUses=None) -> dict:
+    """
+    Replay visiting the questions of `sequence` with an image cache of `budget_bytes`,
+    evicting as VolumeNodeCache does: the images of the current question are never
+    evicted, others are by `policy`, 'belady' or 'lru'. `sizes` maps image paths to bytes.
+    Next uses are those of `sequence`, or of `uses` when given.
+    Returns the number of hits, misses, hit rate and bytes read.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown policy {policy!r}, expected one of {POLICIES}")
+    if policy == 'belady' and uses is None:
+        uses = ImageUses(items, image_path, sequence)
+
+    cache = OrderedDict()
+    used_bytes = hits = misses = bytes_read = 0
+    for position, num in enumerate(sequence):
+        pinned = [image_path(name) for name in items[num].images]
+        for path in pinned:
+            if path in cache:
+                hits += 1
+                cache.move_to_end(path)
+                continue
+            misses += 1
+            cache[path] = sizes.get(path, 0)
+            used_bytes += cache[path]
+            bytes_read += cache[path]
+
+            candidates = [each for each in cache if each not in pinned]
+            if policy == 'belady':
+                candidates = uses.evictionOrder(candidates, position)
+            for each in candidates:
+                if used_bytes <= budget_bytes:
+                    break
+                used_bytes -= cache.pop(each)
+
+    accesses = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / accesses if accesses else 0.0, 'bytes_read': bytes_read}
+
+
+def compareBudgets(items, sequence:list, sizes:dict, budgets_bytes:list, policies=POLICIES,
+                   image_path=lambda name: name) -> list:
+    """Return one simulateCache result per budget and policy, each with its 'budget_bytes' and 'policy'."""
+    uses = ImageUses(items, image_path, sequence)
+    results = []
+    for budget_bytes in budgets_bytes:
+        for policy in policies:
+            result = simulateCache(items, sequence, sizes, budget_bytes, policy, image_path, uses)
+            result.update(budget_bytes=budget_bytes, policy=policy)
+            results.append(result)
+    return results
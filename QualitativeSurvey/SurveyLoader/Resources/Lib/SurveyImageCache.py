@@ -0,0 +1,315 @@
+import slicer, vtk
+from vtk.util import numpy_support
+import Resources.Lib.SurveyImageIO as SurveyImageIO
+import Resources.Lib.SurveyEviction as SurveyEviction
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_BUDGET_MB = 2048
+DEFAULT_PREFETCH_DEPTH = 1
+
+
+#
+# VolumeNodeCache
+#
+class VolumeNodeCache:
+    """
+    Keeps loaded volume nodes in the scene, keyed by image path, so that questions
+    sharing images do not read them from disk again. Once the memory used by the
+    cached nodes exceeds the budget, nodes are removed: those whose image is next shown
+    furthest after the current `position` first when the survey's SurveyEviction.ImageUses
+    are known, else the least recently used.
+    """
+    def __init__(self, budget_mb:int=DEFAULT_BUDGET_MB, uses:SurveyEviction.ImageUses=None) -> None:
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.used_bytes = 0
+        self.entries = OrderedDict()
+        self.uses = uses
+        self.position = 0
+
+    def __contains__(self, path:str) -> bool:
+        return path in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, path:str):
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+
+        node, size = entry
+        if not self._isValid(node):
+            # The node was removed from the scene behind our back (e.g. scene close)
+            self.entries.pop(path)
+            self.used_bytes -= size
+            return None
+
+        self.entries.move_to_end(path)
+        return node
+
+    def put(self, path:str, node, pinned:list=()) -> None:
+        """Add a node to the cache, then evict until within budget, never evicting `pinned` paths."""
+        if path in self.entries:
+            self.remove(path)
+
+        size = self.nodeSize(node)
+        self.entries[path] = (node, size)
+        self.used_bytes += size
+        self._evict(pinned)
+
+    def refresh(self, path:str, pinned:list=()) -> None:
+        """Count the new size of a cached node whose image data was replaced, then evict until within budget."""
+        node, size = self.entries[path]
+        self.entries[path] = (node, self.nodeSize(node))
+        self.used_bytes += self.entries[path][1] - size
+        self._evict(pinned)
+
+    def remove(self, path:str) -> None:
+        node, size = self.entries.pop(path)
+        self.used_bytes -= size
+        self._release(node)
+
+    def clear(self) -> None:
+        for path in list(self.entries):
+            self.remove(path)
+        self.used_bytes = 0
+
+    def _evict(self, pinned:list) -> None:
+        candidates = list(self.entries)
+        if self.uses is not None:
+            candidates = self.uses.evictionOrder(candidates, self.position)
+        for path in candidates:
+            if self.used_bytes <= self.budget_bytes:
+                break
+            if path not in pinned:
+                self.remove(path)
+
+    @staticmethod
+    def nodeSize(node) -> int:
+        image_data = node.GetImageData()
+        if image_data is None:
+            return 0
+        # vtkDataObject reports its size in kibibytes
+        return image_data.GetActualMemorySize() * 1024
+
+    @staticmethod
+    def _isValid(node) -> bool:
+        return node.GetScene() is not None
+
+    @staticmethod
+    def _release(node) -> None:
+        if slicer.mrmlScene and node.GetScene() is not None:
+            slicer.mrmlScene.RemoveNode(node)
+
+
+#
+# VolumeArrayCache
+#
+class VolumeArrayCache(VolumeNodeCache):
+    """
+    Like VolumeNodeCache, but keeps the decoded SurveyImageIO.VolumeArray of each image
+    rather than a volume node, for surveys that show every image in the same few nodes
+    (see swapVolume). Memory-mapped arrays count their full size against the budget.
+    """
+    @staticmethod
+    def nodeSize(volume:SurveyImageIO.VolumeArray) -> int:
+        return volume.nbytes
+
+    @staticmethod
+    def _isValid(volume:SurveyImageIO.VolumeArray) -> bool:
+        return True
+
+    @staticmethod
+    def _release(volume:SurveyImageIO.VolumeArray) -> None:
+        pass
+
+
+def imageDataFromArray(array):
+    """
+    Return a vtkImageData sharing the memory of a KJI voxel array, memory-mapped or not,
+    where slicer.util.addVolumeFromArray would copy it. The VTK array keeps a reference
+    to the NumPy array, so the memory stays valid for as long as the image data.
+    """
+    image_data = vtk.vtkImageData()
+    image_data.SetDimensions(array.shape[::-1])
+    image_data.GetPointData().SetScalars(numpy_support.numpy_to_vtk(array.reshape(-1), deep=False))
+    return image_data
+
+
+def nodeFromVolume(volume:SurveyImageIO.VolumeArray, name:str, window:tuple=None):
+    """
+    Create a scalar volume node from an array decoded by SurveyImageIO (main thread only).
+    With a (minimum, maximum) `window`, it is set before the voxels so Slicer does not
+    compute its automatic window over them.
+    """
+    node = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode', name)
+    node.SetIJKToRASMatrix(slicer.util.vtkMatrixFromArray(volume.ijk_to_ras))
+    if window is not None:
+        node.CreateDefaultDisplayNodes()
+        setWindow(node, window)
+    node.SetAndObserveImageData(imageDataFromArray(volume.array))
+    node.CreateDefaultDisplayNodes()
+    return node
+
+
+def setWindow(node, window:tuple) -> None:
+    """Display a volume node with a fixed (minimum, maximum) window instead of the automatic one."""
+    display = node.GetDisplayNode()
+    if display is not None:
+        display.AutoWindowLevelOff()
+        display.SetWindowLevelMinMax(*window)
+
+
+def volumeFromNode(node, path:str) -> SurveyImageIO.VolumeArray:
+    """Copy the voxels and geometry of a loaded volume node, so that the node can be removed."""
+    ijk_to_ras = vtk.vtkMatrix4x4()
+    node.GetIJKToRASMatrix(ijk_to_ras)
+    return SurveyImageIO.VolumeArray(path, slicer.util.arrayFromVolume(node).copy(), slicer.util.arrayFromVTKMatrix(ijk_to_ras))
+
+
+def swapVolume(node, volume:SurveyImageIO.VolumeArray, name:str, window:bool=True) -> None:
+    """
+    Show `volume` in an existing scalar volume node: replace its image data, which shares
+    the memory of the array, its geometry and, unless `window` is False, its window,
+    without creating any node.
+    """
+    node.SetName(name)
+    node.SetIJKToRASMatrix(slicer.util.vtkMatrixFromArray(volume.ijk_to_ras))
+    node.SetAndObserveImageData(imageDataFromArray(volume.array))
+    if window:
+        setWindow(node, volume.windowRange())
+
+
+#
+# ImagePrefetcher
+#
+class ImagePrefetcher:
+    """
+    Decodes the images of upcoming questions in a worker thread. Only the decoding into
+    NumPy arrays happens in the background; MRML nodes are created on the main thread
+    when a question needs them (see nodeFromVolume).
+    """
+    def __init__(self, depth:int=DEFAULT_PREFETCH_DEPTH, workers:int=1, memory_map:bool=True) -> None:
+        self.depth = depth
+        self.memory_map = memory_map
+        self.executor = ThreadPoolExecutor(max_workers=workers) if depth > 0 else None
+        self.pending = {}
+
+    def schedule(self, paths:list) -> None:
+        """Start reading `paths`, dropping any prefetch that is no longer wanted."""
+        if self.executor is None:
+            return
+
+        self.cancel(keep=paths)
+        for path in paths:
+            if path not in self.pending and SurveyImageIO.canRead(path):
+                self.pending[path] = self.executor.submit(SurveyImageIO.readImage, path, self.memory_map)
+
+    def take(self, path:str, wait:bool=True):
+        """
+        Return the prefetched VolumeArray for `path`, waiting if it is still being read, or None.
+        Without `wait`, None is returned while the read has not finished, and it stays pending.
+        """
+        future = self.pending.get(path)
+        if future is None or (not wait and not future.done()):
+            return None
+        del self.pending[path]
+        if future.cancelled():
+            return None
+        try:
+            return future.result()
+        except SurveyImageIO.UnsupportedImageError:
+            return None
+        except Exception as e:
+            print(f"Prefetch of {path} failed, loading it directly: {e}")
+            return None
+
+    def takeFuture(self, path:str):
+        """Return the pending read of `path` without waiting for it, and stop tracking it, or None."""
+        return self.pending.pop(path, None)
+
+    def cancel(self, keep:list=()) -> None:
+        """Cancel prefetches of every path not in `keep`. Reads already running finish and are discarded."""
+        for path in list(self.pending):
+            if path not in keep:
+                self.pending.pop(path).cancel()
+
+    def shutdown(self) -> None:
+        self.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+#
+# ImageRefiner
+#
+class ImageRefiner:
+    """
+    Reads finer versions of images shown from a SurveyPreview preview in a worker thread:
+    the remaining previews, then the image itself. The caller polls `ready` from the main
+    thread and swaps each version into the scene as it arrives.
+    """
+    def __init__(self, memory_map:bool=True) -> None:
+        self.memory_map = memory_map
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Image path to the futures of its versions still to show, coarsest first
+        self.pending = {}
+
+    def __contains__(self, path:str) -> bool:
+        return path in self.pending
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def start(self, path:str, previews:list=(), future=None) -> None:
+        """
+        Read the `previews` of the image at `path`, coarsest first, then the image itself.
+        `future` is a read of the image already under way, such as a prefetch, which is used
+        rather than reading the image again.
+        """
+        for each in self.pending.pop(path, []):
+            each.cancel()
+        self.pending[path] = [self.executor.submit(SurveyImageIO.readImage, each, self.memory_map) for each in previews]
+        if future is None or future.cancelled():
+            future = self.executor.submit(SurveyImageIO.readImage, path, self.memory_map)
+        self.pending[path].append(future)
+
+    def ready(self) -> list:
+        """
+        Return (path, VolumeArray, final) for each image with a finer version read since the
+        last call, only the finest when several are, `final` when it is the image itself.
+        Versions that could not be read are skipped; a failed final read gives a None volume.
+        """
+        results = []
+        for path, futures in list(self.pending.items()):
+            finished = [num for num, future in enumerate(futures) if future.done()]
+            if not finished:
+                continue
+            finest = finished[-1]
+            final = finest == len(futures) - 1
+            future = futures[finest]
+            if final:
+                del self.pending[path]
+            else:
+                self.pending[path] = futures[finest + 1:]
+            try:
+                results.append((path, future.result(), final))
+            except Exception as e:
+                print(f"Could not read {path} at full resolution: {e}" if final else f"Could not read a preview of {path}: {e}")
+                if final:
+                    results.append((path, None, True))
+        return results
+
+    def cancel(self, keep:list=()) -> list:
+        """Stop refining every image not in `keep`, returning their paths. Reads already running finish and are discarded."""
+        cancelled = [path for path in self.pending if path not in keep]
+        for path in cancelled:
+            for future in self.pending.pop(path):
+                future.cancel()
+        return cancelled
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,376 @@
+import gzip, os, zlib
+import numpy as np
+
+
+NRRD_TYPES = {
+    'signed char': 'i1', 'int8': 'i1', 'int8_t': 'i1',
+    'uchar': 'u1', 'unsigned char': 'u1', 'uint8': 'u1', 'uint8_t': 'u1',
+    'short': 'i2', 'short int': 'i2', 'signed short': 'i2', 'signed short int': 'i2', 'int16': 'i2', 'int16_t': 'i2',
+    'ushort': 'u2', 'unsigned short': 'u2', 'unsigned short int': 'u2', 'uint16': 'u2', 'uint16_t': 'u2',
+    'int': 'i4', 'signed int': 'i4', 'int32': 'i4', 'int32_t': 'i4',
+    'uint': 'u4', 'unsigned int': 'u4', 'uint32': 'u4', 'uint32_t': 'u4',
+    'longlong': 'i8', 'long long': 'i8', 'long long int': 'i8', 'signed long long': 'i8',
+    'signed long long int': 'i8', 'int64': 'i8', 'int64_t': 'i8',
+    'ulonglong': 'u8', 'unsigned long long': 'u8', 'unsigned long long int': 'u8', 'uint64': 'u8', 'uint64_t': 'u8',
+    'float': 'f4', 'double': 'f8',
+}
+
+METAIMAGE_TYPES = {
+    'MET_CHAR': 'i1', 'MET_UCHAR': 'u1', 'MET_SHORT': 'i2', 'MET_USHORT': 'u2',
+    'MET_INT': 'i4', 'MET_UINT': 'u4', 'MET_LONG': 'i4', 'MET_ULONG': 'u4',
+    'MET_LONG_LONG': 'i8', 'MET_ULONG_LONG': 'u8', 'MET_FLOAT': 'f4', 'MET_DOUBLE': 'f8',
+}
+
+LPS_SPACES = ('left-posterior-superior', 'LPS')
+RAS_SPACES = ('right-anterior-superior', 'RAS')
+
+NRRD_SUFFIXES = ('.nrrd',)
+METAIMAGE_SUFFIXES = ('.mha', '.mhd')
+# Compressed data is inflated in chunks of this size straight into the voxel array
+INFLATE_CHUNK = 1 << 20
+
+
+class UnsupportedImageError(Exception):
+    """Raised for images the Qt-free readers cannot decode; callers fall back to Slicer's readers."""
+    pass
+
+
+# Problems with a header or data file that Slicer's readers may still handle, raised as UnsupportedImageError
+READ_ERRORS = (KeyError, ValueError, IndexError, OSError, EOFError, zlib.error)
+
+
+#
+# VolumeArray
+#
+class VolumeArray:
+    """A decoded scalar volume: voxels in KJI order (as slicer.util.arrayFromVolume) and its IJK to RAS matrix."""
+    def __init__(self, path:str, array:np.ndarray, ijk_to_ras:np.ndarray) -> None:
+        self.path = path
+        self.array = array
+        self.ijk_to_ras = ijk_to_ras
+        self.window_range = None
+
+    @property
+    def nbytes(self) -> int:
+        return self.array.nbytes
+
+    def windowRange(self) -> tuple:
+        """The (minimum, maximum) display window of the volume, computed once, see windowRange."""
+        if self.window_range is None:
+            self.window_range = windowRange(self.array)
+        return self.window_range
+
+
+# Display windows span these fractions of the voxel values, leaving out outliers
+WINDOW_FRACTIONS = (0.001, 0.999)
+WINDOW_SAMPLE_SLICES = 16
+
+
+def windowRange(array:np.ndarray, fractions:tuple=WINDOW_FRACTIONS) -> tuple:
+    """
+    Return the (minimum, maximum) display window of a KJI voxel array, between the
+    `fractions` quantiles of its values. Quantiles are estimated from evenly spaced whole
+    slices, so that only those pages of a memory-mapped volume are read.
+    """
+    slices = np.unique(np.linspace(0, array.shape[0] - 1, min(array.shape[0], WINDOW_SAMPLE_SLICES)).astype(int))
+    low, high = np.quantile(array[slices], fractions)
+    return float(low), float(high)
+
+
+HISTOGRAM_BINS = 64
+# Quantiles are read from a histogram this fine, exact for integer images with fewer values
+STATISTICS_BINS = 4096
+STATISTICS_CHUNK_VOXELS = 1 << 24
+
+
+def _slabs(array:np.ndarray):
+    # Whole KJI slices, so that reading a chunk of a memory-mapped file is sequential
+    step = max(1, STATISTICS_CHUNK_VOXELS // max(1, int(np.prod(array.shape[1:]))))
+    for start in range(0, array.shape[0], step):
+        slab = array[start:start + step]
+        yield slab[np.isfinite(slab)] if np.issubdtype(array.dtype, np.floating) else slab
+
+
+def imageStatistics(array:np.ndarray, fractions:tuple=WINDOW_FRACTIONS, bins:int=HISTOGRAM_BINS) -> dict:
+    """
+    Compute the display statistics of a KJI voxel array over every voxel, in two chunked
+    passes: the scalar 'range', the 'window' between the `fractions` quantiles, and a
+    'histogram' of `bins` counts over the range. Values are builtin types so they can be
+    stored in the compiled survey.
+    """
+    minimum, maximum = np.inf, -np.inf
+    for slab in _slabs(array):
+        if slab.size:
+            minimum, maximum = min(minimum, slab.min()), max(maximum, slab.max())
+    if minimum > maximum:
+        return {'range': (0.0, 0.0), 'window': (0.0, 0.0), 'histogram': [0] * bins}
+
+    if np.issubdtype(array.dtype, np.integer) and maximum - minimum < STATISTICS_BINS:
+        edges = np.arange(int(minimum), int(maximum) + 2) - 0.5
+    else:
+        edges = np.linspace(float(minimum), float(maximum), STATISTICS_BINS + 1)
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    for slab in _slabs(array):
+        counts += np.histogram(slab, edges)[0]
+
+    cumulative = np.cumsum(counts)
+    window = []
+    for fraction in fractions:
+        rank = fraction * cumulative[-1]
+        index = min(int(np.searchsorted(cumulative, rank)), len(counts) - 1)
+        before = cumulative[index - 1] if index else 0
+        # Interpolate within the bin, clipped to the values actually present
+        value = edges[index] + (rank - before) / max(counts[index], 1) * (edges[index + 1] - edges[index])
+        window.append(float(np.clip(value, minimum, maximum)))
+
+    centres = (edges[:-1] + edges[1:]) / 2
+    histogram = np.histogram(centres, bins, range=(float(minimum), float(maximum)), weights=counts)[0]
+    return {'range': (float(minimum), float(maximum)), 'window': tuple(window),
+            'histogram': [int(each) for each in histogram]}
+
+
+def canRead(path:str) -> bool:
+    return str(path).lower().endswith(NRRD_SUFFIXES + METAIMAGE_SUFFIXES)
+
+
+def readImage(path:str, memory_map:bool=True) -> VolumeArray:
+    """
+    Decode a NRRD or MetaImage volume. With `memory_map`, raw voxel data in native byte
+    order is memory-mapped copy-on-write rather than read: only the pages of the slices
+    viewed are read from disk, and the file is never modified.
+    """
+    lower = str(path).lower()
+    try:
+        if lower.endswith(NRRD_SUFFIXES):
+            return readNrrd(path, memory_map)
+        if lower.endswith(METAIMAGE_SUFFIXES):
+            return readMetaImage(path, memory_map)
+    except READ_ERRORS as e:
+        raise UnsupportedImageError(f"Cannot read {path}: {type(e).__name__} {e}") from e
+    raise UnsupportedImageError(f"No reader for {path}")
+
+
+def readImageHeader(path:str) -> dict:
+    """Return the header fields of a NRRD or MetaImage file, keys in lower case."""
+    try:
+        if str(path).lower().endswith(METAIMAGE_SUFFIXES):
+            return readMetaImageHeader(path)[0]
+        return readNrrdHeader(path)[0]
+    except READ_ERRORS as e:
+        raise UnsupportedImageError(f"Cannot read the header of {path}: {type(e).__name__} {e}") from e
+
+
+def readVoxels(data_path:str, offset:int, dtype:np.dtype, sizes:list, encoding:str='raw', memory_map:bool=True) -> np.ndarray:
+    """
+    Return the voxels of a volume of `sizes` (fastest axis first) in KJI order, from
+    `offset` bytes into `data_path`. Encoding is 'raw', 'gzip' or 'zlib'. Decoded data is
+    written straight into the returned array, which is always writable so that VTK can
+    share its memory.
+    """
+    count = int(np.prod(sizes))
+    if encoding == 'raw' and memory_map and dtype.isnative:
+        try:
+            array = np.memmap(data_path, dtype=dtype, mode='c', offset=offset, shape=(count,))
+        except ValueError as e:
+            raise UnsupportedImageError(f"{data_path} is shorter than its header says: {e}")
+        return array.reshape(sizes[::-1])
+
+    array = np.empty(count, dtype=dtype)
+    buffer = memoryview(array).cast('B')
+    with open(data_path, 'rb') as file:
+        file.seek(offset)
+        if encoding == 'raw':
+            read = file.readinto(buffer)
+        elif encoding == 'gzip':
+            read = gzip.GzipFile(fileobj=file).readinto(buffer)
+        elif encoding == 'zlib':
+            inflater = zlib.decompressobj()
+            read = 0
+            while read < len(buffer):
+                compressed = inflater.unconsumed_tail or file.read(INFLATE_CHUNK)
+                if not compressed:
+                    break
+                chunk = inflater.decompress(compressed, len(buffer) - read)
+                buffer[read:read + len(chunk)] = chunk
+                read += len(chunk)
+        else:
+            raise UnsupportedImageError(f"Unsupported encoding {encoding}")
+    if read < len(buffer):
+        raise UnsupportedImageError(f"{data_path} is shorter than its header says")
+
+    if not dtype.isnative:
+        array = array.byteswap().view(dtype.newbyteorder('='))
+    return array.reshape(sizes[::-1])
+
+
+def readNrrdHeader(path:str) -> tuple:
+    """Return the NRRD header fields and the byte offset of the attached data."""
+    fields = {}
+    with open(path, 'rb') as file:
+        magic = file.readline()
+        if not magic.startswith(b'NRRD'):
+            raise UnsupportedImageError(f"{path} is not a NRRD file")
+
+        for line in file:
+            line = line.decode('latin-1').rstrip('\r\n')
+            if line == '':
+                break
+            if line.startswith('#') or ':=' in line:
+                continue
+            key, _, value = line.partition(':')
+            fields[key.strip().lower()] = value.strip()
+        offset = file.tell()
+    return fields, offset
+
+
+def _parseVector(text:str) -> list:
+    return [float(each) for each in text.strip().strip('()').split(',')]
+
+
+def nrrdIJKToRAS(fields:dict) -> np.ndarray:
+    dimension = int(fields['dimension'])
+    matrix = np.eye(4)
+    if 'space directions' in fields:
+        directions = [each for each in fields['space directions'].split() if each != 'none']
+        if len(directions) != 3:
+            raise UnsupportedImageError("Only 3D space directions are supported")
+        for axis, direction in enumerate(directions):
+            matrix[:3, axis] = _parseVector(direction)
+    elif 'spacings' in fields:
+        for axis, spacing in enumerate(fields['spacings'].split()[:dimension]):
+            matrix[axis, axis] = float(spacing)
+
+    if 'space origin' in fields:
+        matrix[:3, 3] = _parseVector(fields['space origin'])
+
+    # Without a space, the orientation is left to Slicer's reader rather than assumed
+    space = fields.get('space')
+    if space is None:
+        raise UnsupportedImageError("NRRD without a space field is not supported")
+    if space in LPS_SPACES:
+        matrix[:2, :] *= -1
+    elif space not in RAS_SPACES:
+        raise UnsupportedImageError(f"Unsupported NRRD space {space}")
+    return matrix
+
+
+def readNrrd(path:str, memory_map:bool=True) -> VolumeArray:
+    fields, offset = readNrrdHeader(path)
+
+    kinds = fields.get('kinds', 'domain domain domain').split()
+    if int(fields['dimension']) != 3 or any(kind not in ('domain', 'space') for kind in kinds):
+        raise UnsupportedImageError(f"{path} is not a scalar 3D volume")
+    if fields['type'] not in NRRD_TYPES:
+        raise UnsupportedImageError(f"Unsupported NRRD type {fields['type']}")
+    if int(fields.get('byte skip', 0)) != 0 or int(fields.get('line skip', 0)) != 0:
+        raise UnsupportedImageError("NRRD byte or line skip is not supported")
+
+    data_path = path
+    if 'data file' in fields or 'datafile' in fields:
+        data_file = fields.get('data file', fields.get('datafile'))
+        # LIST, or a format with a range of numbers, names several files
+        if len(data_file.split()) > 1 or data_file.upper() == 'LIST':
+            raise UnsupportedImageError("NRRD data split across files is not supported")
+        data_path = os.path.join(os.path.dirname(path), data_file)
+        offset = 0
+
+    dtype = np.dtype(NRRD_TYPES[fields['type']])
+    if dtype.itemsize > 1:
+        dtype = dtype.newbyteorder('>' if fields.get('endian', 'little') == 'big' else '<')
+
+    encoding = fields.get('encoding', 'raw')
+    if encoding == 'gz':
+        encoding = 'gzip'
+    if encoding not in ('raw', 'gzip'):
+        raise UnsupportedImageError(f"Unsupported NRRD encoding {encoding}")
+
+    sizes = [int(each) for each in fields['sizes'].split()]
+    array = readVoxels(data_path, offset, dtype, sizes, encoding, memory_map)
+    return VolumeArray(path, array, nrrdIJKToRAS(fields))
+
+
+# Native NRRD type of each NumPy dtype written by writeNrrd
+NRRD_TYPE_NAMES = {'i1': 'int8', 'u1': 'uint8', 'i2': 'int16', 'u2': 'uint16', 'i4': 'int32', 'u4': 'uint32',
+                   'i8': 'int64', 'u8': 'uint64', 'f4': 'float', 'f8': 'double'}
+
+
+def writeNrrd(path:str, volume:VolumeArray) -> None:
+    """Write a volume as a raw little endian NRRD file in RAS space, so that readNrrd can map it."""
+    array = np.ascontiguousarray(volume.array)
+    dtype = array.dtype.newbyteorder('<') if array.dtype.itemsize > 1 else array.dtype
+    type_name = NRRD_TYPE_NAMES.get(dtype.str[1:])
+    if type_name is None:
+        raise UnsupportedImageError(f"Unsupported voxel type {array.dtype}")
+
+    directions = ' '.join('(' + ','.join(repr(float(each)) for each in volume.ijk_to_ras[:3, axis]) + ')' for axis in range(3))
+    origin = '(' + ','.join(repr(float(each)) for each in volume.ijk_to_ras[:3, 3]) + ')'
+    header = (f"NRRD0004\ntype: {type_name}\ndimension: 3\nspace: right-anterior-superior\n"
+              f"sizes: {array.shape[2]} {array.shape[1]} {array.shape[0]}\nspace directions: {directions}\n"
+              f"kinds: domain domain domain\nendian: little\nencoding: raw\nspace origin: {origin}\n\n")
+    with open(path, 'wb') as file:
+        file.write(header.encode('latin-1'))
+        file.write(array.astype(dtype, copy=False).tobytes())
+
+
+def readMetaImageHeader(path:str) -> tuple:
+    """Return the MetaImage header fields, keys in lower case, and the byte offset of local data."""
+    fields = {}
+    with open(path, 'rb') as file:
+        for line in file:
+            key, separator, value = line.decode('latin-1').partition('=')
+            if not separator:
+                raise UnsupportedImageError(f"{path} is not a MetaImage file")
+            fields[key.strip().lower()] = value.strip()
+            # ElementDataFile is always the last field, local data follows it
+            if key.strip().lower() == 'elementdatafile':
+                break
+        offset = file.tell()
+    if 'elementdatafile' not in fields:
+        raise UnsupportedImageError(f"{path} is not a MetaImage file")
+    return fields, offset
+
+
+def metaImageIJKToRAS(fields:dict) -> np.ndarray:
+    """MetaImage positions are in LPS, with one direction per axis in the rows of TransformMatrix."""
+    matrix = np.eye(4)
+    spacing = [float(each) for each in fields.get('elementspacing', fields.get('elementsize', '1 1 1')).split()]
+    directions = fields.get('transformmatrix', fields.get('rotation', fields.get('orientation')))
+    directions = np.array([float(each) for each in directions.split()]).reshape(3, 3) if directions else np.eye(3)
+    matrix[:3, :3] = directions.T * spacing
+    origin = fields.get('offset', fields.get('position', fields.get('origin')))
+    if origin:
+        matrix[:3, 3] = [float(each) for each in origin.split()]
+    matrix[:2, :] *= -1
+    return matrix
+
+
+def readMetaImage(path:str, memory_map:bool=True) -> VolumeArray:
+    fields, offset = readMetaImageHeader(path)
+
+    if int(fields.get('ndims', 0)) != 3 or int(fields.get('elementnumberofchannels', 1)) != 1:
+        raise UnsupportedImageError(f"{path} is not a scalar 3D volume")
+    if fields.get('elementtype') not in METAIMAGE_TYPES:
+        raise UnsupportedImageError(f"Unsupported MetaImage type {fields.get('elementtype')}")
+
+    data_file = fields['elementdatafile']
+    if data_file.upper() == 'LOCAL':
+        data_path = path
+    elif ' ' in data_file or data_file.upper() == 'LIST':
+        raise UnsupportedImageError("MetaImage data split across files is not supported")
+    else:
+        data_path = os.path.join(os.path.dirname(path), data_file)
+        offset = 0
+    header_size = int(fields.get('headersize', 0))
+    if header_size < 0:
+        raise UnsupportedImageError("MetaImage HeaderSize -1 is not supported")
+    offset += header_size
+
+    dtype = np.dtype(METAIMAGE_TYPES[fields['elementtype']])
+    big_endian = fields.get('binarydatabyteordermsb', fields.get('elementbyteordermsb', 'False')).lower() == 'true'
+    if dtype.itemsize > 1:
+        dtype = dtype.newbyteorder('>' if big_endian else '<')
+    encoding = 'zlib' if fields.get('compresseddata', 'False').lower() == 'true' else 'raw'
+
+    sizes = [int(each) for each in fields['dimsize'].split()]
+    array = readVoxels(data_path, offset, dtype, sizes, encoding, memory_map)
+    return VolumeArray(path, array, metaImageIJKToRAS(fields))
@@ -0,0 +1,198 @@
+import csv, hashlib, json, os
+from Resources.Lib.SurveyAnswers import AnswerModel
+from Resources.Lib.SurveyResultsWriter import LegacyCSVWriter
+
+
+JOURNAL_VERSION = 2
+JOURNAL_SUFFIX = '.journal'
+AUTOSAVE_SUFFIX = '.autosave.csv'
+DEFAULT_COMPACT_EVERY = 200
+
+
+def journalPath(csv_path:str) -> str:
+    return str(csv_path) + JOURNAL_SUFFIX
+
+
+def autosavePath(csv_path:str) -> str:
+    return str(csv_path) + AUTOSAVE_SUFFIX
+
+
+def surveySignature(items) -> str:
+    """Hash of the text, type, images and choices of every question, which journaled values depend on."""
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(json.dumps([item.text, item.type, item.images, item.choices], default=str).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+#
+# AnswerJournal
+#
+class AnswerJournal:
+    """
+    Crash-safe autosave of an AnswerModel, kept next to the questions CSV.
+
+    Every answer change is appended to `<questions>.csv.journal` as one JSON line
+    [question index, value] (see AnswerModel.getValue) and flushed, so a change costs
+    the same whatever the survey size. Every `compact_every` changes, or every change per
+    question for larger surveys, and on close, all answers are written to
+    `<questions>.csv.autosave.csv` in the results format and the journal starts again
+    empty. Compaction reads the questions in one pass and, being spread over at least as
+    many changes as there are questions, costs at most one question per change. `restore` reads the autosave and replays the journal on
+    top of it; replaying is idempotent, so a crash during compaction loses nothing.
+    Both files are deleted by `discard` once the answers are saved.
+
+    The journal header holds a surveySignature of the questions, so that answers are
+    never replayed into a questionnaire that was edited since they were journaled.
+    """
+    def __init__(self, csv_path:str, answers:AnswerModel, compact_every:int=DEFAULT_COMPACT_EVERY) -> None:
+        self.csv_path = csv_path
+        self.answers = answers
+        self.compact_every = compact_every
+        self.compact_after = max(compact_every, len(answers))
+        self.path = journalPath(csv_path)
+        self.autosave_path = autosavePath(csv_path)
+        self.file = None
+        self.records = 0
+        self.signature = None
+
+    def _header(self) -> str:
+        if self.signature is None:
+            # Iterating reads an IndexedSurvey sequentially without filling its cache
+            self.signature = surveySignature(iter(self.answers.items))
+        return json.dumps({'version': JOURNAL_VERSION, 'questions': len(self.answers), 'survey': self.signature}) + '\n'
+
+    def _readJournal(self):
+        """Return the records of the journal, or None if it belongs to another version of the questionnaire."""
+        with open(self.path) as file:
+            lines = file.readlines()
+        if lines and lines[0] != self._header():
+            return None
+        return lines[1:]
+
+    def restore(self) -> int:
+        """Restore the autosaved answers into the model. Returns the number of answers restored."""
+        restored = set()
+        lines = self._readJournal() if os.path.exists(self.path) else None
+        if lines is None:
+            # Compaction always leaves a journal, an autosave without one cannot be trusted either
+            if os.path.exists(self.path) or os.path.exists(self.autosave_path):
+                print(f"Ignoring the autosaved answers of {self.csv_path}, they do not match the questionnaire")
+            return 0
+
+        if os.path.exists(self.autosave_path):
+            with open(self.autosave_path, newline='') as csv_file:
+                rows = list(csv.reader(csv_file))
+            if len(rows) == len(self.answers):
+                for (index, item), row in zip(self.answers.iterItems(range(len(rows))), rows):
+                    if self.answers.fromCSV(index, row, item) and self.answers.isAnswered(index):
+                        restored.add(index)
+            else:
+                print(f"Ignoring {self.autosave_path}, it does not match the questionnaire")
+
+        records = []
+        for line in lines:
+            try:
+                index, value = json.loads(line)
+            except (ValueError, TypeError):
+                # The last record may have been cut short by a crash
+                break
+            records.append((index, value, line))
+
+        # The questions of the records are read in one pass to check the values fit them
+        indices = sorted({index for index, value, line in records if isinstance(index, int) and 0 <= index < len(self.answers)})
+        items = dict(self.answers.iterItems(indices))
+        for index, value, line in records:
+            if not isinstance(index, int) or index not in items or not self.answers.isValidValue(index, value, items[index]):
+                print(f"Ignoring journaled answer {line.strip()}, it does not fit the question")
+                continue
+            self.answers.setValue(index, value)
+            restored.add(index)
+        return sum(self.answers.isAnswered(index) for index in restored)
+
+    def open(self) -> bool:
+        """Start journaling answer changes. Returns False if the journal cannot be written."""
+        try:
+            if os.path.exists(self.path) and self._readJournal() is None:
+                # Keep the journal of the previous questionnaire aside rather than mixing records
+                os.replace(self.path, self.path + '.old')
+            exists = os.path.exists(self.path)
+            self.file = open(self.path, 'a')
+            if not exists or os.path.getsize(self.path) == 0:
+                self.file.write(self._header())
+                self.file.flush()
+        except OSError as e:
+            print(f"Could not open answer journal {self.path}, answers will not be autosaved: {e}")
+            self.file = None
+            return False
+        self.answers.addObserver(self.record)
+        return True
+
+    def record(self, index) -> None:
+        if self.file is None:
+            return
+        if index is None:
+            # Many answers changed at once, writing them all is cheaper than one record each
+            self.compact()
+            return
+        try:
+            self.file.write(json.dumps([index, self.answers.getValue(index)]) + '\n')
+            self.file.flush()
+        except OSError as e:
+            print(f"Could not write answer journal {self.path}: {e}")
+            return
+
+        self.records += 1
+        if self.records >= self.compact_after:
+            self.compact()
+
+    def compact(self) -> bool:
+        """Write every answer to the autosave file and empty the journal."""
+        if self.file is None:
+            return False
+        try:
+            LegacyCSVWriter(self.autosave_path).write(self.answers)
+
+            self.file.close()
+            self.file = open(self.path, 'w')
+            self.file.write(self._header())
+            self.file.flush()
+        except OSError as e:
+            print(f"Could not compact answer journal {self.path}: {e}")
+            if self.file.closed:
+                self.file = None
+            return False
+        self.records = 0
+        return True
+
+    def discard(self) -> None:
+        """
+        Delete the journaled and autosaved answers, e.g. once they are saved to a results file
+        so that the next reader of the questionnaire does not get them. Journaling goes on.
+        """
+        for path in (self.autosave_path, self.path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"Could not delete autosaved answers {path}: {e}")
+        self.records = 0
+        if self.file is None:
+            return
+        try:
+            self.file.close()
+            self.file = open(self.path, 'w')
+            self.file.write(self._header())
+            self.file.flush()
+        except OSError as e:
+            print(f"Could not restart answer journal {self.path}, answers will not be autosaved: {e}")
+            self.file = None
+
+    def close(self) -> None:
+        if self.file is None:
+            return
+        if self.records:
+            self.compact()
+        self.file.close()
+        self.file = None
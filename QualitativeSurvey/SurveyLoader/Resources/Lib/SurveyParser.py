@@ -0,0 +1,254 @@
+import csv, os, re
+from array import array
+from collections import OrderedDict
+
+
+QUESTION_TYPES = ('open', 'multi_single', 'multi_multi', 'dropdown', 'slider', 'rating')
+COLUMNS = ['question', 'type', 'images', 'choices']
+DEFAULT_ITEM_CACHE = 64
+# Questions CSVs are read with this encoding whatever the locale, eagerly or as an IndexedSurvey,
+# so that question texts, which results are matched by, are the same either way. A byte order
+# mark, as spreadsheet programs write, is ignored.
+SURVEY_ENCODING = 'utf-8-sig'
+
+# One element of a list literal: a quoted string or an int, followed by a comma or the end
+_LIST_ELEMENT = re.compile(r"""\s*(?:'((?:[^'\\]|\\.)*)'|"((?:[^"\\]|\\.)*)"|([-+]?\d+))\s*(?:,|$)""")
+_ESCAPE = re.compile(r"\\(.)")
+
+
+class SurveyItem:
+    def __init__(self, text:str, type:str, images:list, choices:list):
+        self.text = text
+        self.type = type
+        self.images = images
+        self.choices = choices
+
+
+class SurveyParseError(Exception):
+    """Raised with every invalid row of a questions CSV, as (row number, message) pairs in `errors`."""
+    def __init__(self, csv_path:str, errors:list):
+        self.csv_path = csv_path
+        self.errors = errors
+        super().__init__("\n".join(f"Row {row}: {message}" for row, message in errors))
+
+
+def parseList(text:str) -> list:
+    """
+    Parse an `images` or `choices` cell such as "['a.nrrd', 'b.nrrd']" or "[1, 10, 1]".
+    Only lists of quoted strings and ints are accepted, unlike ast.literal_eval.
+    """
+    text = text.strip()
+    if len(text) < 2 or text[0] != '[' or text[-1] != ']':
+        raise ValueError(f"expected a list in square brackets, got {text!r}")
+
+    body = text[1:-1].strip()
+    values = []
+    position = 0
+    while position < len(body):
+        match = _LIST_ELEMENT.match(body, position)
+        if match is None:
+            raise ValueError(f"invalid list element {body[position:]!r}")
+
+        single, double, number = match.groups()
+        if number is not None:
+            values.append(int(number))
+        else:
+            value = single if single is not None else double
+            values.append(_ESCAPE.sub(r"\1", value) if '\\' in value else value)
+        position = match.end()
+    return values
+
+
+def validateItem(type:str, images:list, choices:list) -> list:
+    """Return the problems of a question's images and choices for its type, empty if valid."""
+    if type not in QUESTION_TYPES:
+        return [f"unknown question type {type!r}, expected one of {', '.join(QUESTION_TYPES)}"]
+
+    errors = []
+    if not all(isinstance(image, str) for image in images):
+        errors.append("images must be file names in quotes")
+
+    if type == 'open':
+        if choices:
+            errors.append("open questions take no choices, use []")
+    elif type in ('multi_single', 'multi_multi', 'dropdown'):
+        if not choices:
+            errors.append(f"{type} questions need at least one choice")
+        elif not all(isinstance(choice, str) for choice in choices):
+            errors.append("choices must be text in quotes")
+        elif len(set(choices)) != len(choices):
+            errors.append("choices must be unique")
+    else:
+        # Slider questions ignore anything after [minimum, maximum]
+        count = 2 if type == 'slider' else 3
+        names = "[minimum, maximum]" if type == 'slider' else "[minimum, maximum, step]"
+        if len(choices) < count or not all(isinstance(each, int) for each in choices[:count]):
+            errors.append(f"{type} questions need {names} as numbers")
+        elif choices[0] >= choices[1]:
+            errors.append("the minimum must be smaller than the maximum")
+        elif type == 'rating' and choices[2] <= 0:
+            errors.append("the step must be positive")
+    return errors
+
+
+def parseRow(row:list) -> tuple:
+    """Parse one CSV row into a SurveyItem. Returns (item, errors); item is None if the row is invalid."""
+    if len(row) != len(COLUMNS):
+        return None, [f"expected {len(COLUMNS)} columns ({', '.join(COLUMNS)}), found {len(row)}"]
+
+    text, type, images, choices = row
+    errors = []
+    try:
+        images = parseList(images)
+    except ValueError as e:
+        errors.append(f"images: {e}")
+    try:
+        choices = parseList(choices)
+    except ValueError as e:
+        errors.append(f"choices: {e}")
+    if errors:
+        return None, errors
+
+    errors = validateItem(type, images, choices)
+    return (None if errors else SurveyItem(text, type, images, choices)), errors
+
+
+def parseSurveyCSV(csv_path:str) -> tuple:
+    """
+    Parse a questions CSV in one pass. Returns the valid items and the (row number, message)
+    errors of every invalid row; the header is row 1.
+    """
+    items = []
+    errors = []
+    with open(csv_path, newline='', encoding=SURVEY_ENCODING) as csvFile:
+        reader = csv.reader(csvFile)
+        if next(reader, None) is None:
+            return items, [(1, "the file is empty")]
+
+        for row in reader:
+            if not row:
+                continue
+            item, row_errors = parseRow(row)
+            errors.extend((reader.line_num, message) for message in row_errors)
+            if item is not None:
+                items.append(item)
+    return items, errors
+
+
+def readSurveyItems(csv_path:str) -> list:
+    """Return the items of a questions CSV, raising SurveyParseError if any row is invalid."""
+    items, errors = parseSurveyCSV(csv_path)
+    if errors:
+        raise SurveyParseError(csv_path, errors)
+    return items
+
+
+#
+# IndexedSurvey
+#
+class IndexedSurvey:
+    """
+    Read-only sequence of the SurveyItems of a questions CSV that is too large to keep in
+    memory. One streaming pass validates every row and records the byte offset where each
+    question starts, its type and, for multi_multi questions, its number of choices. Items
+    are parsed again from their offset when requested, and the last `cache_size` of them
+    are kept.
+    """
+    def __init__(self, csv_path:str, cache_size:int=DEFAULT_ITEM_CACHE) -> None:
+        self.csv_path = csv_path
+        self.cache_size = max(cache_size, 1)
+        self.offsets = array('q')
+        self.types = []
+        self.multi_width = 0
+        self.errors = []
+        self._items = OrderedDict()
+        self._buildIndex()
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __getitem__(self, index:int) -> SurveyItem:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Question {index + 1} does not exist")
+
+        item = self._items.get(index)
+        if item is None:
+            item = self._readItem(index)
+            self._items[index] = item
+            if len(self._items) > self.cache_size:
+                self._items.popitem(last=False)
+        else:
+            self._items.move_to_end(index)
+        return item
+
+    def __iter__(self):
+        # Sequential reads for whole-survey passes such as saving, without filling the cache
+        for offset, record, line in self._records(skip_header=True):
+            item = parseRow(next(csv.reader([record])))[0]
+            if item is not None:
+                yield item
+
+    def _records(self, skip_header:bool=False):
+        """Yield (byte offset, text, line number) of every non-empty CSV record."""
+        with open(self.csv_path, 'rb') as file:
+            offset = 0
+            line_number = 0
+            start = None
+            start_line = 0
+            lines = []
+            quotes = 0
+            for line in file:
+                line_number += 1
+                if start is None:
+                    if not line.strip():
+                        offset += len(line)
+                        continue
+                    start = offset
+                    start_line = line_number
+                lines.append(line)
+                quotes += line.count(b'"')
+                offset += len(line)
+                # A record only ends on a line break outside quotes
+                if quotes % 2 == 0:
+                    if not skip_header:
+                        yield start, b''.join(lines).decode(SURVEY_ENCODING), start_line
+                    skip_header = False
+                    start = None
+                    lines = []
+                    quotes = 0
+            if lines and not skip_header:
+                yield start, b''.join(lines).decode(SURVEY_ENCODING), start_line
+
+    def _buildIndex(self) -> None:
+        if os.path.getsize(self.csv_path) == 0:
+            self.errors.append((1, "the file is empty"))
+            return
+
+        for offset, record, line in self._records(skip_header=True):
+            item, errors = parseRow(next(csv.reader([record])))
+            self.errors.extend((line, message) for message in errors)
+            if item is None:
+                continue
+            self.offsets.append(offset)
+            self.types.append(item.type)
+            if item.type == 'multi_multi':
+                self.multi_width = max(self.multi_width, len(item.choices))
+
+    def _readItem(self, index:int) -> SurveyItem:
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else None
+        with open(self.csv_path, 'rb') as file:
+            file.seek(self.offsets[index])
+            data = file.read(end - self.offsets[index]) if end is not None else file.read()
+        row = next(csv.reader([data.decode(SURVEY_ENCODING)]))
+        return parseRow(row)[0]
+
+
+def surveyShape(items) -> tuple:
+    """Return the question types and the largest number of multi_multi choices of a list of items or an IndexedSurvey."""
+    if isinstance(items, IndexedSurvey):
+        return items.types, items.multi_width
+    types = [item.type for item in items]
+    multi_width = max([len(item.choices) for item in items if item.type == 'multi_multi'], default=0)
+    return types, multi_width
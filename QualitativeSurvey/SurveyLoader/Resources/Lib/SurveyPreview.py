@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import Resources.Lib.SurveyImageIO as SurveyImageIO
+
+
+# Previews are this many times smaller along each axis
+PREVIEW_FACTORS = (4, 2)
+PREVIEW_DIRECTORY = '.surveypreviews'
+# Source slices averaged at once, bounding the memory used to build a preview
+PREVIEW_CHUNK_SLICES = 64
+
+
+def previewPath(image_path:str, factor:int) -> str:
+    """Return where the preview of an image downsampled by `factor` is stored, in a directory next to the image."""
+    directory, name = os.path.split(image_path)
+    return os.path.join(directory, PREVIEW_DIRECTORY, f"{name}.x{factor}.nrrd")
+
+
+def availablePreviews(image_path:str, factors=PREVIEW_FACTORS) -> list:
+    """Return the paths of the previews of an image that are newer than it, coarsest first."""
+    try:
+        modified = os.stat(image_path).st_mtime_ns
+    except OSError:
+        return []
+    paths = []
+    for factor in sorted(factors, reverse=True):
+        path = previewPath(image_path, factor)
+        try:
+            if os.stat(path).st_mtime_ns >= modified:
+                paths.append(path)
+        except OSError:
+            pass
+    return paths
+
+
+def _blockMean(array:np.ndarray, factor:int, axis:int) -> np.ndarray:
+    # The last block of an axis that is not a multiple of `factor` is averaged over fewer voxels
+    starts = np.arange(0, array.shape[axis], factor)
+    counts = np.diff(np.append(starts, array.shape[axis]))
+    shape = [1] * array.ndim
+    shape[axis] = len(counts)
+    return np.add.reduceat(array, starts, axis=axis) / counts.reshape(shape)
+
+
+def downsample(volume:SurveyImageIO.VolumeArray, factor:int) -> SurveyImageIO.VolumeArray:
+    """
+    Average blocks of `factor` voxels along each axis, reading the source a few slices at a
+    time, and scale the geometry so that the preview covers the same physical extent.
+    """
+    array = volume.array
+    if array.size == 0:
+        raise SurveyImageIO.UnsupportedImageError(f"{volume.path} has no voxels")
+    dtype = np.result_type(array.dtype, np.float32)
+    step = factor * max(1, PREVIEW_CHUNK_SLICES // factor)
+    slabs = []
+    for start in range(0, array.shape[0], step):
+        slab = np.asarray(array[start:start + step], dtype=dtype)
+        for axis in range(3):
+            slab = _blockMean(slab, factor, axis)
+        slabs.append(slab)
+    averaged = np.concatenate(slabs)
+    if np.issubdtype(array.dtype, np.integer):
+        averaged = np.rint(averaged)
+
+    # Preview voxel i is centred on source voxel factor * i + (factor - 1) / 2
+    scale = np.diag([factor, factor, factor, 1.0])
+    scale[:3, 3] = (factor - 1) / 2
+    return SurveyImageIO.VolumeArray(volume.path, averaged.astype(array.dtype), volume.ijk_to_ras @ scale)
+
+
+def buildPreviews(image_paths:list, factors=PREVIEW_FACTORS, force:bool=False) -> dict:
+    """
+    Write the previews of every image SurveyImageIO can read, unless they are already up to
+    date or `force`. Previews are written to a temporary file first, so that a survey open
+    at the same time never reads a partial one.
+    Returns the number of images 'built' and already 'current', and the 'skipped' paths.
+    """
+    result = {'built': 0, 'current': 0, 'skipped': []}
+    for image_path in image_paths:
+        if not SurveyImageIO.canRead(image_path) or not os.path.exists(image_path):
+            result['skipped'].append(image_path)
+            continue
+        if not force and len(availablePreviews(image_path, factors)) == len(factors):
+            result['current'] += 1
+            continue
+        try:
+            volume = SurveyImageIO.readImage(image_path)
+            os.makedirs(os.path.dirname(previewPath(image_path, factors[0])), exist_ok=True)
+            for factor in factors:
+                path = previewPath(image_path, factor)
+                SurveyImageIO.writeNrrd(path + '.tmp', downsample(volume, factor))
+                os.replace(path + '.tmp', path)
+        except (OSError, SurveyImageIO.UnsupportedImageError) as e:
+            print(f"Could not build the previews of {image_path}: {e}")
+            result['skipped'].append(image_path)
+            continue
+        result['built'] += 1
+    return result
@@ -1,60 +1,156 @@
-import csv, ast
+import csv
 import Resources.Lib.SurveyUI as SurveyUI
+import Resources.Lib.SurveyParser as SurveyParser
+import Resources.Lib.SurveyCache as SurveyCache
+import Resources.Lib.SurveyAnswers as SurveyAnswers
+import Resources.Lib.SurveyImageIO as SurveyImageIO
+import Resources.Lib.SurveyPreview as SurveyPreview
+import Resources.Lib.SurveyImageCache as SurveyImageCache
+import Resources.Lib.SurveyEviction as SurveyEviction
+import Resources.Lib.SurveySchedule as SurveySchedule
+import Resources.Lib.SurveyWidgetStore as SurveyWidgetStore
+import Resources.Lib.SurveyTrace as SurveyTrace
+import Resources.Lib.SurveyJournal as SurveyJournal
+import Resources.Lib.SurveyResultsWriter as SurveyResultsWriter
 import qt, slicer
 from pathlib import Path, PurePath
 
 
-class SurveyItem: 
-    def __init__(self, text, type, images, choices):
-        self.text = text
-        self.type = type
-        self.images = ast.literal_eval(images)
-        self.choices = ast.literal_eval(choices)
+from Resources.Lib.SurveyParser import SurveyItem
+
+
+REFINE_INTERVAL_MS = 100
 
 
 #
 # SurveyQuestionnaire
 #
 class SurveyQuestionnaire:
-    def __init__(self, csv_path:str, questions_container:qt.QLayout, navigations_container:qt.QLayout, footer_container:qt.QLayout):
+    def __init__(self, csv_path:str, questions_container:qt.QLayout, navigations_container:qt.QLayout, footer_container:qt.QLayout,
+                 image_cache_mb:int=SurveyImageCache.DEFAULT_BUDGET_MB, prefetch_depth:int=SurveyImageCache.DEFAULT_PREFETCH_DEPTH,
+                 lazy_widgets:bool=False, widget_capacity:int=SurveyWidgetStore.DEFAULT_CAPACITY, pooled_widgets:bool=False,
+                 streaming:bool=False, tracer:SurveyTrace.SpanTracer=None, autosave:bool=True,
+                 memory_map:bool=True, schedule_seed:int=None, persistent_nodes:bool=False, previews:bool=False):
         self.csv_path = csv_path
+        self.tracer = tracer if tracer is not None else SurveyTrace.SpanTracer()
         self.questions_container = questions_container
         self.navigations_container = navigations_container
         self.footer_container = footer_container
         self.question_widgets = []
+        self.answers = None
+        self.autosave = autosave
+        self.journal = None
+        self.invalid_csv = False
+        self.compiled_survey = None
+        self.streaming = streaming
+        # Creating every widget up front would defeat reading questions on demand
+        self.lazy_widgets = lazy_widgets or streaming
+        self.widget_capacity = widget_capacity
+        self.pooled_widgets = pooled_widgets
         self.loaded_image_nodes = []
+        # Persistent nodes show every image in the same background and foreground nodes,
+        # so the cache keeps decoded arrays rather than nodes
+        self.persistent_nodes = persistent_nodes
+        self.volume_slots = []
+        if persistent_nodes:
+            self.image_cache = SurveyImageCache.VolumeArrayCache(image_cache_mb)
+        else:
+            self.image_cache = SurveyImageCache.VolumeNodeCache(image_cache_mb)
+        self.memory_map = memory_map
+        self.prefetcher = SurveyImageCache.ImagePrefetcher(prefetch_depth, memory_map=memory_map)
+        # Images with a SurveyPreview preview are shown from it first, and refined in the background
+        self.refiner = SurveyImageCache.ImageRefiner(memory_map) if previews else None
+        self.refine_timer = None
+        if previews:
+            self.refine_timer = qt.QTimer()
+            self.refine_timer.setInterval(REFINE_INTERVAL_MS)
+            self.refine_timer.timeout.connect(self._refineImages)
+        self.shown_images = []
+        self.schedule_seed = schedule_seed
+        # Question indices in the order they are shown, and the position each is shown at
+        self.order = []
+        self.positions = []
         self.current_num = 0
         self.current_question = None
         self.questions_dropdown = None
         self.finish_button = None
         self.resume_button = None
 
-        self._loadSurveyData()
-        self._generateQuestions()
-        
-        self._formatQuestions()
-        self._formatNavigations()
-        self._formatFooter()
+        with self.tracer.span('openSurvey'):
+            with self.tracer.span('loadSurveyData'):
+                self._loadSurveyData()
+            with self.tracer.span('scheduleQuestions'):
+                self._scheduleQuestions()
+            with self.tracer.span('indexImageUses'):
+                self.image_cache.uses = SurveyEviction.ImageUses(self.questions_items, self._imagePath, self.order)
+            with self.tracer.span('generateQuestions'):
+                self._generateQuestions()
+
+            self._formatQuestions()
+            self._formatNavigations()
+            self._formatFooter()
 
     def close(self):
+        if self.journal:
+            self.journal.close()
+        self.prefetcher.shutdown()
+        if self.refiner:
+            self.refine_timer.stop()
+            self.refiner.shutdown()
         self._clearQuestions()
         self._clearNavigations()
         self._clearData()
         self._clearFooter()
+        self.question_widgets.clear()
+        self._writeTrace()
+
+    def _writeTrace(self):
+        if not self.tracer.enabled or not self.tracer.events:
+            return
+        try:
+            trace_path, summary_path = self.tracer.write(SurveyTrace.traceDirectory(), Path(self.csv_path).stem)
+            print(f"Survey trace written to {trace_path}, latency summary to {summary_path}")
+        except OSError as e:
+            print(f"Could not write survey trace: {e}")
+        self.tracer.clear()
 
     def _loadSurveyData(self):
+        self.questions_items = []
         try:
             print(f"Loading data from {self.csv_path}...")
-            with open(self.csv_path, newline='') as csvFile:
-                reader = csv.reader(csvFile)
-                next(reader)
-                self.questions_items = [SurveyItem(*row) for row in reader]
-        except:
-            self._invalidCSV("Invalid CSV")
-        finally:
-            if(not self.questions_items):
+            if self.streaming:
+                # Only byte offsets are kept, items are read when a question is visited or prefetched
+                indexed_survey = SurveyParser.IndexedSurvey(self.csv_path)
+                if indexed_survey.errors:
+                    raise SurveyParser.SurveyParseError(self.csv_path, indexed_survey.errors)
+                self.questions_items = indexed_survey
+            else:
+                self.compiled_survey = SurveyCache.loadCompiledSurvey(self.csv_path, slicer.app.coreIOManager().fileType)
+                if self.compiled_survey.errors:
+                    raise SurveyParser.SurveyParseError(self.csv_path, self.compiled_survey.errors)
+                self.questions_items = self.compiled_survey.items
+        except SurveyParser.SurveyParseError as e:
+            print(f"Invalid CSV {self.csv_path}:\n{e}")
+            self.invalid_csv = True
+            self._invalidCSV(f"Invalid CSV\n{e}")
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            self.invalid_csv = True
+            self._invalidCSV(f"Invalid CSV: {e}")
+        else:
+            if(len(self.questions_items) == 0):
+                self.invalid_csv = True
                 self._invalidCSV("Invalid CSV")
 
+    def _scheduleQuestions(self):
+        # Answers stay keyed by question index, only the order questions are shown in changes
+        if self.schedule_seed is not None:
+            self.order = SurveySchedule.scheduleQuestions(self.questions_items, self.schedule_seed)
+        else:
+            self.order = list(range(len(self.questions_items)))
+        self.positions = [0] * len(self.order)
+        for position, num in enumerate(self.order):
+            self.positions[num] = position
+
     def _clearNavigations(self):
         child = self.navigations_container.takeAt(0)
         while child:
@@ -71,10 +167,13 @@ class SurveyQuestionnaire:
                 del(widget)
 
     def _clearData(self):
-         if slicer.mrmlScene:
-            for node in self.loaded_image_nodes:
-                slicer.mrmlScene.RemoveNode(node)
-            self.loaded_image_nodes = []
+        with self.tracer.span('clearData'):
+            self.image_cache.clear()
+            for node in self.volume_slots:
+                if slicer.mrmlScene and node.GetScene() is not None:
+                    slicer.mrmlScene.RemoveNode(node)
+        self.volume_slots = []
+        self.loaded_image_nodes = []
 
     def _clearFooter(self):
         if self.finish_button:
@@ -84,34 +183,208 @@ class SurveyQuestionnaire:
 
     def _loadQuestionImage(self):
         try:
-            self._clearData()
-            for each in self.current_question.getImages():
-                node = self.loadNode(each)
-                node.SetName(each)
+            names = self.current_question.getImages()
+            images = [self._imagePath(each) for each in names]
+            self.image_cache.position = self.positions[self.current_num]
+            if self.refiner:
+                # A preview that is no longer being refined must not be shown again from the cache
+                for path in self.refiner.cancel(keep=images):
+                    if path in self.image_cache:
+                        self.image_cache.remove(path)
+            if self.persistent_nodes:
+                with self.tracer.span('swapVolumes'):
+                    self._showPersistentVolumes(names, images)
+                return
+            self.loaded_image_nodes = []
+            for name, path in zip(names, images):
+                node = self.image_cache.get(path)
+                if node is None:
+                    with self.tracer.span('prefetcher.take', image=name):
+                        volume = self.prefetcher.take(path, wait=self.refiner is None)
+                    window = self._imageWindow(name)
+                    if volume is None:
+                        with self.tracer.span('readPreview', image=name):
+                            volume = self._readPreview(path)
+                    if volume is None:
+                        # Without a preview, a prefetch still being read is waited for rather than read again
+                        with self.tracer.span('prefetcher.take', image=name):
+                            volume = self.prefetcher.take(path)
+                    if volume:
+                        with self.tracer.span('nodeFromVolume', image=name):
+                            node = SurveyImageCache.nodeFromVolume(volume, name, window)
+                    else:
+                        with self.tracer.span('loadNode', image=name):
+                            node = self.loadNode(name)
+                        if window is not None:
+                            SurveyImageCache.setWindow(node, window)
+                    node.SetName(name)
+                    self.image_cache.put(path, node, pinned=images)
                 self.loaded_image_nodes.append(node)
-            if (len(self.loaded_image_nodes) >= 2):
+
+            # Cached nodes are not shown automatically, so always set both layers
+            with self.tracer.span('setSliceViewerLayers'):
                 slicer.util.setSliceViewerLayers(
-                    background=self.loaded_image_nodes[0],
-                    foreground=self.loaded_image_nodes[1]
+                    background=self.loaded_image_nodes[0] if len(self.loaded_image_nodes) >= 1 else None,
+                    foreground=self.loaded_image_nodes[1] if len(self.loaded_image_nodes) >= 2 else None
                 )
         except:
-            _invalid_csv("An Image Could Not Be Loaded")
+            self._invalidCSV("An Image Could Not Be Loaded")
+        finally:
+            with self.tracer.span('prefetchUpcoming'):
+                self._prefetchUpcoming()
+
+    def _showPersistentVolumes(self, names:list, images:list):
+        volumes = []
+        for name, path in zip(names, images):
+            volume = self.image_cache.get(path)
+            if volume is None:
+                with self.tracer.span('prefetcher.take', image=name):
+                    volume = self.prefetcher.take(path, wait=self.refiner is None)
+                if volume is None:
+                    with self.tracer.span('readPreview', image=name):
+                        volume = self._readPreview(path)
+                if volume is None:
+                    with self.tracer.span('prefetcher.take', image=name):
+                        volume = self.prefetcher.take(path)
+                if volume is None:
+                    with self.tracer.span('loadVolume', image=name):
+                        volume = self.loadVolume(name)
+                # Precomputed windows are the same for every reader, and spare sampling the voxels
+                window = self._imageWindow(name)
+                if window is not None:
+                    volume.window_range = window
+                self.image_cache.put(path, volume, pinned=images)
+            volumes.append(volume)
+
+        # Replace the data of the slot nodes in one batch, so views render once rather than per node change
+        previous = list(self.loaded_image_nodes)
+        slicer.mrmlScene.StartState(slicer.mrmlScene.BatchProcessState)
+        try:
+            for slot, (name, volume) in enumerate(zip(names, volumes)):
+                if slot == len(self.volume_slots):
+                    node = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode', name)
+                    node.CreateDefaultDisplayNodes()
+                    self.volume_slots.append(node)
+                SurveyImageCache.swapVolume(self.volume_slots[slot], volume, name)
+        finally:
+            slicer.mrmlScene.EndState(slicer.mrmlScene.BatchProcessState)
+        self.loaded_image_nodes = self.volume_slots[:len(volumes)]
+        self.shown_images = list(images)
 
-    def loadNode(self, nodeName):
+        # Layers only change when the number of images shown does
+        if self.loaded_image_nodes != previous:
+            with self.tracer.span('setSliceViewerLayers'):
+                slicer.util.setSliceViewerLayers(
+                    background=self.loaded_image_nodes[0] if len(self.loaded_image_nodes) >= 1 else None,
+                    foreground=self.loaded_image_nodes[1] if len(self.loaded_image_nodes) >= 2 else None
+                )
+
+    def _readPreview(self, path:str):
+        """
+        Read the coarsest preview of an image and start refining it, None if it has no up to
+        date preview. A prefetch of the image still being read becomes the last refinement.
+        """
+        if self.refiner is None:
+            return None
+        previews = SurveyPreview.availablePreviews(path)
+        if not previews:
+            return None
+        try:
+            volume = SurveyImageIO.readImage(previews[0], self.memory_map)
+        except (OSError, SurveyImageIO.UnsupportedImageError):
+            return None
+        self.refiner.start(path, previews[1:], self.prefetcher.takeFuture(path))
+        self.refine_timer.start()
+        return volume
+
+    def _refineImages(self):
+        # Swapping the image data in place keeps the question and its answers untouched
+        # Only the images of the current question are refined, see _loadQuestionImage
+        names = {self._imagePath(each): each for each in self.current_question.getImages()} if self.current_question else {}
+        images = list(names)
+        for path, volume, final in self.refiner.ready():
+            if volume is None or path not in names or path not in self.image_cache:
+                continue
+            name = names[path]
+            with self.tracer.span('refineImage', image=name, final=final):
+                if self.persistent_nodes:
+                    window = self._imageWindow(name)
+                    if window is not None:
+                        volume.window_range = window
+                    self.image_cache.put(path, volume, pinned=images)
+                    slicer.mrmlScene.StartState(slicer.mrmlScene.BatchProcessState)
+                    try:
+                        for node, shown in zip(self.loaded_image_nodes, self.shown_images):
+                            if shown == path:
+                                SurveyImageCache.swapVolume(node, volume, node.GetName())
+                    finally:
+                        slicer.mrmlScene.EndState(slicer.mrmlScene.BatchProcessState)
+                else:
+                    node = self.image_cache.get(path)
+                    if node is None:
+                        continue
+                    SurveyImageCache.swapVolume(node, volume, node.GetName(), window=False)
+                    self.image_cache.refresh(path, pinned=images)
+        if not len(self.refiner):
+            self.refine_timer.stop()
+
+    def _prefetchUpcoming(self):
+        paths = []
+        position = self.positions[self.current_num]
+        last = min(position + self.prefetcher.depth, len(self.order) - 1)
+        for num in self.order[position + 1:last + 1]:
+            for each in self.questions_items[num].images:
+                path = self._imagePath(each)
+                if path not in self.image_cache and path not in paths:
+                    paths.append(path)
+        self.prefetcher.schedule(paths)
+
+    def _imageWindow(self, nodeName):
+        """Return the window precomputed for an image in the compiled survey, None if there is none."""
+        info = self.compiled_survey.imageInfo(nodeName) if self.compiled_survey else None
+        statistics = info.get('statistics') if info else None
+        return tuple(statistics['window']) if statistics else None
+
+    def _imagePath(self, nodeName) -> str:
         questionnaire_dir = PurePath(self.csv_path).parents[0]
-        path = PurePath(questionnaire_dir, f"{nodeName}")
+        return str(PurePath(questionnaire_dir, f"{nodeName}"))
+
+    def loadNode(self, nodeName):
+        path = self._imagePath(nodeName)
         if (not Path(path).exists()):
             raise FileNotFoundError(f"File {path} does not exist")
         
-        filetype = slicer.app.coreIOManager().fileType(path)
+        if SurveyImageIO.canRead(path):
+            try:
+                return SurveyImageCache.nodeFromVolume(SurveyImageIO.readImage(path, self.memory_map), nodeName, self._imageWindow(nodeName))
+            except SurveyImageIO.UnsupportedImageError:
+                pass
+
+        info = self.compiled_survey.imageInfo(nodeName) if self.compiled_survey else None
+        filetype = info['file_type'] if info and info['file_type'] else slicer.app.coreIOManager().fileType(path)
         node = slicer.util.loadNodeFromFile(path, filetype)
         return node
 
+    def loadVolume(self, nodeName) -> SurveyImageIO.VolumeArray:
+        """Read an image as an array, through Slicer's readers for formats SurveyImageIO cannot read."""
+        path = self._imagePath(nodeName)
+        if SurveyImageIO.canRead(path) and Path(path).exists():
+            try:
+                return SurveyImageIO.readImage(path, self.memory_map)
+            except SurveyImageIO.UnsupportedImageError:
+                pass
+        node = self.loadNode(nodeName)
+        try:
+            return SurveyImageCache.volumeFromNode(node, path)
+        finally:
+            slicer.mrmlScene.RemoveNode(node)
+
     @staticmethod
     def createQuestionWidget(num:int, question:SurveyItem):
         type = question.type
         text = question.text
-        choices = question.choices
+        # Widgets may modify their choices (e.g. DropDownQuestion), keep the item intact for re-creation
+        choices = list(question.choices)
         images = question.images
 
         if type == 'multi_multi':
@@ -127,22 +400,41 @@ class SurveyQuestionnaire:
         elif type == 'rating':
             return SurveyUI.RatingScaleQuestion(num, text, images, choices[0], choices[1], choices[2])
         else:
-            _invalid_csv("Invalid Question Type in CSV")
+            SurveyQuestionnaire._invalidCSV("Invalid Question Type in CSV")
             raise Exception(f"UI Type {type} not supported")
 
     def _generateQuestions(self):
-        for i in range(len(self.questions_items)):
-            question = self.questions_items[i]
-            new_question_widget = self.createQuestionWidget(i+1, question)
-            self.question_widgets.append(new_question_widget)
-        
-        self.current_num = 0
-        self.current_question = self.question_widgets[self.current_num]
+        # In lazy mode widgets are only created when toQuestion first visits them,
+        # pooled mode additionally reuses released widgets of the same question type
+        self.answers = SurveyAnswers.AnswerModel(self.questions_items)
+        if self.autosave and not self.invalid_csv:
+            # Restore before any widget exists, widgets read their answer when bound
+            self.journal = SurveyJournal.AnswerJournal(self.csv_path, self.answers)
+            restored = self.journal.restore()
+            # The answers may be those of another reader of the same questionnaire who did not save
+            if restored and not slicer.util.confirmYesNoDisplay(
+                    f"{restored} answers of an unsaved session of this survey were autosaved. Restore them?",
+                    windowTitle="Restore Autosaved Answers"):
+                self.answers = SurveyAnswers.AnswerModel(self.questions_items)
+                self.journal = SurveyJournal.AnswerJournal(self.csv_path, self.answers)
+                self.journal.discard()
+                restored = 0
+            if restored:
+                print(f"Restored {restored} autosaved answers")
+            self.journal.open()
+        self.question_widgets = SurveyWidgetStore.QuestionWidgetStore(
+            self.questions_items, self.createQuestionWidget, self.answers, self.lazy_widgets, self.widget_capacity, self.pooled_widgets)
+
+        self.current_num = self.order[0] if self.order else 0
+        self.current_question = self.question_widgets.pin(self.current_num)
 
     def _formatQuestions(self):
-        self._clearQuestions()
-        self.questions_container.insertWidget(self.questions_container.count() - 1, self.current_question)
-        self._loadQuestionImage()
+        with self.tracer.span('formatQuestions'):
+            with self.tracer.span('layoutQuestion'):
+                self._clearQuestions()
+                self.questions_container.insertWidget(self.questions_container.count() - 1, self.current_question)
+            with self.tracer.span('loadQuestionImage'):
+                self._loadQuestionImage()
 
     def _formatNavigations(self):
         self._clearNavigations()
@@ -151,15 +443,16 @@ class SurveyQuestionnaire:
         self.prev_button = qt.QPushButton("Prev")
         self.next_button = qt.QPushButton("Next")
         self.to_last_button = qt.QPushButton("To Last")
+        self.next_unanswered_button = qt.QPushButton("Next Unanswered")
+        self.progress_label = qt.QLabel()
 
         self.to_first_button.setEnabled(False)
         self.prev_button.setEnabled(False)
 
         questions_dropdown = qt.QComboBox()
         questions_dropdown.setMaximumWidth(45)
-        for i in range(len(self.question_widgets)):
-            questions_dropdown.addItem(str(i + 1))
-        questions_dropdown.setCurrentIndex(self.current_num)
+        questions_dropdown.addItems([str(num + 1) for num in self.order])
+        questions_dropdown.setCurrentIndex(self.positions[self.current_num])
         questions_dropdown.currentIndexChanged.connect(self._toSelectedQuestion)
         self.questions_dropdown = questions_dropdown
 
@@ -167,8 +460,12 @@ class SurveyQuestionnaire:
         self.to_last_button.clicked.connect(self._toLastQuestion)
         self.prev_button.clicked.connect(self._toPrevQuestion)
         self.next_button.clicked.connect(self._toNextQuestion)
+        self.next_unanswered_button.clicked.connect(self._toNextUnansweredQuestion)
+        self.answers.addObserver(self._updateProgress)
+        self._updateProgress()
 
-        buttons = [self.to_first_button, self.prev_button, questions_dropdown, self.next_button, self.to_last_button]
+        buttons = [self.to_first_button, self.prev_button, questions_dropdown, self.next_button, self.to_last_button,
+                   self.next_unanswered_button, self.progress_label]
         for button in buttons:
             self.navigations_container.addWidget(button)
     
@@ -185,79 +482,106 @@ class SurveyQuestionnaire:
         self.footer_container.addWidget(resume_button)
 
     def toQuestion(self, num:int):
-        self._checkCurrentQuestionUnanswered()
-        self.current_num = num
-        self.current_question = self.question_widgets[num]
+        with self.tracer.span('toQuestion', num=num):
+            # Includes the time an unanswered question dialog is open
+            with self.tracer.span('checkCurrentQuestionUnanswered'):
+                self._checkCurrentQuestionUnanswered()
+            self.current_num = num
+            with self.tracer.span('pinQuestionWidget'):
+                self.current_question = self.question_widgets.pin(num)
 
-        self._setNavigationButtonStatus()
+            self._setNavigationButtonStatus()
 
-        state = self.questions_dropdown.blockSignals(True)
-        self.questions_dropdown.setCurrentIndex(num)
-        self.questions_dropdown.blockSignals(state)
-        self._formatQuestions()
+            state = self.questions_dropdown.blockSignals(True)
+            self.questions_dropdown.setCurrentIndex(self.positions[num])
+            self.questions_dropdown.blockSignals(state)
+            self._formatQuestions()
 
     def _toSelectedQuestion(self):
         if self.questions_dropdown:
-            self.toQuestion(self.questions_dropdown.currentIndex)
+            num = self.order[self.questions_dropdown.currentIndex]
+            # Jumping away makes the lookahead stale, only keep reads the target question needs
+            keep = [self._imagePath(each) for each in self.questions_items[num].images]
+            self.prefetcher.cancel(keep=keep)
+            self.toQuestion(num)
 
     def _toFirstQuestion(self):
-        self.toQuestion(0)
+        self.toQuestion(self.order[0])
 
     def _toLastQuestion(self):
-        self.toQuestion(len(self.question_widgets) - 1)
+        self.toQuestion(self.order[-1])
 
     def _toPrevQuestion(self):
-        self.toQuestion(self.current_num - 1)
+        self.toQuestion(self.order[self.positions[self.current_num] - 1])
 
     def _toNextQuestion(self):
-        self.toQuestion(self.current_num + 1)
+        self.toQuestion(self.order[self.positions[self.current_num] + 1])
+
+    def _toNextUnansweredQuestion(self):
+        num = self.answers.nextUnanswered(self.current_num, self.order)
+        if num is not None and num != self.current_num:
+            self.toQuestion(num)
+
+    def _updateProgress(self, num:int=None):
+        self.progress_label.setText(f"{self.answers.percentComplete():.0f}% answered")
+        self.next_unanswered_button.setEnabled(not self.answers.isComplete())
 
     def _saveSurveyProgress(self):
         abs_path = PurePath(Path(__file__).parent.parent.parent,"Results", f"defaultName")
-        filename = qt.QFileDialog.getSaveFileName(None, "Save CSV File", abs_path, "CSV Files (*.csv)")
-
-        if filename and filename.endswith(".csv"):
-            with open(filename, mode='w') as csvFile:
-                for idx, question in enumerate(self.question_widgets):
-                    # If user chose to be anonymous, skip saving the name
-                    if idx == 0 and self.question_widgets[1].getAnswers()[0] == "yes":
-                        continue
-                    csvFile.write(question.toCSV())
+        filename = qt.QFileDialog.getSaveFileName(None, "Save Results File", abs_path, SurveyResultsWriter.FILE_FILTER)
+
+        if filename and SurveyResultsWriter.writerForPath(filename):
+            self.saveProgress(filename)
+
+    def saveProgress(self, filename:str):
+        """Save the answers in the results format given by the extension of `filename` (see SurveyResultsWriter)."""
+        writer = SurveyResultsWriter.writerForPath(filename)
+        if writer is None:
+            raise ValueError(f"{filename} is not a supported results file")
+        # If user chose to be anonymous, skip saving the name
+        skip = {0} if self.answers.getAnswers(1)[0] == "yes" else set()
+        with self.tracer.span('saveProgress'):
+            writer.write(self.answers, skip)
+        # Saved answers must not be offered to the next reader of the questionnaire
+        if self.journal:
+            self.journal.discard()
 
     def _resumeSurveyProgress(self):
         abs_path = PurePath(Path(__file__).parent.parent.parent,"Results", f"defaultName")
         filename = qt.QFileDialog.getOpenFileName(None, "Load CSV File", abs_path, "CSV Files (*.csv)")
 
-        if filename and filename.endswith(".csv"):
-            with open(filename, mode='r') as csv_file:
-                csv_reader = csv.reader(csv_file)
-                counter = 0
-                for row in csv_reader:
-                    current_question = self.question_widgets[counter]
-                    counter+=1
-
-                    if not current_question.fromCSV(row):
-                        self._dialogUnmatched(counter)
+        if filename and not SurveyResultsWriter.canResume(filename):
+            # e.g. a .long.csv file, whose rows would all be taken for unmatched answers
+            self._invalidCSV(f"{Path(filename).name} cannot be loaded,\nonly results saved as {SurveyResultsWriter.LegacyCSVWriter.description} can")
+        elif filename:
+            unmatched = self.resumeProgress(filename)
+            if unmatched:
+                self._dialogUnmatched(unmatched)
+
+    def resumeProgress(self, filename:str) -> list:
+        """Restore the answers saved in `filename`. Returns the (row number, reason) of the rows that could not be restored."""
+        if not SurveyResultsWriter.canResume(filename):
+            raise ValueError(f"{filename} is not a results file that can be loaded back")
+        with self.tracer.span('resumeProgress'), open(filename, mode='r') as csv_file:
+            # Answers go straight into the model, widgets pick them up when they are next shown
+            unmatched = self.answers.fromCSVRows(csv.reader(csv_file))
+        self.question_widgets.invalidate()
+        self.current_question = self.question_widgets.pin(self.current_num)
+        return unmatched
 
     def _checkCurrentQuestionUnanswered(self):
         self.current_question = self.question_widgets[self.current_num]
+        if self.answers.isAnswered(self.current_num):
+            return
+
         if isinstance(self.current_question, SurveyUI.SliderQuestion):
-            # Check if the slider has been moved
-            if self.current_question.slid is False:
-                dialog = CustomDialog(self.current_num + 1)
-                result = dialog.exec_()
-                if result == 1:
-                    self.current_question.slid = True
-        elif self.current_question.getAnswers() == [None]:
+            # The slider has not been moved
+            dialog = CustomDialog(self.current_num + 1)
+            result = dialog.exec_()
+            if result == 1:
+                self.current_question.setAnswers([str(self.current_question.slider.value)])
+        else:
             self._dialogUnanswered()
-        elif isinstance(self.current_question, SurveyUI.DropDownQuestion):
-            # Check if the value is default
-            if self.current_question.getAnswers() == ['Question Unanswered']:
-                self._dialogUnanswered()
-        elif isinstance(self.current_question, SurveyUI.OpenEndedQuestion):
-            # Check if the value is default
-            if self.current_question.getAnswers() == ['']:
-                self._dialogUnanswered()
 
     def _dialogUnanswered(self):
         # Create a pop-up dialog
@@ -272,35 +596,40 @@ class SurveyQuestionnaire:
         dialog.setLayout(layout)
         dialog.exec_()
 
-    def _dialogUnmatched(self, num):
-        # Create a pop-up dialog
+    def _dialogUnmatched(self, unmatched:list):
+        # Create a single pop-up dialog summarizing every row that could not be restored
         dialog = qt.QDialog()
-        dialog.setWindowTitle("Answer Unmatched")
+        dialog.setWindowTitle("Answers Unmatched")
         
         layout = qt.QVBoxLayout()
-        label = qt.QLabel(f"Answer {num} does not match to question {num}")
+        label = qt.QLabel(f"{len(unmatched)} saved answers could not be restored:")
         font = qt.QFont()
         font.setPointSize(14) 
         label.setFont(font)
         layout.addWidget(label)
+        details = qt.QPlainTextEdit("\n".join(f"Row {row}: {reason}" for row, reason in unmatched))
+        details.setReadOnly(True)
+        layout.addWidget(details)
         dialog.setLayout(layout)
         dialog.exec_()
 
     def _setNavigationButtonStatus(self):
-        if (self.current_num == 0):
+        position = self.positions[self.current_num]
+        if (position == 0):
             self.prev_button.setEnabled(False)
             self.to_first_button.setEnabled(False)
         else:
             self.prev_button.setEnabled(True)
             self.to_first_button.setEnabled(True)
         
-        if (self.current_num == len(self.question_widgets) - 1):
+        if (position == len(self.order) - 1):
             self.next_button.setEnabled(False)
             self.to_last_button.setEnabled(False)
         else:
             self.next_button.setEnabled(True)
             self.to_last_button.setEnabled(True)
 
+    @staticmethod
     def _invalidCSV(msg):
         dialog = qt.QDialog()
         dialog.setWindowTitle("File Invalid")
@@ -0,0 +1,248 @@
+import os
+from statistics import NormalDist
+import numpy as np
+from Resources.Lib.SurveyAnswers import CHOICE_TYPES, questionKey
+
+
+FIRST_WINS = 0
+SECOND_WINS = 1
+TIE = 2
+
+DEFAULT_PRIOR = 0.5
+# Largest change of a log strength ratio in an iteration at convergence, far below their standard errors
+DEFAULT_TOLERANCE = 1e-7
+DEFAULT_MAX_ITERATIONS = 10000
+
+
+def imageName(image:str) -> str:
+    """The default competitor of an image: its file name without extension, e.g. 'RegLib_C01_1'."""
+    name = os.path.basename(image)
+    for extension in ('.nii.gz', '.seg.nrrd'):
+        if name.lower().endswith(extension):
+            return name[:-len(extension)]
+    return os.path.splitext(name)[0]
+
+
+# Characters that may separate the name of what produced an image from the rest of its file name
+NAME_SEPARATORS = '_-. '
+
+
+def namesImage(choice, name:str) -> bool:
+    """
+    Return whether a whole choice names an image: it is the image name, or its end after a
+    separator, ignoring case and surrounding spaces, e.g. 'C01_1' for 'RegLib_C01_1' but
+    not '1' for 'C01' or 'C0' for 'RegLib_C01_1'.
+    """
+    choice = questionKey(str(choice)).lower()
+    name = name.lower()
+    if not choice or not name.endswith(choice):
+        return False
+    return len(name) == len(choice) or name[-len(choice) - 1] in NAME_SEPARATORS
+
+
+def comparisonQuestions(items:list) -> list:
+    """
+    Return the questions that ask to pick one of two images, as (index, first image, second
+    image): single choice questions with two images whose first two choices name the images,
+    in either order, such as ['C01_1', 'C01_2', 'Neither appear better than the other'] for
+    ['RegLib_C01_1.nrrd', 'RegLib_C01_2.nrrd'], see namesImage. Any other choice is a tie.
+    Questions whose choices could name either image are left out.
+    """
+    comparisons = []
+    for index, item in enumerate(items):
+        if item.type not in CHOICE_TYPES or len(item.images) != 2 or len(item.choices) < 2:
+            continue
+        first, second = (imageName(image) for image in item.images)
+        choices = item.choices[:2]
+        in_order = namesImage(choices[0], first) and namesImage(choices[1], second)
+        swapped = namesImage(choices[0], second) and namesImage(choices[1], first)
+        if in_order and not swapped:
+            comparisons.append((index, item.images[0], item.images[1]))
+        elif swapped and not in_order:
+            comparisons.append((index, item.images[1], item.images[0]))
+    return comparisons
+
+
+def pairwiseOutcomes(models:list, comparisons:list, competitor=imageName) -> tuple:
+    """
+    Return every answered comparison of the AnswerModels as arrays (first, second, outcome)
+    and the list of competitor names they index. `competitor` maps an image to what is
+    ranked, the image itself by default; map it to the algorithm that reconstructed the
+    image to rank algorithms.
+    """
+    names = sorted({competitor(image) for index, first, second in comparisons for image in (first, second)})
+    number = {name: position for position, name in enumerate(names)}
+    questions = np.array([index for index, first, second in comparisons], dtype=np.int64)
+    firsts = np.array([number[competitor(first)] for index, first, second in comparisons], dtype=np.int64)
+    seconds = np.array([number[competitor(second)] for index, first, second in comparisons], dtype=np.int64)
+
+    choices = np.stack([answers.choice_index[questions] for answers in models]) if models else \
+        np.empty((0, len(comparisons)), dtype=np.int32)
+    # The first choice picks the first image, the second choice the second, any other is a tie
+    outcome = np.minimum(choices, TIE)
+    raters, columns = np.nonzero(choices >= 0)
+    return firsts[columns], seconds[columns], outcome[raters, columns].astype(np.int8), names
+
+
+#
+# PairwiseRanking
+#
+class PairwiseRanking:
+    """
+    Davidson's extension of the Bradley-Terry model to ties, fitted to pairwise outcomes:
+    competitor i beats j with probability p_i / D, ties with nu * sqrt(p_i p_j) / D, with
+    D = p_i + p_j + nu * sqrt(p_i p_j).
+
+    Outcomes are first reduced to win and tie counts per pair of competitors, so that every
+    iteration of the minorization-maximization updates is a few vectorized operations over
+    pairs, whatever the number of comparisons. `prior` adds that many wins and losses of
+    every competitor against a virtual competitor of strength 1, which keeps strengths
+    finite for competitors that never or always win.
+    """
+    def __init__(self, names:list, prior:float=DEFAULT_PRIOR) -> None:
+        self.names = list(names)
+        self.prior = prior
+        # Pairs first * competitors + second with first < second, and their outcomes from the first's side
+        self.pairs = np.empty(0, dtype=np.int64)
+        self.wins = np.empty(0, dtype=np.int64)
+        self.losses = np.empty(0, dtype=np.int64)
+        self.ties = np.empty(0, dtype=np.int64)
+        self.strengths = np.ones(len(self.names))
+        self.tie = 0.0
+        self.covariance = None
+        self.iterations = 0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def addOutcomes(self, first:np.ndarray, second:np.ndarray, outcome:np.ndarray) -> None:
+        """Add comparisons given as competitor indices and FIRST_WINS, SECOND_WINS or TIE."""
+        first, second, outcome = np.asarray(first), np.asarray(second), np.asarray(outcome)
+        valid = first != second
+        first, second, outcome = first[valid], second[valid], outcome[valid]
+        swap = first > second
+        low, high = np.where(swap, second, first), np.where(swap, first, second)
+        outcome = np.where(swap & (outcome != TIE), 1 - outcome, outcome)
+        pairs, inverse = np.unique(np.concatenate([self.pairs, low.astype(np.int64) * len(self) + high]),
+                                   return_inverse=True)
+        old, new = inverse[:len(self.pairs)], inverse[len(self.pairs):]
+        counts = []
+        for previous, result in ((self.wins, FIRST_WINS), (self.losses, SECOND_WINS), (self.ties, TIE)):
+            count = np.bincount(new[outcome == result], minlength=len(pairs))
+            count[old] += previous
+            counts.append(count)
+        self.pairs = pairs
+        self.wins, self.losses, self.ties = counts
+
+    @property
+    def comparisons(self) -> int:
+        return int(self.wins.sum() + self.losses.sum() + self.ties.sum())
+
+    def _pairs(self) -> tuple:
+        return self.pairs // len(self), self.pairs % len(self), self.wins, self.losses, self.ties
+
+    def fit(self, tolerance:float=DEFAULT_TOLERANCE, max_iterations:int=DEFAULT_MAX_ITERATIONS) -> bool:
+        """Fit strengths and the tie parameter. Returns False if the updates did not converge."""
+        first, second, wins, losses, ties = self._pairs()
+        counts = wins + losses + ties
+        competitors = len(self)
+        # Wins, with ties counting half, of every competitor
+        scores = (np.bincount(first, wins + ties / 2, competitors) +
+                  np.bincount(second, losses + ties / 2, competitors) + self.prior)
+        total_ties = ties.sum()
+
+        strengths = np.ones(competitors)
+        tie = 1.0 if total_ties else 0.0
+        converged = False
+        for self.iterations in range(1, max_iterations + 1):
+            a, b = strengths[first], strengths[second]
+            root = np.sqrt(a * b)
+            denominator = a + b + tie * root
+            terms = counts / denominator
+            expected = (np.bincount(first, terms * (1 + tie / 2 * np.sqrt(b / a)), competitors) +
+                        np.bincount(second, terms * (1 + tie / 2 * np.sqrt(a / b)), competitors) +
+                        2 * self.prior / (strengths + 1))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                updated = np.where(expected > 0, scores / expected, strengths)
+            if self.prior == 0:
+                # Only ratios of strengths are determined, keep them from drifting
+                updated /= np.exp(np.log(updated).mean())
+            if total_ties:
+                a, b = updated[first], updated[second]
+                root = np.sqrt(a * b)
+                tie = total_ties / (counts * root / (a + b + tie * root)).sum()
+            # Converged when the ratios are, the scale set by the prior settles much more slowly
+            step = np.log(updated) - np.log(strengths)
+            change = np.abs(step - step.mean()).max() if competitors else 0.0
+            strengths = updated
+            if change < tolerance:
+                converged = True
+                break
+
+        self.strengths = strengths
+        self.tie = tie
+        covariance = self._covariance()
+
+        # Report strengths relative to their geometric mean, the scale set by the virtual
+        # competitor of the prior is arbitrary and its uncertainty would widen every interval
+        if competitors:
+            self.strengths = strengths / np.exp(np.log(strengths).mean())
+        centring = np.eye(len(covariance))
+        centring[:competitors, :competitors] -= 1 / competitors if competitors else 0
+        self.covariance = centring @ covariance @ centring.T
+        return converged
+
+    def _covariance(self) -> np.ndarray:
+        """
+        Covariance of the log strengths and, when there are ties, the log tie parameter: the
+        inverse of the Fisher information. The outcome terms of the log likelihood are linear in these, so the
+        information is the Hessian of sum n_ij log D_ij.
+        """
+        first, second, wins, losses, ties = self._pairs()
+        counts = wins + losses + ties
+        competitors = len(self)
+        fit_tie = ties.sum() > 0
+        size = competitors + fit_tie
+
+        a, b = self.strengths[first], self.strengths[second]
+        c = self.tie * np.sqrt(a * b)
+        denominator = a + b + c
+        # Gradient and Hessian of D over (log p_i, log p_j, log nu)
+        gradient = np.stack([a + c / 2, b + c / 2, c], axis=1)
+        hessian = np.empty((len(first), 3, 3))
+        hessian[:, 0, 0], hessian[:, 1, 1], hessian[:, 2, 2] = a + c / 4, b + c / 4, c
+        hessian[:, 0, 1] = hessian[:, 1, 0] = c / 4
+        hessian[:, 0, 2] = hessian[:, 2, 0] = hessian[:, 1, 2] = hessian[:, 2, 1] = c / 2
+        local = (hessian / denominator[:, None, None] -
+                 gradient[:, :, None] * gradient[:, None, :] / denominator[:, None, None] ** 2)
+        local *= counts[:, None, None]
+
+        variables = np.stack([first, second, np.full(len(first), competitors)], axis=1)
+        if not fit_tie:
+            local, variables = local[:, :2, :2], variables[:, :2]
+        information = np.zeros((size, size))
+        np.add.at(information, (variables[:, :, None], variables[:, None, :]), local)
+        information[np.arange(competitors), np.arange(competitors)] += \
+            2 * self.prior * self.strengths / (self.strengths + 1) ** 2
+        if self.prior > 0:
+            return np.linalg.inv(information)
+        # Without a prior the information is singular along a common shift of log strengths
+        return np.linalg.pinv(information)
+
+    def ranking(self, confidence:float=0.95) -> list:
+        """
+        Return (name, log strength, low, high) of every competitor from the strongest, with
+        the confidence interval of its log strength. Log strengths are relative to the mean.
+        """
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        log_strengths = np.log(self.strengths)
+        error = np.sqrt(np.maximum(np.diag(self.covariance)[:len(self)], 0))
+        order = np.argsort(-log_strengths, kind='stable')
+        return [(self.names[i], float(log_strengths[i]), float(log_strengths[i] - z * error[i]),
+                 float(log_strengths[i] + z * error[i])) for i in order]
+
+    def probability(self, first:int, second:int) -> tuple:
+        """Return the probabilities that `first` beats, ties and loses to `second`."""
+        a, b = self.strengths[first], self.strengths[second]
+        c = self.tie * np.sqrt(a * b)
+        return float(a / (a + b + c)), float(c / (a + b + c)), float(b / (a + b + c))
@@ -0,0 +1,139 @@
+import csv, json, os, sqlite3
+from Resources.Lib.SurveyAnswers import AnswerModel, VALUE_TYPES, questionKey
+
+
+def answerValues(answers:AnswerModel, index:int, item=None) -> list:
+    """Return the answers to question `index` as values, ints for slider and rating questions, [] when unanswered."""
+    if not answers.isAnswered(index):
+        return []
+    if answers.types[index] in VALUE_TYPES:
+        return [answers.getValue(index)]
+    return answers.getAnswers(index, item)
+
+
+#
+# ResultsWriter
+#
+class ResultsWriter:
+    """
+    Writes the answers of an AnswerModel to a results file. Questions are written one at
+    a time as they are read from the model, in one pass over its items (see
+    AnswerModel.iterItems), to a temporary file that then replaces `path`, so an
+    interrupted save never leaves a truncated file.
+
+    `respondent` identifies whose answers these are in formats that combine readers, it
+    defaults to the name of the results file.
+    """
+    suffix = None
+    description = None
+
+    def __init__(self, path:str, respondent:str=None) -> None:
+        self.path = str(path)
+        self.respondent = respondent if respondent is not None else os.path.basename(self.path)[:-len(self.suffix)]
+
+    def write(self, answers:AnswerModel, skip=()) -> None:
+        """Write every answer but those of the question indices in `skip`."""
+        temporary_path = self.path + '.tmp'
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        try:
+            self._write(temporary_path, answers, [index for index in range(len(answers)) if index not in skip])
+            os.replace(temporary_path, self.path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def _write(self, path:str, answers:AnswerModel, indices:list) -> None:
+        raise NotImplementedError
+
+    def _records(self, answers:AnswerModel, indices:list):
+        # One (respondent, question number, question key, type, answer) record per answer, answer is None when unanswered
+        for index, item in answers.iterItems(indices):
+            key = questionKey(item.text)
+            values = answerValues(answers, index, item) or [None]
+            for value in values:
+                yield self.respondent, index + 1, key, answers.types[index], value
+
+
+class LegacyCSVWriter(ResultsWriter):
+    """The original results format, one row per question: 'question, then 'answer or "Question Unanswered" per answer."""
+    suffix = '.csv'
+    description = "CSV Files"
+
+    def _write(self, path:str, answers:AnswerModel, indices:list) -> None:
+        with open(path, 'w') as csvFile:
+            for index, item in answers.iterItems(indices):
+                csvFile.write(answers.toCSV(index, item))
+
+
+class LongCSVWriter(ResultsWriter):
+    """Long format CSV with one row per answer: respondent, question_number, question, type, answer."""
+    suffix = '.long.csv'
+    description = "Long Format CSV Files"
+    columns = ['respondent', 'question_number', 'question', 'type', 'answer']
+
+    def _write(self, path:str, answers:AnswerModel, indices:list) -> None:
+        with open(path, 'w', newline='') as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow(self.columns)
+            writer.writerows(self._records(answers, indices))
+
+
+class JSONLinesWriter(ResultsWriter):
+    """One JSON object per question, with its answers as a list."""
+    suffix = '.jsonl'
+    description = "JSON Lines Files"
+
+    def _write(self, path:str, answers:AnswerModel, indices:list) -> None:
+        with open(path, 'w') as file:
+            for index, item in answers.iterItems(indices):
+                record = {
+                    'respondent': self.respondent,
+                    'question_number': index + 1,
+                    'question': questionKey(item.text),
+                    'type': answers.types[index],
+                    'answers': answerValues(answers, index, item),
+                }
+                file.write(json.dumps(record) + '\n')
+
+
+class SQLiteWriter(ResultsWriter):
+    """An `answers` table with the columns of LongCSVWriter, inserted in batches within one transaction."""
+    suffix = '.sqlite'
+    description = "SQLite Databases"
+    batch_size = 1000
+
+    def _write(self, path:str, answers:AnswerModel, indices:list) -> None:
+        connection = sqlite3.connect(path)
+        try:
+            with connection:
+                connection.execute("CREATE TABLE answers (respondent TEXT, question_number INTEGER, question TEXT, type TEXT, answer)")
+                batch = []
+                for record in self._records(answers, indices):
+                    batch.append(record)
+                    if len(batch) >= self.batch_size:
+                        connection.executemany("INSERT INTO answers VALUES (?, ?, ?, ?, ?)", batch)
+                        batch = []
+                connection.executemany("INSERT INTO answers VALUES (?, ?, ?, ?, ?)", batch)
+        finally:
+            connection.close()
+
+
+# Longest suffixes first, so that .long.csv is not taken for .csv
+WRITERS = [LongCSVWriter, JSONLinesWriter, SQLiteWriter, LegacyCSVWriter]
+
+FILE_FILTER = ";;".join(f"{writer.description} (*{writer.suffix})" for writer in
+                        [LegacyCSVWriter, LongCSVWriter, JSONLinesWriter, SQLiteWriter])
+
+
+def writerForPath(path:str, respondent:str=None):
+    """Return the ResultsWriter for the extension of `path`, or None if it is not a results format."""
+    for writer in WRITERS:
+        if str(path).lower().endswith(writer.suffix):
+            return writer(path, respondent)
+    return None
+
+
+def canResume(path:str) -> bool:
+    """Return whether `path` is in the one results format that Load Progress reads back, that of LegacyCSVWriter."""
+    return isinstance(writerForPath(path), LegacyCSVWriter)
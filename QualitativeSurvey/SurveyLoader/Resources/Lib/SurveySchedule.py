@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def imageBlocks(items) -> tuple:
+    """
+    Group questions by the set of images they show, reading the items once in order.
+    Returns (preamble, blocks, block images): the questions before the first one with
+    images (e.g. name and anonymity), which stay first and in order, lists of question
+    indices showing the same images, in order of first appearance, and the frozenset of
+    images of each block. Later questions without images stay with the block of the
+    question before them.
+    """
+    preamble, blocks = [], []
+    block_of = {}
+    current = None
+    for num, item in enumerate(items):
+        if not item.images:
+            if current is None:
+                preamble.append(num)
+            else:
+                blocks[current].append(num)
+            continue
+        key = frozenset(item.images)
+        if key not in block_of:
+            block_of[key] = len(blocks)
+            blocks.append([])
+        current = block_of[key]
+        blocks[current].append(num)
+    return preamble, blocks, list(block_of)
+
+
+def scheduleQuestions(items, seed:int, shuffle_within:bool=True) -> list:
+    """
+    Return a reproducible display order of the questions, as question indices, that keeps
+    questions showing the same images together so their volumes are loaded once.
+
+    Blocks start from a random one, and each next block is the one sharing the most images
+    with the previous, ties broken at random, so that consecutive blocks also reuse loaded
+    volumes while readers see the comparisons in a different order for every seed.
+    Questions are shuffled within their block unless `shuffle_within` is False.
+    """
+    rng = np.random.default_rng(seed)
+    preamble, blocks, block_images = imageBlocks(items)
+    if shuffle_within:
+        blocks = [[block[each] for each in rng.permutation(len(block))] for block in blocks]
+
+    blocks_showing = {}
+    for position, images in enumerate(block_images):
+        for image in images:
+            blocks_showing.setdefault(image, []).append(position)
+
+    # Random order used to pick the next block when none shares images, and to break ties
+    shuffled = [int(each) for each in rng.permutation(len(blocks))]
+    rank = {block: position for position, block in enumerate(shuffled)}
+    scheduled = np.zeros(len(blocks), dtype=bool)
+    order = list(preamble)
+    next_random = 0
+    current = None
+    for _ in range(len(blocks)):
+        shared = {}
+        if current is not None:
+            for image in block_images[current]:
+                for block in blocks_showing[image]:
+                    if not scheduled[block]:
+                        shared[block] = shared.get(block, 0) + 1
+        if shared:
+            current = max(shared, key=lambda block: (shared[block], -rank[block]))
+        else:
+            while scheduled[shuffled[next_random]]:
+                next_random += 1
+            current = shuffled[next_random]
+        scheduled[current] = True
+        order.extend(blocks[current])
+    return order
+
+
+def volumeLoads(items, order:list) -> int:
+    """Count the images loaded going through `order` when only the images of the current question stay loaded."""
+    loads = 0
+    previous = frozenset()
+    for num in order:
+        images = frozenset(items[num].images)
+        loads += len(images - previous)
+        previous = images
+    return loads
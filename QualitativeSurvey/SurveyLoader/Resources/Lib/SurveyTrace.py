@@ -0,0 +1,126 @@
+import json, os, tempfile, threading, time
+import numpy as np
+
+
+# Set to 1 to trace every survey, or to the directory the traces should be written to
+TRACE_ENV = 'SURVEY_TRACE'
+
+
+def tracingRequested() -> bool:
+    return os.environ.get(TRACE_ENV, '').lower() not in ('', '0', 'false', 'no')
+
+
+def traceDirectory() -> str:
+    value = os.environ.get(TRACE_ENV, '')
+    if os.path.isdir(value):
+        return value
+    return os.path.join(tempfile.gettempdir(), 'SurveyTraces')
+
+
+class _NullSpan:
+    # Shared by every span of a disabled tracer, so tracing off allocates nothing
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name:str, args:dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer._record(self.name, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+
+#
+# SpanTracer
+#
+class SpanTracer:
+    """
+    Records named, nested spans of time, e.g.
+
+        with tracer.span('toQuestion', num=3):
+            with tracer.span('loadNode'):
+                ...
+
+    and writes them as a Chrome trace (chrome://tracing or ui.perfetto.dev) with a
+    summary of the latency of each span name. A disabled tracer hands out one shared
+    no-op span, so instrumented code costs a method call when tracing is off.
+    """
+    def __init__(self, enabled:bool=False) -> None:
+        self.enabled = enabled
+        self.events = []
+        self.origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def span(self, name:str, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def _record(self, name:str, start:int, duration:int, args:dict) -> None:
+        with self._lock:
+            self.events.append((name, start - self.origin, duration, threading.get_ident(), args))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.events = []
+
+    def summary(self) -> dict:
+        """Return {span name: count and latency statistics in milliseconds}, slowest total first."""
+        durations = {}
+        for name, start, duration, thread, args in self.events:
+            durations.setdefault(name, []).append(duration)
+
+        summary = {}
+        for name, values in durations.items():
+            milliseconds = np.array(values) / 1e6
+            summary[name] = {
+                'count': len(milliseconds),
+                'total_ms': float(milliseconds.sum()),
+                'mean_ms': float(milliseconds.mean()),
+                'p50_ms': float(np.median(milliseconds)),
+                'p95_ms': float(np.percentile(milliseconds, 95)),
+                'max_ms': float(milliseconds.max()),
+            }
+        return dict(sorted(summary.items(), key=lambda entry: -entry[1]['total_ms']))
+
+    def chromeTrace(self) -> dict:
+        pid = os.getpid()
+        events = [{
+            'name': name,
+            'cat': 'survey',
+            'ph': 'X',
+            'ts': start / 1e3,
+            'dur': duration / 1e3,
+            'pid': pid,
+            'tid': thread,
+            'args': {key: str(value) for key, value in args.items()},
+        } for name, start, duration, thread, args in self.events]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, directory:str, prefix:str='survey') -> tuple:
+        """Write `<prefix>-<time>.trace.json` and its `.summary.json` to `directory`. Returns both paths."""
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}")
+        trace_path = stem + '.trace.json'
+        summary_path = stem + '.summary.json'
+        with open(trace_path, 'w') as file:
+            json.dump(self.chromeTrace(), file)
+        with open(summary_path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+        return trace_path, summary_path
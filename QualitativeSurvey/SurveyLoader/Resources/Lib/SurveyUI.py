@@ -1,5 +1,6 @@
 import slicer, qt
 from abc import ABCMeta, abstractmethod
+from Resources.Lib.SurveyAnswers import formatCSVRow
 
 
 class QuestinoWidgetMeta(ABCMeta, type(qt.QWidget)):
@@ -12,10 +13,13 @@ class QuestionWidget(qt.QWidget, metaclass=QuestinoWidgetMeta):
         self.num = num
         self.question = question
         self.question_display = None
+        self.number_display = None
         self.images = images
         self.choices = choices
         self.answers = []
         self.main_layout = None
+        self.answer_model = None
+        self.answer_index = None
 
         self.setMinimumWidth(400)
 
@@ -51,8 +55,44 @@ class QuestionWidget(qt.QWidget, metaclass=QuestinoWidgetMeta):
     def setChoices(self, choices:list) -> bool:
         pass
 
+    @abstractmethod
+    def resizeChoices(self, choices:list) -> bool:
+        # Like setChoices, but the number of choices may change. Choices are given as to the constructor
+        pass
+
+    @abstractmethod
+    def clearAnswer(self) -> None:
+        pass
+
+    def bindModel(self, model, index:int) -> None:
+        # Makes this widget a view of the answer to question `index` of an AnswerModel
+        self.unbindModel()
+        self.clearAnswer()
+        self.setAnswers(model.getAnswers(index))
+        self.answer_model = model
+        self.answer_index = index
+
+    def unbindModel(self) -> None:
+        self.answer_model = None
+        self.answer_index = None
+
+    def _answerChanged(self) -> None:
+        if self.answer_model is not None:
+            self.answer_model.setAnswers(self.answer_index, self.getAnswers())
+
+    def rebind(self, num:int, question:str, images:list, choices:list) -> bool:
+        # Reuses this widget for another question of the same type
+        self.setNumber(num)
+        self.setQuestion(question)
+        self.setImages(images)
+        resized = self.resizeChoices(choices)
+        self.clearAnswer()
+        return resized
+
     def setNumber(self, num:int) -> bool:
         self.num = num
+        if self.number_display:
+            self.number_display.setText("Question {}.".format(num))
         return True
 
     def setQuestion(self, question:str) -> bool:
@@ -60,17 +100,14 @@ class QuestionWidget(qt.QWidget, metaclass=QuestinoWidgetMeta):
         self.question_display.setText(question)
         return True
 
-    def toCSV(self) -> str:
-        formatted_question = "'" + self.question.strip()
-        csv_string = '"{}",'.format(formatted_question)
+    def setAnswers(self, answers:list) -> bool:
+        # Restores answers in the format returned by getAnswers
+        if answers[0] is None:
+            return True
+        return self.setAnswer(answers[0])
 
-        for answer in self.getAnswers():
-            if answer == '' or answer is None:
-                    csv_string += '"Question Unanswered",'
-            else:
-                formatted_answer = "'" + answer.strip()
-                csv_string += '"{}",'.format(formatted_answer)
-        return csv_string[:-1]+"\n" if csv_string[-1] == "," else csv_string+"\n"
+    def toCSV(self) -> str:
+        return formatCSVRow(self.question, self.getAnswers())
 
     def _checkQuestionCSVFormat(self, question:str) -> bool:
         if len(question) < 2:
@@ -96,6 +133,25 @@ class QuestionWidget(qt.QWidget, metaclass=QuestinoWidgetMeta):
     def fromCSV(self, data:list) -> bool:
         pass
 
+    def _resizeButtonGroup(self, count:int, button_type) -> None:
+        buttons = self.button_group.buttons()
+        for button in buttons[count:]:
+            self.button_group.removeButton(button)
+            button.setParent(None)
+            button.deleteLater()
+        for i in range(len(buttons), count):
+            button = button_type()
+            self.button_group.addButton(button, i)
+            self.main_layout.addWidget(button)
+
+    def _clearButtonGroup(self) -> None:
+        # An exclusive group does not allow unchecking its checked button
+        exclusive = self.button_group.exclusive
+        self.button_group.setExclusive(False)
+        for button in self.button_group.buttons():
+            button.setChecked(False)
+        self.button_group.setExclusive(exclusive)
+
     
 class MultiSingleQuestion(QuestionWidget):
     def __init__(self, num:int, question:str, images:list, choices:list) -> None:
@@ -105,12 +161,14 @@ class MultiSingleQuestion(QuestionWidget):
     def _formatSelfLayout(self) -> bool:
         self.main_layout = qt.QVBoxLayout()
         self.setLayout(self.main_layout)
-        self.main_layout.addWidget(qt.QLabel("Question {}.".format(self.num)))
+        self.number_display = qt.QLabel("Question {}.".format(self.num))
+        self.main_layout.addWidget(self.number_display)
 
         self.question_display = qt.QLabel(self.question)
         self.question_display.setWordWrap(True)
         self.main_layout.addWidget(self.question_display)
         self.button_group = qt.QButtonGroup()
+        self.button_group.buttonToggled.connect(self._answerChanged)
         
         for choice in self.choices:
             radio_button = qt.QRadioButton(choice)
@@ -143,6 +201,14 @@ class MultiSingleQuestion(QuestionWidget):
                 buttons[i].setText(choices[i])
         
         return True
+
+    def resizeChoices(self, choices:list) -> bool:
+        self._resizeButtonGroup(len(choices), qt.QRadioButton)
+        self.choices = choices
+        return self.setChoices(choices)
+
+    def clearAnswer(self) -> None:
+        self._clearButtonGroup()
     
     def fromCSV(self, data:list) -> bool:
         if len(data) != 2:
@@ -171,7 +237,8 @@ class MultiMultiQuestion(QuestionWidget):
     def _formatSelfLayout(self) -> bool:
         self.main_layout = qt.QVBoxLayout()
         self.setLayout(self.main_layout)
-        self.main_layout.addWidget(qt.QLabel("Question {}.".format(self.num)))
+        self.number_display = qt.QLabel("Question {}.".format(self.num))
+        self.main_layout.addWidget(self.number_display)
         
         self.question_display = qt.QLabel(self.question)
         self.main_layout.addWidget(self.question_display)
@@ -186,6 +253,7 @@ class MultiMultiQuestion(QuestionWidget):
             count += 1
 
         self.button_group.setExclusive(False)
+        self.button_group.buttonToggled.connect(self._answerChanged)
         return True
 
     def getAnswers(self) -> list:
@@ -210,6 +278,11 @@ class MultiMultiQuestion(QuestionWidget):
         for button in self.button_group.buttons():
             button.setChecked(self.button_group.id(button) in indices)
         return True
+
+    def setAnswers(self, answers:list) -> bool:
+        if answers == [None]:
+            return True
+        return self.setAnswer(answers)
     
     def setChoices(self, choices:list) -> bool:
         buttons = self.button_group.buttons()
@@ -220,6 +293,14 @@ class MultiMultiQuestion(QuestionWidget):
                 buttons[i].setText(choices[i])
         
         return True
+
+    def resizeChoices(self, choices:list) -> bool:
+        self._resizeButtonGroup(len(choices), qt.QCheckBox)
+        self.choices = choices
+        return self.setChoices(choices)
+
+    def clearAnswer(self) -> None:
+        self._clearButtonGroup()
     
     def fromCSV(self, data:list) -> bool:
         if len(data) < 2:
@@ -253,12 +334,14 @@ class OpenEndedQuestion(QuestionWidget):
     def _formatSelfLayout(self) -> bool:
         self.main_layout = qt.QVBoxLayout()
         self.setLayout(self.main_layout)
-        self.main_layout.addWidget(qt.QLabel("Question {}.".format(self.num)))
+        self.number_display = qt.QLabel("Question {}.".format(self.num))
+        self.main_layout.addWidget(self.number_display)
         
         self.question_display = qt.QLabel(self.question)
         self.main_layout.addWidget(self.question_display)
 
         self.answer_box = qt.QTextEdit()
+        self.answer_box.textChanged.connect(self._answerChanged)
         self.main_layout.addWidget(self.answer_box)
         
         return True
@@ -272,6 +355,12 @@ class OpenEndedQuestion(QuestionWidget):
 
     def setChoices(self):
         pass
+
+    def resizeChoices(self, choices:list) -> bool:
+        return True
+
+    def clearAnswer(self) -> None:
+        self.answer_box.clear()
     
     def fromCSV(self, data:list) -> bool:
         if len(data) != 2:
@@ -297,7 +386,8 @@ class DropDownQuestion(QuestionWidget):
     def _formatSelfLayout(self) -> bool:
         self.main_layout = qt.QVBoxLayout()
         self.setLayout(self.main_layout)
-        self.main_layout.addWidget(qt.QLabel("Question {}.".format(self.num)))
+        self.number_display = qt.QLabel("Question {}.".format(self.num))
+        self.main_layout.addWidget(self.number_display)
         
         self.question_display = qt.QLabel(self.question)
         self.main_layout.addWidget(self.question_display)
@@ -306,6 +396,7 @@ class DropDownQuestion(QuestionWidget):
 
         for choice in self.choices:
             self.combo_box.addItem(choice)
+        self.combo_box.currentIndexChanged.connect(self._answerChanged)
 
     
         self.main_layout.addWidget(self.combo_box)
@@ -329,6 +420,15 @@ class DropDownQuestion(QuestionWidget):
                 self.combo_box.setItemText(i, choices[i])
         
         return True
+
+    def resizeChoices(self, choices:list) -> bool:
+        self.choices = ["Question Unanswered"] + choices
+        self.combo_box.clear()
+        self.combo_box.addItems(self.choices)
+        return True
+
+    def clearAnswer(self) -> None:
+        self.combo_box.setCurrentIndex(0)
     
     def fromCSV(self, data:list) -> bool:
         if len(data) != 2:
@@ -361,11 +461,13 @@ class SliderQuestion(QuestionWidget):
     def _change_display(self) -> None:
         self.slider_display.setText(self.slider.value)
         self.slid = True
+        self._answerChanged()
 
     def _formatSelfLayout(self) -> bool:
         self.main_layout = qt.QVBoxLayout()
         self.setLayout(self.main_layout)
-        self.main_layout.addWidget(qt.QLabel("Question {}.".format(self.num)))
+        self.number_display = qt.QLabel("Question {}.".format(self.num))
+        self.main_layout.addWidget(self.number_display)
 
         self.question_display = qt.QLabel(self.question)
         self.main_layout.addWidget(self.question_display)
@@ -400,6 +502,14 @@ class SliderQuestion(QuestionWidget):
         self.slider.value = answer
         return True
 
+    def setAnswers(self, answers:list) -> bool:
+        if answers[0] is None:
+            self.slid = False
+        else:
+            self.slid = self.setAnswer(int(answers[0]))
+        self._answerChanged()
+        return answers[0] is None or self.slid
+
 
     def getSliderRange(self) -> list:
         return self.choices
@@ -421,6 +531,16 @@ class SliderQuestion(QuestionWidget):
             self.setLeftBound(choices[0])
             self.setRightBound(choices[1])
 
+    def resizeChoices(self, choices:list) -> bool:
+        self.setLeftBound(choices[0])
+        self.setRightBound(choices[1])
+        return True
+
+    def clearAnswer(self) -> None:
+        self.slider.value = self.left_bound
+        self.slider_display.setText(str(self.left_bound))
+        self.slid = False
+
     def fromCSV(self, data:list) -> bool:
         if len(data) != 2:
             return False
@@ -434,11 +554,13 @@ class SliderQuestion(QuestionWidget):
             return False
         elif answer == "":
             self.slid = False
+            self._answerChanged()
             return True
         elif not self.setAnswer(int(answer)):
             print(f"Question {self.num} cannot be loaded: Answer unmatched")
             return False
         self.slid = True
+        self._answerChanged()
         return True
             
 
@@ -457,7 +579,8 @@ class RatingScaleQuestion(QuestionWidget):
         if initial:
             self.main_layout = qt.QVBoxLayout()
             self.setLayout(self.main_layout)
-            self.main_layout.addWidget(qt.QLabel("Question {}.".format(self.num)))
+            self.number_display = qt.QLabel("Question {}.".format(self.num))
+            self.main_layout.addWidget(self.number_display)
             self.question_display = qt.QLabel(self.question)
             self.main_layout.addWidget(self.question_display)
         else:
@@ -477,6 +600,7 @@ class RatingScaleQuestion(QuestionWidget):
 
         self.button_group.setExclusive(True)
         self.button_group.buttonToggled.connect(self._buttonSelected)
+        self.button_group.buttonToggled.connect(self._answerChanged)
         self.main_layout.addWidget(self.rating_widget)
         return True
     
@@ -493,6 +617,11 @@ class RatingScaleQuestion(QuestionWidget):
                 return True
         return False
 
+    def setAnswers(self, answers:list) -> bool:
+        if answers[0] is None:
+            return True
+        return self.setAnswer(int(answers[0]))
+
     def getRatingRange(self) -> list:
         return self.choices[:2]
     
@@ -523,6 +652,17 @@ class RatingScaleQuestion(QuestionWidget):
             self.setRightBound(choices[1])
             self.setStep(choices[2])
 
+    def resizeChoices(self, choices:list) -> bool:
+        # Rebuild the buttons once instead of once per bound as setChoices does
+        if choices[:3] != self.choices:
+            self.left_bound, self.right_bound, self.step = choices[:3]
+            self.choices = list(choices[:3])
+            self._formatSelfLayout(False)
+        return True
+
+    def clearAnswer(self) -> None:
+        self._clearButtonGroup()
+
     def fromCSV(self, data:list) -> bool:
         if len(data) != 2:
             return False
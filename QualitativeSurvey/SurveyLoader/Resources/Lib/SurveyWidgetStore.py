@@ -0,0 +1,114 @@
+import Resources.Lib.SurveyUI as SurveyUI
+import Resources.Lib.SurveyAnswers as SurveyAnswers
+from collections import OrderedDict
+
+
+DEFAULT_CAPACITY = 20
+
+
+#
+# QuestionWidgetStore
+#
+class QuestionWidgetStore:
+    """
+    Sequence of the question widgets of a questionnaire, indexed from 0. Every widget
+    is bound to its question in `answers`, so releasing a widget loses nothing.
+
+    Eager stores create every widget up front. Lazy stores create a widget the first
+    time it is requested and keep at most `capacity` of them alive, releasing the
+    least recently used widgets.
+
+    Pooled stores are lazy stores that recycle released widgets: they are kept in a
+    pool per question type and rebound to the next question of that type instead of
+    building a new widget.
+    """
+    def __init__(self, items:list, factory, answers:SurveyAnswers.AnswerModel, lazy:bool=False,
+                 capacity:int=DEFAULT_CAPACITY, pooled:bool=False) -> None:
+        self.items = items
+        self.factory = factory
+        self.answers = answers
+        self.lazy = lazy or pooled
+        self.pooled = pooled
+        self.capacity = max(capacity, 1)
+        self.widgets = OrderedDict()
+        self.pools = {}
+        self.pinned = None
+        self.stale = set()
+
+        if not self.lazy:
+            for index in range(len(items)):
+                self[index]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __getitem__(self, index:int) -> SurveyUI.QuestionWidget:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Question {index + 1} does not exist")
+
+        widget = self.widgets.get(index)
+        if widget is None:
+            widget = self._recycle(index)
+            if widget is None:
+                widget = self.factory(index + 1, self.items[index])
+            widget.bindModel(self.answers, index)
+            self.widgets[index] = widget
+        else:
+            if index in self.stale:
+                widget.bindModel(self.answers, index)
+            if self.lazy:
+                self.widgets.move_to_end(index)
+        self.stale.discard(index)
+
+        if self.lazy:
+            self._release()
+        return widget
+
+    def pin(self, index:int) -> SurveyUI.QuestionWidget:
+        """Return the widget at `index` and keep it alive while it is displayed."""
+        self.pinned = index
+        return self[index]
+
+    def isLoaded(self, index:int) -> bool:
+        return index in self.widgets
+
+    def invalidate(self) -> None:
+        """Mark every loaded widget as out of date with the answers, they are refreshed when next requested."""
+        self.stale = set(self.widgets)
+
+    def clear(self) -> None:
+        for index in list(self.widgets):
+            self._releaseWidget(index)
+        for pool in self.pools.values():
+            for widget in pool:
+                widget.deleteLater()
+        self.pools = {}
+
+    def _recycle(self, index:int):
+        item = self.items[index]
+        pool = self.pools.get(item.type)
+        if not pool:
+            return None
+
+        widget = pool.pop()
+        widget.rebind(index + 1, item.text, item.images, list(item.choices))
+        return widget
+
+    def _release(self) -> None:
+        for index in list(self.widgets):
+            if len(self.widgets) <= self.capacity:
+                break
+            if index != self.pinned:
+                self._releaseWidget(index, recycle=self.pooled)
+
+    def _releaseWidget(self, index:int, recycle:bool=False) -> None:
+        widget = self.widgets.pop(index)
+        self.stale.discard(index)
+        widget.unbindModel()
+        widget.setParent(None)
+        if recycle:
+            self.pools.setdefault(self.items[index].type, []).append(widget)
+        else:
+            widget.deleteLater()
@@ -20,11 +20,38 @@ import inspect
 from qt import QSettings
 from qt import *
 
+import Resources.Lib.SurveyAnswers as SurveyAnswers
+import Resources.Lib.SurveyParser as SurveyParser
+import Resources.Lib.SurveyCache as SurveyCache
 import Resources.Lib.SurveyUI as SurveyUI
 import Resources.Lib.SurveyQuestionnaire as SQ
+import Resources.Lib.SurveyImageCache as SurveyImageCache
+import Resources.Lib.SurveyPreview as SurveyPreview
+import Resources.Lib.SurveyEviction as SurveyEviction
+import Resources.Lib.SurveySchedule as SurveySchedule
+import Resources.Lib.SurveyWidgetStore as SurveyWidgetStore
+import Resources.Lib.SurveyTrace as SurveyTrace
+import Resources.Lib.SurveyResultsWriter as SurveyResultsWriter
+import Resources.Lib.SurveyAggregate as SurveyAggregate
+import Resources.Lib.SurveyAgreement as SurveyAgreement
+import Resources.Lib.SurveyRanking as SurveyRanking
 
 # import coverage
 from Testing.Python.SurveyUI_Unit_Test import Test_SurveyUI
+from Testing.Python.SurveyAnswers_Unit_Test import Test_SurveyAnswers
+from Testing.Python.SurveyParser_Unit_Test import Test_SurveyParser
+from Testing.Python.SurveyImageIO_Unit_Test import Test_SurveyImageIO
+from Testing.Python.SurveyPreview_Unit_Test import Test_SurveyPreview
+from Testing.Python.SurveyEviction_Unit_Test import Test_SurveyEviction
+from Testing.Python.SurveySchedule_Unit_Test import Test_SurveySchedule
+from Testing.Python.SurveyCache_Unit_Test import Test_SurveyCache
+from Testing.Python.SurveyTrace_Unit_Test import Test_SurveyTrace
+from Testing.Python.SurveyJournal_Unit_Test import Test_SurveyJournal
+from Testing.Python.SurveyResultsWriter_Unit_Test import Test_SurveyResultsWriter
+from Testing.Python.SurveyAggregate_Unit_Test import Test_SurveyAggregate
+from Testing.Python.SurveyAgreement_Unit_Test import Test_SurveyAgreement
+from Testing.Python.SurveyRanking_Unit_Test import Test_SurveyRanking
+from Testing.Python.SurveyWidgetStore_Unit_Test import Test_SurveyWidgetStore
 
 #
 # SurveyLoader
@@ -132,7 +159,22 @@ class SurveyLoaderWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         """
         
         import importlib, sys
+        importlib.reload(sys.modules['Resources.Lib.SurveyParser'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyAnswers'])
         importlib.reload(sys.modules['Resources.Lib.SurveyUI'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyImageIO'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyPreview'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyEviction'])
+        importlib.reload(sys.modules['Resources.Lib.SurveySchedule'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyImageCache'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyCache'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyWidgetStore'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyTrace'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyResultsWriter'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyJournal'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyAggregate'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyAgreement'])
+        importlib.reload(sys.modules['Resources.Lib.SurveyRanking'])
         importlib.reload(sys.modules['Resources.Lib.SurveyQuestionnaire'])
 
         ScriptedLoadableModuleWidget.onReload(self)
@@ -265,6 +307,10 @@ class SurveyLoaderWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         load_button.clicked.connect(self._handleSurveySelection)
         load_button.setVisible(True)
 
+        trace_checkbox = self.ui.traceCheckBox
+        trace_checkbox.setChecked(str(self.settings.value("TraceSurvey", "false")).lower() == "true" or SurveyTrace.tracingRequested())
+        trace_checkbox.toggled.connect(lambda checked: self.settings.setValue("TraceSurvey", "true" if checked else "false"))
+
     def _handleSurveySelection(self):
         """Manage the survey selection and loading."""
         selectedCSV = self._promptForCsvFile()
@@ -272,7 +318,24 @@ class SurveyLoaderWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             return
 
         self._resetSceneAndQuestions()
-        self.currentSurvey = SQ.SurveyQuestionnaire(selectedCSV, self.ui.surveyQuestionsContainer.layout(), self.ui.surveyNavigationsContainer.layout(), self.ui.surveyFooterContainer.layout())
+        image_cache_mb = int(self.settings.value("ImageCacheMB", SurveyImageCache.DEFAULT_BUDGET_MB))
+        prefetch_depth = int(self.settings.value("PrefetchDepth", SurveyImageCache.DEFAULT_PREFETCH_DEPTH))
+        lazy_widgets = str(self.settings.value("LazyWidgets", "false")).lower() == "true"
+        widget_capacity = int(self.settings.value("WidgetCapacity", SurveyWidgetStore.DEFAULT_CAPACITY))
+        pooled_widgets = str(self.settings.value("PooledWidgets", "false")).lower() == "true"
+        streaming = str(self.settings.value("StreamingQuestions", "false")).lower() == "true"
+        autosave = str(self.settings.value("Autosave", "true")).lower() == "true"
+        memory_map = str(self.settings.value("MemoryMapImages", "true")).lower() == "true"
+        schedule_seed = str(self.settings.value("ScheduleSeed", "")).strip()
+        schedule_seed = int(schedule_seed) if schedule_seed else None
+        persistent_nodes = str(self.settings.value("PersistentNodes", "false")).lower() == "true"
+        previews = str(self.settings.value("PreviewImages", "false")).lower() == "true"
+        self.currentSurvey = SQ.SurveyQuestionnaire(selectedCSV, self.ui.surveyQuestionsContainer.layout(), self.ui.surveyNavigationsContainer.layout(), self.ui.surveyFooterContainer.layout(),
+                                                    image_cache_mb=image_cache_mb, prefetch_depth=prefetch_depth,
+                                                    lazy_widgets=lazy_widgets, widget_capacity=widget_capacity, pooled_widgets=pooled_widgets,
+                                                    streaming=streaming, tracer=SurveyTrace.SpanTracer(self.ui.traceCheckBox.checked),
+                                                    autosave=autosave, memory_map=memory_map, schedule_seed=schedule_seed,
+                                                    persistent_nodes=persistent_nodes, previews=previews)
         
         close_button = self.ui.closeSurveyButton
         close_button.clicked.connect(self.currentSurvey.close)
@@ -349,6 +412,201 @@ class SurveyLoaderLogic(ScriptedLoadableModuleLogic):
         stopTime = time.time()
         logging.info(f'Processing completed in {stopTime-startTime:.2f} seconds')
 
+    def compileSurvey(self, questionnairePath):
+        """
+        Compile a questionnaire ahead of time so that opening it later is near-instant.
+        The compiled survey is cached next to the questions CSV and reused until the CSV changes.
+        Can be used without GUI widget.
+        :param questionnairePath: questions CSV file of the survey
+        :return: the SurveyCache.CompiledSurvey, whose errors lists any invalid rows
+        """
+        return SurveyCache.loadCompiledSurvey(questionnairePath, slicer.app.coreIOManager().fileType)
+
+    def precomputeImageStatistics(self, questionnairePath):
+        """
+        Compute the window, scalar range and histogram of every image of a questionnaire once,
+        and store them in its compiled survey, so that images are shown with the same window
+        for every reader without Slicer computing it each time they are loaded.
+        Can be used without GUI widget.
+        :param questionnairePath: questions CSV file of the survey
+        :return: dict of image name to its statistics, None for images that could not be read
+        """
+        compiled = SurveyCache.precomputeStatistics(questionnairePath, slicer.app.coreIOManager().fileType)
+        return {name: info.get('statistics') for name, info in compiled.images.items()}
+
+    def buildImagePreviews(self, questionnairePath, factors=SurveyPreview.PREVIEW_FACTORS, force=False):
+        """
+        Write downsampled previews of every image of a questionnaire, shown while the full
+        images load when the PreviewImages setting is on. Previews that are newer than their
+        image are kept. Can be used without GUI widget.
+        :param questionnairePath: questions CSV file of the survey
+        :param factors: how many times smaller along each axis each preview is
+        :param force: rebuild previews even if they are up to date
+        :return: dict with the number of images 'built' and already 'current', and the 'skipped' image paths
+        """
+        compiled = SurveyCache.loadCompiledSurvey(questionnairePath, slicer.app.coreIOManager().fileType)
+        paths = [info['path'] for info in compiled.images.values()]
+        return SurveyPreview.buildPreviews(paths, factors, force)
+
+    def loadProgress(self, questionnairePath, resultsPath):
+        """
+        Load a saved results file into an answer model, without creating any widget.
+        Can be used without GUI widget.
+        :param questionnairePath: questions CSV file of the survey
+        :param resultsPath: results CSV file saved with "Save Progress", in the CSV Files format (not .long.csv)
+        :return: the SurveyAnswers.AnswerModel, and the (row number, reason) of the rows that could not be restored
+        """
+        if not SurveyResultsWriter.canResume(resultsPath):
+            raise ValueError(f"{resultsPath} is not a results file that can be loaded back")
+        compiled = self.compileSurvey(questionnairePath)
+        if compiled.errors:
+            raise SurveyParser.SurveyParseError(questionnairePath, compiled.errors)
+        answers = SurveyAnswers.AnswerModel(compiled.items)
+        with open(resultsPath, newline='') as csvFile:
+            unmatched = answers.fromCSVRows(csv.reader(csvFile))
+        return answers, unmatched
+
+    def saveProgress(self, answers, resultsPath):
+        """
+        Write an answer model in one of the results formats of "Save Progress".
+        :param answers: SurveyAnswers.AnswerModel to save
+        :param resultsPath: results file to write, its extension selects the format (see SurveyResultsWriter)
+        """
+        writer = SurveyResultsWriter.writerForPath(resultsPath)
+        if writer is None:
+            raise ValueError(f"{resultsPath} is not a supported results file")
+        writer.write(answers)
+
+    def simulateImageCache(self, questionnairePath, budgetsMB=(256, 512, 1024, 2048), sequence=None, scheduleSeed=None):
+        """
+        Replay visiting the questions of a questionnaire with the image cache, and report the
+        hit rates of evicting by next use (as the survey does) and of evicting the least
+        recently used image, for every memory budget.
+        Can be used without GUI widget.
+        :param budgetsMB: image cache sizes to compare, see the ImageCacheMB setting
+        :param sequence: question indices in the order visited, every question in order by default
+        :param scheduleSeed: visit the questions in the order scheduled with this seed, see the ScheduleSeed setting
+        :return: list of dicts with policy, budget_bytes, hits, misses, hit_rate and bytes_read
+        """
+        items = SurveyParser.readSurveyItems(questionnairePath)
+        questionnaireDir = os.path.dirname(os.path.abspath(questionnairePath))
+        imagePath = lambda name: os.path.join(questionnaireDir, name)
+        sizes = {}
+        for item in items:
+            for name in item.images:
+                path = imagePath(name)
+                if path not in sizes:
+                    sizes[path] = SurveyEviction.imageBytes(path)
+        if sequence is None and scheduleSeed is not None:
+            sequence = SurveySchedule.scheduleQuestions(items, scheduleSeed)
+        elif sequence is None:
+            sequence = range(len(items))
+        logging.info(f"{SurveySchedule.volumeLoads(items, sequence)} image loads when only the shown images are kept")
+        results = SurveyEviction.compareBudgets(items, list(sequence), sizes, [mb * 1024 * 1024 for mb in budgetsMB],
+                                                image_path=imagePath)
+        for result in results:
+            logging.info(f"{result['policy']:>6} {result['budget_bytes'] // (1024 * 1024):>6} MB: "
+                         f"hit rate {result['hit_rate']:.1%}, {result['bytes_read'] / 1024 ** 2:.0f} MB read")
+        return results
+
+    def aggregateResults(self, questionnairePath, resultsDir=None, workers=None):
+        """
+        Combine every results file saved for a questionnaire, parsing them in a pool of processes.
+        Can be used without GUI widget.
+        :param questionnairePath: questions CSV file of the survey
+        :param resultsDir: directory of the results CSV files, the module Results folder by default
+        :param workers: number of processes, all cores by default, 1 to run in this process
+        :return: the SurveyAggregate.SurveyAggregate with count tables, histograms and co-selection matrices
+        """
+        if resultsDir is None:
+            resultsDir = os.path.join(os.path.dirname(__file__), "Results")
+        resultsPaths = SurveyAggregate.resultsFiles(resultsDir)
+        aggregate = SurveyAggregate.aggregateResults(questionnairePath, resultsPaths, workers)
+        logging.info(f"Aggregated {aggregate.respondents} of {len(resultsPaths)} results files")
+        return aggregate
+
+    def updateAggregate(self, questionnairePath, resultsDir=None, workers=None):
+        """
+        Like aggregateResults, but only reads the results files that are new or changed since
+        the last call. The totals are kept in an index file in the results directory.
+        Can be used without GUI widget.
+        :return: the SurveyAggregate.IncrementalAggregate, whose `aggregate` holds the totals
+        """
+        if resultsDir is None:
+            resultsDir = os.path.join(os.path.dirname(__file__), "Results")
+        incremental = SurveyAggregate.IncrementalAggregate(questionnairePath, resultsDir)
+        changes = incremental.update(workers)
+        logging.info(f"Aggregate updated: {len(changes['added'])} added, {len(changes['changed'])} changed, "
+                     f"{len(changes['removed'])} removed results files")
+        return incremental
+
+    def watchResults(self, questionnairePath, resultsDir=None, intervalSeconds=10, callback=None):
+        """
+        Keep the aggregate of a results directory up to date while Slicer runs, checking for
+        new results files every `intervalSeconds`.
+        :param callback: called with the IncrementalAggregate and its changes after each update that changed anything
+        :return: the running qt.QTimer, stop() it to stop watching
+        """
+        incremental = self.updateAggregate(questionnairePath, resultsDir)
+
+        def poll():
+            changes = incremental.update()
+            if callback and any(changes.values()):
+                callback(incremental, changes)
+
+        timer = qt.QTimer()
+        timer.setInterval(int(intervalSeconds * 1000))
+        timer.timeout.connect(poll)
+        timer.start()
+        return timer
+
+    def computeAgreement(self, questionnairePath, resultsDir=None, questions=None, metric='nominal', bootstrap=1000, seed=0):
+        """
+        Inter-rater agreement of the readers whose results files are saved for a questionnaire.
+        Can be used without GUI widget.
+        :param questions: indices of the questions compared, by default the single choice questions showing images
+        :param metric: 'nominal', or 'interval' for Krippendorff's alpha of slider and rating questions
+        :param bootstrap: number of resamples of the questions for the 95% confidence intervals, 0 for none
+        :return: dict of Fleiss' kappa, Krippendorff's alpha, the matrix of pairwise Cohen's kappa and their intervals,
+                 with the results files compared as `rater_paths` and those that could not be read as `skipped`
+        """
+        if resultsDir is None:
+            resultsDir = os.path.join(os.path.dirname(__file__), "Results")
+        items = SurveyParser.readSurveyItems(questionnairePath)
+        if questions is None:
+            questions = SurveyAgreement.defaultQuestions(items)
+        ratings, raters, skipped = SurveyAgreement.ratingsFromFiles(items, SurveyAggregate.resultsFiles(resultsDir), questions)
+        result = SurveyAgreement.agreement(ratings, SurveyAgreement.categoryCount(items, questions), metric,
+                                           bootstrap, seed=seed)
+        result['rater_paths'] = raters
+        result['skipped'] = skipped
+        logging.info(f"Agreement of {len(raters)} readers over {len(questions)} questions: "
+                     f"Fleiss' kappa {result['fleiss_kappa']:.3f}, Krippendorff's alpha {result['krippendorff_alpha']:.3f}")
+        return result
+
+    def rankImages(self, questionnairePath, resultsDir=None, competitor=None, prior=SurveyRanking.DEFAULT_PRIOR):
+        """
+        Rank what readers compared in the questions that ask to pick one of two images, with a
+        Bradley-Terry model that counts "neither" answers as ties.
+        Can be used without GUI widget.
+        :param competitor: function from an image file name to what is ranked, e.g. the algorithm
+                           that reconstructed it; the image name without extension by default
+        :param prior: wins and losses of every competitor against a virtual one, keeps strengths finite
+        :return: the fitted SurveyRanking.PairwiseRanking, see its ranking() for confidence intervals
+        """
+        if resultsDir is None:
+            resultsDir = os.path.join(os.path.dirname(__file__), "Results")
+        items = SurveyParser.readSurveyItems(questionnairePath)
+        comparisons = SurveyRanking.comparisonQuestions(items)
+        models, raters, skipped = SurveyAgreement.readResults(items, SurveyAggregate.resultsFiles(resultsDir))
+        first, second, outcome, names = SurveyRanking.pairwiseOutcomes(models, comparisons, competitor or SurveyRanking.imageName)
+        ranking = SurveyRanking.PairwiseRanking(names, prior)
+        ranking.addOutcomes(first, second, outcome)
+        if not ranking.fit():
+            logging.warning(f"Ranking did not converge in {ranking.iterations} iterations")
+        logging.info(f"Ranked {len(names)} competitors from {ranking.comparisons} comparisons by {len(raters)} readers")
+        return ranking
+
 
 #
 # SurveyLoaderTest
@@ -366,6 +624,20 @@ class SurveyLoaderTest(ScriptedLoadableModuleTest):
         """
         slicer.mrmlScene.Clear()
         self.test_SurveyUI = Test_SurveyUI(self)
+        self.test_SurveyAnswers = Test_SurveyAnswers(self)
+        self.test_SurveyParser = Test_SurveyParser(self)
+        self.test_SurveyImageIO = Test_SurveyImageIO(self)
+        self.test_SurveyPreview = Test_SurveyPreview(self)
+        self.test_SurveyEviction = Test_SurveyEviction(self)
+        self.test_SurveySchedule = Test_SurveySchedule(self)
+        self.test_SurveyCache = Test_SurveyCache(self)
+        self.test_SurveyTrace = Test_SurveyTrace(self)
+        self.test_SurveyJournal = Test_SurveyJournal(self)
+        self.test_SurveyResultsWriter = Test_SurveyResultsWriter(self)
+        self.test_SurveyAggregate = Test_SurveyAggregate(self)
+        self.test_SurveyAgreement = Test_SurveyAgreement(self)
+        self.test_SurveyRanking = Test_SurveyRanking(self)
+        self.test_SurveyWidgetStore = Test_SurveyWidgetStore(self)
 
     def runTest(self):
         """Run as few or as many tests as needed here.
@@ -383,6 +655,47 @@ class SurveyLoaderTest(ScriptedLoadableModuleTest):
         self.test_SurveyUI.test_OpenEndedQuestion()
         self.test_SurveyUI.test_DropDownQuestion()
         self.test_SurveyUI.test_SliderQuestion()
+        self.test_SurveyUI.test_rebind()
+        self.test_SurveyUI.test_rebindModel()
+        self.test_SurveyWidgetStore.test_lazyWidgets()
+        self.test_SurveyWidgetStore.test_pooledWidgets()
+        self.test_SurveyAnswers.test_AnswerModel()
+        self.test_SurveyAnswers.test_AnswerModelCSV()
+        self.test_SurveyAnswers.test_matchCSVRows()
+        self.test_SurveyAnswers.test_fromCSVRows()
+        self.test_SurveyParser.test_parseList()
+        self.test_SurveyParser.test_validateItem()
+        self.test_SurveyParser.test_exampleQuestionnaires()
+        self.test_SurveyParser.test_allErrorsReported()
+        self.test_SurveyParser.test_IndexedSurvey()
+        self.test_SurveyImageIO.test_memoryMappedVolumes()
+        self.test_SurveyImageIO.test_windowRange()
+        self.test_SurveyImageIO.test_imageStatistics()
+        self.test_SurveyPreview.test_downsample()
+        self.test_SurveyPreview.test_buildPreviews()
+        self.test_SurveyEviction.test_ImageUses()
+        self.test_SurveyEviction.test_simulateCache()
+        self.test_SurveySchedule.test_imageBlocks()
+        self.test_SurveySchedule.test_scheduleQuestions()
+        self.test_SurveyCache.test_CompiledSurveyCache()
+        self.test_SurveyCache.test_CompiledSurveyRejectsCode()
+        self.test_SurveyCache.test_precomputeStatistics()
+        self.test_SurveyTrace.test_SpanTracer()
+        self.test_SurveyJournal.test_AnswerJournal()
+        self.test_SurveyJournal.test_AnswerJournalEditedQuestionnaire()
+        self.test_SurveyJournal.test_AnswerJournalDiscard()
+        self.test_SurveyJournal.test_AnswerJournalStreaming()
+        self.test_SurveyResultsWriter.test_writerForPath()
+        self.test_SurveyResultsWriter.test_ResultsWriters()
+        self.test_SurveyResultsWriter.test_ResultsWritersStreaming()
+        self.test_SurveyAggregate.test_SurveyAggregate()
+        self.test_SurveyAggregate.test_valueBins()
+        self.test_SurveyAggregate.test_IncrementalAggregate()
+        self.test_SurveyAgreement.test_agreementStatistics()
+        self.test_SurveyAgreement.test_ratingMatrix()
+        self.test_SurveyRanking.test_comparisonQuestions()
+        self.test_SurveyRanking.test_namesImage()
+        self.test_SurveyRanking.test_PairwiseRanking()
 
         # Stop coverage measurement
         # cov.stop()
@@ -0,0 +1,137 @@
+from Resources.Lib.SurveyAggregate import *
+from Resources.Lib.SurveyResultsWriter import LegacyCSVWriter
+import os
+import tempfile
+
+
+class Test_SurveyAggregate():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def _writeSurvey(self, directory):
+        csv_path = os.path.join(directory, 'questions.csv')
+        with open(csv_path, 'w') as csvFile:
+            csvFile.write("question,type,images,choices\n"
+                          "\"name\",\"open\",\"[]\",\"[]\"\n"
+                          "\"pick\",\"multi_single\",\"[]\",\"['yes', 'no']\"\n"
+                          "\"many\",\"multi_multi\",\"[]\",\"['a', 'b', 'c']\"\n"
+                          "\"rate\",\"rating\",\"[]\",\"[1, 9, 2]\"\n")
+        return csv_path
+
+    def test_SurveyAggregate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = self._writeSurvey(directory)
+            items = SurveyParser.readSurveyItems(csv_path)
+            answers = [
+                (["yes"], ["a", "b"], ["3"]),
+                (["no"], ["a", "c"], ["3"]),
+                (["yes"], ["a", "b", "c"], []),
+            ]
+            results_paths = []
+            for number, (pick, many, rate) in enumerate(answers):
+                model = AnswerModel(items)
+                model.setAnswers(1, pick)
+                model.setAnswers(2, many)
+                model.setAnswers(3, rate)
+                results_paths.append(os.path.join(directory, f"reader{number}.csv"))
+                LegacyCSVWriter(results_paths[-1]).write(model)
+            other_path = os.path.join(directory, "other.csv")
+            with open(other_path, 'w') as csvFile:
+                csvFile.write("\"'another questionnaire\",\"'yes\"\n")
+            # Results of another questionnaire starting with the same questions
+            shared_path = os.path.join(directory, "shared.csv")
+            with open(shared_path, 'w') as csvFile:
+                csvFile.write("\"'pick\",\"'no\"\n\"'another question\",\"'yes\"\n")
+            empty_path = os.path.join(directory, "empty.csv")
+            with open(empty_path, 'w') as csvFile:
+                csvFile.write("\"'pick\",\"Question Unanswered\"\n")
+            self.slicer.assertEqual(resultsFiles(directory), sorted(results_paths + [other_path, shared_path, empty_path, csv_path]))
+
+            aggregate = aggregateResults(csv_path, results_paths + [other_path, shared_path, empty_path], workers=1)
+            self.slicer.assertEqual(aggregate.respondents, 3)
+            self.slicer.assertEqual(sorted(aggregate.skipped), [
+                (empty_path, "no answer matches the questionnaire"),
+                (other_path, "1 rows are not questions of this questionnaire"),
+                (shared_path, "1 rows are not questions of this questionnaire"),
+            ])
+            self.slicer.assertEqual(aggregate.answered.tolist(), [0, 3, 3, 2])
+            self.slicer.assertEqual(aggregate.counts(1), {'yes': 2, 'no': 1})
+            self.slicer.assertEqual(aggregate.counts(2), {'a': 3, 'b': 2, 'c': 2})
+            self.slicer.assertEqual(aggregate.coselectionMatrix(2).tolist(), [[3, 2, 2], [2, 2, 1], [2, 1, 2]])
+            values, counts = aggregate.histogram(3)
+            self.slicer.assertEqual(values.tolist(), [1, 3, 5, 7, 9])
+            self.slicer.assertEqual(counts.tolist(), [0, 2, 0, 0, 0])
+
+            # Test aggregates of parts of the files merge into the aggregate of all of them
+            merged = aggregateResults(csv_path, results_paths[:1], workers=1)
+            merged.merge(aggregateResults(csv_path, results_paths[1:], workers=1))
+            self.slicer.assertEqual(merged.respondents, 3)
+            self.slicer.assertTrue((merged.coselection == aggregate.coselection).all())
+            self.slicer.assertTrue((merged.histograms == aggregate.histograms).all())
+
+    def test_valueBins(self):
+        rating = SurveyParser.SurveyItem("rate", "rating", [], [1, 9, 2])
+        self.slicer.assertEqual(valueBins(rating).tolist(), [1, 3, 5, 7, 9])
+
+        # Test wide sliders are counted in at most MAX_VALUE_BINS bins, each answer in the bin it starts
+        slider = SurveyParser.SurveyItem("size", "slider", [], [0, 1000000])
+        self.slicer.assertLessEqual(len(valueBins(slider)), MAX_VALUE_BINS)
+        self.slicer.assertEqual(valueStep(slider), 1001)
+        aggregate = SurveyAggregate([rating, slider])
+        self.slicer.assertEqual(aggregate.histograms.shape, (2, len(valueBins(slider))))
+        for value in [0, 1000, 1001, 1000000]:
+            answers = AnswerModel([rating, slider])
+            answers.setAnswers(1, [str(value)])
+            aggregate.addModel(answers)
+        values, counts = aggregate.histogram(1)
+        self.slicer.assertEqual(values[:2].tolist(), [0, 1001])
+        self.slicer.assertEqual((counts[0], counts[1], counts[-1], counts.sum()), (2, 1, 1, 4))
+
+    def test_IncrementalAggregate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = self._writeSurvey(directory)
+            items = SurveyParser.readSurveyItems(csv_path)
+            results_dir = os.path.join(directory, 'Results')
+            os.makedirs(results_dir)
+
+            def writeResults(name, pick, rate):
+                model = AnswerModel(items)
+                model.setAnswers(1, [pick])
+                model.setAnswers(3, [rate])
+                LegacyCSVWriter(os.path.join(results_dir, name)).write(model)
+
+            writeResults('reader1.csv', 'yes', '3')
+            writeResults('reader2.csv', 'no', '5')
+            changes = IncrementalAggregate(csv_path, results_dir).update(workers=1)
+            self.slicer.assertEqual(len(changes['added']), 2)
+
+            # Test only new, changed and deleted files are processed, from the saved index
+            writeResults('reader3.csv', 'yes', '9')
+            writeResults('reader1.csv', 'no', '3')
+            os.remove(os.path.join(results_dir, 'reader2.csv'))
+            incremental = IncrementalAggregate(csv_path, results_dir)
+            self.slicer.assertEqual(incremental.aggregate.respondents, 2)
+            changes = incremental.update(workers=1)
+            self.slicer.assertEqual([len(changes[kind]) for kind in ('added', 'changed', 'removed')], [1, 1, 1])
+
+            # Test the totals are those of aggregating every file again
+            full = aggregateResults(csv_path, resultsFiles(results_dir), workers=1)
+            self.slicer.assertEqual(incremental.aggregate.respondents, 2)
+            self.slicer.assertEqual(incremental.aggregate.counts(1), full.counts(1))
+            self.slicer.assertTrue((incremental.aggregate.histograms == full.histograms).all())
+            self.slicer.assertEqual(IncrementalAggregate(csv_path, results_dir).update(workers=1),
+                                    {'added': [], 'changed': [], 'removed': []})
+
+            # Test a touched but unchanged file is hashed once, its new time being saved
+            path = os.path.join(results_dir, 'reader3.csv')
+            os.utime(path, ns=(0, 0))
+            hashed = []
+            contentHash = SurveyCache.contentHash
+            try:
+                SurveyCache.contentHash = lambda path: hashed.append(path) or contentHash(path)
+                for run in range(2):
+                    changes = IncrementalAggregate(csv_path, results_dir).update(workers=1)
+                    self.slicer.assertEqual(changes, {'added': [], 'changed': [], 'removed': []})
+            finally:
+                SurveyCache.contentHash = contentHash
+            self.slicer.assertEqual(hashed.count(path), 1)
@@ -0,0 +1,64 @@
+from Resources.Lib.SurveyAgreement import *
+from Resources.Lib.SurveyAnswers import AnswerModel
+from Resources.Lib.SurveyParser import SurveyItem
+import numpy as np
+
+
+class Test_SurveyAgreement():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def test_agreementStatistics(self):
+        # Fleiss' kappa of the worked example of Fleiss (1971): 10 items, 14 raters, 5 categories
+        counts = np.array([
+            [0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+            [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7],
+        ])
+        self.slicer.assertAlmostEqual(float(fleissKappa(counts)), 0.210, places=3)
+
+        # Krippendorff's alpha of the reliability data of Krippendorff (2011), with missing ratings
+        ratings = np.array([
+            [0, 1, 2, 2, 1, 0, 3, 0, 1, -1, -1, -1],
+            [0, 1, 2, 2, 1, 1, 3, 0, 1, 4, -1, 2],
+            [-1, 2, 2, 2, 1, 2, 3, 1, 1, 4, 0, -1],
+            [0, 1, 2, 2, 1, 3, 3, 0, 1, 4, 0, -1],
+        ])
+        counts = countMatrix(ratings, 5)
+        self.slicer.assertEqual(counts[11].tolist(), [0, 0, 1, 0, 0])
+        self.slicer.assertAlmostEqual(float(krippendorffAlpha(counts)), 0.743, places=3)
+        self.slicer.assertAlmostEqual(float(krippendorffAlpha(counts, 'interval')), 0.849, places=3)
+
+        # Test every pair of raters is compared over the items both rated
+        kappas = cohenKappaPairs(ratings, 5)
+        self.slicer.assertTrue(np.allclose(kappas, kappas.T))
+        first, second = ratings[2], ratings[3]
+        both = (first >= 0) & (second >= 0)
+        observed = np.mean(first[both] == second[both])
+        expected = sum(np.mean(first[both] == c) * np.mean(second[both] == c) for c in range(5))
+        self.slicer.assertAlmostEqual(kappas[2, 3], (observed - expected) / (1 - expected))
+
+        # Test statistics of a batch of resamples match those computed one at a time
+        batch = counts[np.array([[0, 1, 5, 5, 9], [2, 3, 4, 6, 11]])]
+        self.slicer.assertTrue(np.allclose(fleissKappa(batch), [fleissKappa(batch[0]), fleissKappa(batch[1])]))
+        self.slicer.assertTrue(np.allclose(krippendorffAlpha(batch), [krippendorffAlpha(batch[0]), krippendorffAlpha(batch[1])]))
+
+        # Test the bootstrap interval contains the statistic and is reproducible
+        result = agreement(ratings, 5, resamples=200, seed=1)
+        low, high = result['krippendorff_alpha_interval']
+        self.slicer.assertTrue(low <= result['krippendorff_alpha'] <= high)
+        self.slicer.assertEqual(result['krippendorff_alpha_interval'], agreement(ratings, 5, resamples=200, seed=1)['krippendorff_alpha_interval'])
+
+    def test_ratingMatrix(self):
+        items = [
+            SurveyItem("name", "open", [], []),
+            SurveyItem("which", "multi_single", ["a.nrrd"], ['left', 'right']),
+            SurveyItem("rate", "rating", ["b.nrrd"], [1, 9, 2]),
+        ]
+        self.slicer.assertEqual(defaultQuestions(items), [1])
+        self.slicer.assertEqual(categoryCount(items, [1, 2]), 5)
+
+        models = [AnswerModel(items), AnswerModel(items)]
+        models[0].setAnswers(1, ["right"])
+        models[0].setAnswers(2, ["5"])
+        models[1].setAnswers(2, ["9"])
+        self.slicer.assertEqual(ratingMatrix(models, items, [1, 2]).tolist(), [[1, 2], [-1, 4]])
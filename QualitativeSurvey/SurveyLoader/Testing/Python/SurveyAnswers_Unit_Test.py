@@ -0,0 +1,134 @@
+from Resources.Lib.SurveyAnswers import *
+from Resources.Lib.SurveyParser import SurveyItem
+
+
+class Test_SurveyAnswers():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def _createModel(self):
+        items = [
+            SurveyItem("What is your name?", "open", [], []),
+            SurveyItem("question 2", "multi_single", [], ['yes', 'no']),
+            SurveyItem("question 3", "multi_multi", [], ['a', 'b', 'c']),
+            SurveyItem("question 4", "dropdown", [], ['x', 'y']),
+            SurveyItem("question 5", "slider", [], [-2, 100]),
+            SurveyItem("question 6", "rating", [], [1, 10, 3]),
+        ]
+        return AnswerModel(items)
+
+    def test_AnswerModel(self):
+        model = self._createModel()
+
+        # Test every question starts unanswered
+        self.slicer.assertEqual(model.unanswered(), [0, 1, 2, 3, 4, 5])
+        self.slicer.assertEqual(model.getAnswers(0), [""])
+        self.slicer.assertEqual(model.getAnswers(1), [None])
+
+        # Test answers are stored in their compact form
+        self.slicer.assertTrue(model.setAnswers(1, ["no"]))
+        self.slicer.assertEqual(model.getValue(1), 1)
+        self.slicer.assertTrue(model.setAnswers(2, ["a", "c"]))
+        self.slicer.assertEqual(model.getValue(2), 0b101)
+        self.slicer.assertTrue(model.setAnswers(4, ["5"]))
+        self.slicer.assertEqual(model.getValue(4), 5)
+
+        # Test answers that do not match the question are rejected
+        self.slicer.assertFalse(model.setAnswers(1, ["maybe"]))
+        self.slicer.assertFalse(model.setAnswers(4, ["101"]))
+        self.slicer.assertFalse(model.setAnswers(5, ["2"]))
+        self.slicer.assertEqual(model.unanswered(), [0, 3, 5])
+
+        # Test completeness queries
+        self.slicer.assertEqual(model.nextUnanswered(0), 3)
+        self.slicer.assertEqual(model.nextUnanswered(3), 5)
+        self.slicer.assertEqual(model.nextUnanswered(5), 0)
+        self.slicer.assertEqual(model.percentComplete(), 50.0)
+        self.slicer.assertFalse(model.isComplete())
+
+        # Test observers are told about changes
+        changed = []
+        model.addObserver(changed.append)
+        model.setAnswers(3, ["y"])
+        model.clear(1)
+        self.slicer.assertEqual(changed, [3, 1])
+
+    def test_AnswerModelCSV(self):
+        model = self._createModel()
+        model.setAnswers(2, ["b", "c"])
+
+        # Test to csv in the same format as the question widgets
+        self.slicer.assertEqual(model.toCSV(2), "\"'question 3\",\"'b\",\"'c\"\n")
+        self.slicer.assertEqual(model.toCSV(3), "\"'question 4\",\"Question Unanswered\"\n")
+
+        # Test from csv
+        self.slicer.assertTrue(model.fromCSV(5, ["'question 6", "'7"]))
+        self.slicer.assertEqual(model.getAnswers(5), ["7"])
+        self.slicer.assertTrue(model.fromCSV(1, ["'question 2", "Question Unanswered"]))
+        self.slicer.assertFalse(model.isAnswered(1))
+        self.slicer.assertFalse(model.fromCSV(1, ["'question 3", "'yes"]))
+
+    def test_matchCSVRows(self):
+        model = self._createModel()
+
+        # Test rows are matched by question, whatever their position, and skipped rows shift nothing
+        rows = [
+            ["'question 4", "'y"],
+            ["'question 2", "'no"],
+            [],
+            ["'question 6", "'4"],
+        ]
+        matches, mismatches = model.matchCSVRows(rows)
+        self.slicer.assertEqual([(row_number, index) for row_number, index, row in matches], [(1, 3), (2, 1), (4, 5)])
+        self.slicer.assertEqual(mismatches, [])
+
+        # Test every mismatch is reported at once
+        rows = [["'question 2", "'no"], ["'question 2", "'yes"], ["'question 99", "'a"], ["question 3"]]
+        matches, mismatches = model.matchCSVRows(rows)
+        self.slicer.assertEqual([index for row_number, index, row in matches], [1])
+        self.slicer.assertEqual([row_number for row_number, reason in mismatches], [2, 3, 4])
+
+        # Test repeated question texts are matched in order
+        items = [SurveyItem("same", "multi_single", [], ['a', 'b']), SurveyItem("same", "multi_single", [], ['a', 'b'])]
+        matches, mismatches = AnswerModel(items).matchCSVRows([["'same", "'a"], ["'same", "'b"]])
+        self.slicer.assertEqual([index for row_number, index, row in matches], [0, 1])
+
+        # Test reordered repeated question texts go to the question whose choices fit the answer
+        items = [SurveyItem("same", "multi_single", [], ['a', 'b']), SurveyItem("other", "open", [], []),
+                 SurveyItem("same", "multi_single", [], ['c', 'd'])]
+        model = AnswerModel(items)
+        rows = [["'same", "'d"], ["'other", "'text"], ["'same", "Question Unanswered"]]
+        matches, mismatches = model.matchCSVRows(rows)
+        self.slicer.assertEqual([(row_number, index) for row_number, index, row in matches], [(1, 2), (2, 1), (3, 0)])
+        rows = [["'same", "'d"], ["'same", "'b"]]
+        self.slicer.assertEqual(model.fromCSVRows(rows), [])
+        self.slicer.assertEqual([model.getValue(0), model.getValue(2)], [1, 1])
+
+        # Test an answer that fits no repeated question still takes one, and is reported when restored
+        self.slicer.assertEqual(model.fromCSVRows([["'same", "'z"], ["'same", "'a"]]), [(1, "answer does not fit question 3")])
+
+    def test_fromCSVRows(self):
+        model = self._createModel()
+        model.setAnswers(3, ["x"])
+        changed = []
+        model.addObserver(changed.append)
+
+        # Test a whole results file is restored at once, with a single notification
+        rows = [
+            ["'question 2", "'no"],
+            ["'question 3", "'a", "'b"],
+            ["'question 4", "Question Unanswered"],
+            ["'question 5", "'-2"],
+            ["'question 6", "'5"],
+            ["'What is your name?", "'Reader"],
+        ]
+        self.slicer.assertEqual(model.fromCSVRows(rows), [(5, "answer does not fit question 6")])
+        self.slicer.assertEqual(changed, [None])
+        self.slicer.assertEqual([model.getValue(i) for i in range(6)], ["Reader", 1, 0b011, -1, -2, None])
+        self.slicer.assertEqual(model.unanswered(), [3, 5])
+
+        # Test it matches restoring row by row
+        other = self._createModel()
+        for row_number, index, row in other.matchCSVRows(rows)[0]:
+            other.fromCSV(index, row)
+        self.slicer.assertEqual([other.getValue(i) for i in range(6)], [model.getValue(i) for i in range(6)])
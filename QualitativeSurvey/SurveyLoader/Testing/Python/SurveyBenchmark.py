@@ -0,0 +1,302 @@
+"""
+Benchmarks loading, navigating, saving and resuming synthetic questionnaires, and writes
+the results as JSON so that they can be compared between commits. It needs Slicer:
+
+    Slicer --no-main-window --python-script SurveyBenchmark.py --questions 2000 --output results.json
+
+Run it with --help for the questionnaire and survey options. Every timing is in seconds.
+"""
+import argparse, csv, json, os, platform, random, subprocess, sys, tempfile, time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import Resources.Lib.SurveyParser as SurveyParser
+import Resources.Lib.SurveyCache as SurveyCache
+import Resources.Lib.SurveyImageCache as SurveyImageCache
+import Resources.Lib.SurveyWidgetStore as SurveyWidgetStore
+import Resources.Lib.SurveyQuestionnaire as SQ
+import qt, slicer
+
+
+DEFAULT_TYPE_MIX = 'open:1,multi_single:3,multi_multi:2,dropdown:1,slider:1,rating:2'
+
+SAMPLE_CHOICES = {
+    'multi_single': ['no', 'yes', 'prefer not to say'],
+    'multi_multi': ['a', 'b', 'c', 'd'],
+    'dropdown': ['low', 'medium', 'high'],
+    'slider': [0, 100],
+    'rating': [1, 10, 1],
+    'open': [],
+}
+
+
+def parseTypeMix(text:str) -> dict:
+    """Parse "type:weight,..." into {type: weight}."""
+    mix = {}
+    for entry in text.split(','):
+        type, _, weight = entry.partition(':')
+        if type not in SurveyParser.QUESTION_TYPES:
+            raise ValueError(f"unknown question type {type!r}")
+        mix[type] = float(weight) if weight else 1.0
+    return mix
+
+
+def writeSyntheticVolume(path:str, size:int, seed:int) -> None:
+    """Write a size^3 short NRRD volume of random noise."""
+    volume = np.random.default_rng(seed).integers(0, 1000, size=(size, size, size), dtype=np.int16)
+    header = (
+        "NRRD0004\n"
+        "type: short\n"
+        "dimension: 3\n"
+        "space: left-posterior-superior\n"
+        f"sizes: {size} {size} {size}\n"
+        "space directions: (1,0,0) (0,1,0) (0,0,1)\n"
+        "kinds: domain domain domain\n"
+        "endian: little\n"
+        "encoding: raw\n"
+        "space origin: (0,0,0)\n"
+        "\n"
+    )
+    with open(path, 'wb') as file:
+        file.write(header.encode('ascii'))
+        file.write(volume.astype('<i2').tobytes())
+
+
+def writeSyntheticQuestionnaire(directory:str, questions:int, type_mix:dict, volumes:int, volume_size:int, seed:int) -> str:
+    """
+    Write a questions CSV of `questions` questions and the `volumes` NRRD files it refers to.
+    The first two questions are the name and anonymity questions every questionnaire starts
+    with, the others are drawn from `type_mix` and show one or two of the volumes.
+    """
+    rng = random.Random(seed)
+    names = [f"synthetic_{i:04d}.nrrd" for i in range(volumes)]
+    for i, name in enumerate(names):
+        writeSyntheticVolume(os.path.join(directory, name), volume_size, seed + i)
+
+    types = list(type_mix)
+    weights = [type_mix[type] for type in types]
+    rows = [
+        ('What is your name?', 'open', [], []),
+        ('Do you want to take this survey anonymously?', 'multi_single', [], ['yes', 'no']),
+    ]
+    for num in range(2, questions):
+        type = rng.choices(types, weights)[0]
+        images = rng.sample(names, min(rng.choice([1, 2]), len(names))) if names else []
+        rows.append((f"Synthetic question {num + 1}", type, images, SAMPLE_CHOICES[type]))
+
+    csv_path = os.path.join(directory, 'questions.csv')
+    with open(csv_path, 'w', newline='') as csvFile:
+        writer = csv.writer(csvFile, quoting=csv.QUOTE_ALL)
+        writer.writerow(SurveyParser.COLUMNS)
+        writer.writerows((text, type, repr(images), repr(choices)) for text, type, images, choices in rows)
+    return csv_path
+
+
+def syntheticAnswers(item, rng:random.Random) -> list:
+    """Return valid answers to `item`, in the format of AnswerModel.setAnswers."""
+    if item.type == 'open':
+        return ['synthetic answer']
+    elif item.type in ('multi_single', 'dropdown'):
+        return [rng.choice(item.choices)]
+    elif item.type == 'multi_multi':
+        return rng.sample(item.choices, rng.randint(1, len(item.choices)))
+    elif item.type == 'slider':
+        return [str(rng.randint(item.choices[0], item.choices[1]))]
+    minimum, maximum, step = item.choices[:3]
+    return [str(rng.randrange(minimum, maximum + 1, step))]
+
+
+def summarize(durations:list) -> dict:
+    if not durations:
+        return {'count': 0}
+    values = np.array(durations)
+    return {
+        'count': len(values),
+        'mean': float(values.mean()),
+        'median': float(np.median(values)),
+        'p95': float(np.percentile(values, 95)),
+        'max': float(values.max()),
+        'total': float(values.sum()),
+    }
+
+
+def timeCall(function, *args, repeat:int=3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+#
+# TimedSurveyQuestionnaire
+#
+class TimedSurveyQuestionnaire(SQ.SurveyQuestionnaire):
+    """SurveyQuestionnaire recording how long its construction steps take."""
+    def __init__(self, *args, **kwargs):
+        self.timings = {}
+        super().__init__(*args, **kwargs)
+
+    def _timed(self, name:str, function):
+        start = time.perf_counter()
+        function()
+        self.timings[name] = time.perf_counter() - start
+
+    def _loadSurveyData(self):
+        self._timed('load_survey_data', super()._loadSurveyData)
+
+    def _generateQuestions(self):
+        self._timed('generate_questions', super()._generateQuestions)
+
+    def _formatQuestions(self):
+        self._timed('format_questions', super()._formatQuestions)
+
+
+def createContainers() -> tuple:
+    """Create stand-ins for the question, navigation and footer layouts of the module panel."""
+    panel = qt.QWidget()
+    panel_layout = qt.QVBoxLayout(panel)
+    layouts = []
+    for layout_type in (qt.QVBoxLayout, qt.QHBoxLayout, qt.QHBoxLayout):
+        container = qt.QWidget()
+        layout = layout_type(container)
+        panel_layout.addWidget(container)
+        layouts.append(layout)
+    # Questions are inserted before the last item of the questions layout
+    layouts[0].addStretch(1)
+    return panel, layouts
+
+
+def benchmarkNavigation(survey:SQ.SurveyQuestionnaire, order:list, rng:random.Random) -> dict:
+    """Answer the current question and move to the next of `order`, timing each move."""
+    steps = []
+    image_swaps = []
+    for num in order:
+        survey.answers.setAnswers(survey.current_num, syntheticAnswers(survey.questions_items[survey.current_num], rng))
+        swaps = survey.questions_items[survey.current_num].images != survey.questions_items[num].images
+        start = time.perf_counter()
+        survey.toQuestion(num)
+        slicer.app.processEvents()
+        duration = time.perf_counter() - start
+        steps.append(duration)
+        if swaps:
+            image_swaps.append(duration)
+    return {'all': summarize(steps), 'image_swaps': summarize(image_swaps)}
+
+
+def benchmarkSurvey(args) -> dict:
+    type_mix = parseTypeMix(args.types)
+    rng = random.Random(args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        csv_path = writeSyntheticQuestionnaire(directory, args.questions, type_mix, args.volumes, args.volume_size, args.seed)
+        results['generate_data'] = time.perf_counter() - start
+
+        results['parse'] = {
+            'parse_survey_csv': timeCall(SurveyParser.parseSurveyCSV, csv_path),
+            'indexed_survey': timeCall(SurveyParser.IndexedSurvey, csv_path),
+            'compile_survey': timeCall(SurveyCache.compileSurvey, csv_path, slicer.app.coreIOManager().fileType),
+        }
+        SurveyCache.writeCompiledSurvey(SurveyCache.compileSurvey(csv_path, slicer.app.coreIOManager().fileType))
+        results['parse']['load_compiled_survey_cached'] = timeCall(
+            SurveyCache.loadCompiledSurvey, csv_path, slicer.app.coreIOManager().fileType)
+
+        slicer.mrmlScene.Clear(0)
+        panel, (questions_layout, navigations_layout, footer_layout) = createContainers()
+        start = time.perf_counter()
+        survey = TimedSurveyQuestionnaire(csv_path, questions_layout, navigations_layout, footer_layout,
+                                          image_cache_mb=args.cache_mb, prefetch_depth=args.prefetch_depth,
+                                          lazy_widgets=args.lazy, widget_capacity=args.widget_capacity,
+                                          pooled_widgets=args.pooled, streaming=args.streaming,
+                                          # The answer journal would add file writes to the timings and leave files behind
+                                          autosave=False,
+                                          memory_map=not args.no_memory_map, persistent_nodes=args.persistent_nodes,
+                                          previews=args.previews)
+        survey.timings['total'] = time.perf_counter() - start
+        results['open_survey'] = survey.timings
+
+        try:
+            count = len(survey.questions_items)
+            steps = min(args.steps, count - 1)
+            results['navigation'] = {
+                'sequential': benchmarkNavigation(survey, list(range(1, steps + 1)), rng),
+                'random': benchmarkNavigation(survey, [rng.randrange(count) for _ in range(steps)], rng),
+            }
+
+            # Answer everything so that saving writes every row
+            for num in range(count):
+                if not survey.answers.isAnswered(num):
+                    survey.answers.setAnswers(num, syntheticAnswers(survey.questions_items[num], rng))
+            results_path = os.path.join(directory, 'results.csv')
+            save_seconds = timeCall(survey.saveProgress, results_path)
+            resume_seconds = timeCall(survey.resumeProgress, results_path)
+            results['save_resume'] = {
+                'rows': count,
+                'save_seconds': save_seconds,
+                'save_rows_per_second': count / save_seconds,
+                'resume_seconds': resume_seconds,
+                'resume_rows_per_second': count / resume_seconds,
+                'resume_unmatched': len(survey.resumeProgress(results_path)),
+            }
+        finally:
+            survey.close()
+            slicer.mrmlScene.Clear(0)
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'slicer_version': slicer.app.applicationVersion,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def parseArguments(argv:list):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=500, help="number of questions")
+    parser.add_argument('--types', default=DEFAULT_TYPE_MIX, help="question types and their weights, as type:weight,...")
+    parser.add_argument('--volumes', type=int, default=10, help="number of distinct NRRD volumes shown by the questions")
+    parser.add_argument('--volume-size', type=int, default=64, help="edge length in voxels of each cubic volume")
+    parser.add_argument('--steps', type=int, default=200, help="number of question changes timed per navigation pattern")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache-mb', type=int, default=SurveyImageCache.DEFAULT_BUDGET_MB)
+    parser.add_argument('--prefetch-depth', type=int, default=SurveyImageCache.DEFAULT_PREFETCH_DEPTH)
+    parser.add_argument('--lazy', action='store_true', help="create question widgets lazily")
+    parser.add_argument('--widget-capacity', type=int, default=SurveyWidgetStore.DEFAULT_CAPACITY)
+    parser.add_argument('--pooled', action='store_true', help="reuse question widgets of the same type")
+    parser.add_argument('--streaming', action='store_true', help="read questions on demand from an offset index")
+    parser.add_argument('--no-memory-map', action='store_true', help="read raw volumes into memory instead of mapping them")
+    parser.add_argument('--persistent-nodes', action='store_true', help="show images by swapping the data of the same volume nodes")
+    parser.add_argument('--previews', action='store_true', help="show images from their previews first, when built")
+    parser.add_argument('--output', help="JSON file to write, printed when omitted")
+    return parser.parse_args(argv)
+
+
+def main(argv:list) -> None:
+    args = parseArguments(argv)
+    report = {
+        'environment': environment(),
+        'config': vars(args),
+        'results': benchmarkSurvey(args),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
+    slicer.util.exit()
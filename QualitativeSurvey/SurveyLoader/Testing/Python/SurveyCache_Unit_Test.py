@@ -0,0 +1,77 @@
+from Resources.Lib.SurveyCache import *
+import os
+import pickle
+import tempfile
+import numpy as np
+
+
+class Test_SurveyCache():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def _writeQuestionnaire(self, directory, rows):
+        csv_path = os.path.join(directory, 'questions.csv')
+        with open(csv_path, 'w') as csvFile:
+            csvFile.write("question,type,images,choices\n" + "\n".join(rows) + "\n")
+        return csv_path
+
+    def test_CompiledSurveyCache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = self._writeQuestionnaire(directory, ['"q1","multi_single","[\'a.nrrd\']","[\'yes\', \'no\']"'])
+
+            # Test compiling writes a cache next to the questionnaire
+            compiled = loadCompiledSurvey(csv_path, lambda path: 'VolumeFile')
+            self.slicer.assertTrue(os.path.exists(cachePath(csv_path)))
+            self.slicer.assertEqual(compiled.items[0].choices, ['yes', 'no'])
+            self.slicer.assertFalse(compiled.imageInfo('a.nrrd')['exists'])
+
+            # Test the cache is used while the questionnaire is unchanged
+            cached = readCompiledSurvey(csv_path)
+            self.slicer.assertEqual(cached.signature, compiled.signature)
+            self.slicer.assertEqual(loadCompiledSurvey(csv_path).items[0].text, 'q1')
+
+            # Test a cache of another version is recompiled, even for an unchanged questionnaire
+            data = compiled.toData()
+            data['version'] = CACHE_VERSION - 1
+            with open(cachePath(csv_path), 'wb') as file:
+                pickle.dump(data, file)
+            self.slicer.assertEqual(readCompiledSurvey(csv_path), None)
+            self.slicer.assertEqual(loadCompiledSurvey(csv_path).items[0].text, 'q1')
+            self.slicer.assertEqual(readCompiledSurvey(csv_path).signature, compiled.signature)
+
+            # Test editing the questionnaire invalidates the cache
+            self._writeQuestionnaire(directory, ['"q2","open","[]","[]"', '"q3","open","[]","[1]"'])
+            compiled = loadCompiledSurvey(csv_path)
+            self.slicer.assertEqual([item.text for item in compiled.items], ['q2'])
+            self.slicer.assertEqual([row for row, message in compiled.errors], [3])
+
+    def test_CompiledSurveyRejectsCode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = self._writeQuestionnaire(directory, ['"q1","open","[]","[]"'])
+            with open(cachePath(csv_path), 'wb') as file:
+                pickle.dump({'version': CACHE_VERSION, 'payload': os.getcwd}, file)
+
+            # Test a cache referencing code is ignored and recompiled
+            self.slicer.assertEqual(readCompiledSurvey(csv_path), None)
+            self.slicer.assertEqual(loadCompiledSurvey(csv_path).items[0].text, 'q1')
+
+    def test_precomputeStatistics(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = self._writeQuestionnaire(directory, ['"q1","multi_single","[\'a.nrrd\', \'b.nrrd\']","[\'yes\', \'no\']"'])
+            voxels = np.arange(24, dtype='<i2').reshape(4, 3, 2)
+            with open(os.path.join(directory, 'a.nrrd'), 'wb') as file:
+                file.write(b"NRRD0004\ntype: short\ndimension: 3\nspace: left-posterior-superior\nsizes: 2 3 4\nendian: little\nencoding: raw\n\n" + voxels.tobytes())
+
+            # Test statistics are only computed once asked, for the images that can be read
+            self.slicer.assertEqual(loadCompiledSurvey(csv_path).imageInfo('a.nrrd')['statistics'], None)
+            precomputeStatistics(csv_path)
+            compiled = readCompiledSurvey(csv_path)
+            self.slicer.assertEqual(compiled.imageInfo('a.nrrd')['statistics']['range'], (0.0, 23.0))
+            self.slicer.assertEqual(compiled.imageInfo('b.nrrd')['statistics'], None)
+
+            # Test statistics are recomputed when the image changes
+            with open(os.path.join(directory, 'a.nrrd'), 'r+b') as file:
+                file.seek(-2, os.SEEK_END)
+                file.write(np.array([100], dtype='<i2').tobytes())
+            os.utime(os.path.join(directory, 'a.nrrd'), ns=(0, 0))
+            self.slicer.assertEqual(loadCompiledSurvey(csv_path).imageInfo('a.nrrd')['statistics']['range'], (0.0, 100.0))
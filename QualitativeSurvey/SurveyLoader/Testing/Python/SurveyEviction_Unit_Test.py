@@ -0,0 +1,62 @@
+from Resources.Lib.SurveyEviction import *
+from Resources.Lib.SurveyParser import SurveyItem
+import numpy as np
+
+
+class Test_SurveyEviction():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def _items(self, images):
+        return [SurveyItem(f"question {num}", "multi_single", names, ['yes', 'no']) for num, names in enumerate(images)]
+
+    def test_ImageUses(self):
+        items = self._items([['a', 'b'], ['c'], ['a'], [], ['b', 'c'], ['d']])
+        uses = ImageUses(items, lambda name: '/images/' + name)
+        self.slicer.assertEqual(uses.questions['/images/a'].tolist(), [0, 2])
+        self.slicer.assertEqual(len(uses), 4)
+
+        # Test next and last uses are counted from the current question, excluding it
+        self.slicer.assertEqual(uses.nextUse('/images/a', 0), 2)
+        self.slicer.assertEqual(uses.nextUse('/images/a', 2), np.inf)
+        self.slicer.assertEqual(uses.lastUse('/images/a', 4), 2)
+        self.slicer.assertEqual(uses.nextUse('/images/unknown', 0), np.inf)
+
+        # Test images shown furthest ahead are evicted first, then those not shown again, furthest back first
+        paths = ['/images/a', '/images/b', '/images/c', '/images/d']
+        self.slicer.assertEqual(uses.evictionOrder(paths, 3), ['/images/a', '/images/d', '/images/b', '/images/c'])
+        self.slicer.assertEqual(uses.evictionOrder(paths[:3], 5), ['/images/a', '/images/b', '/images/c'])
+
+        # Test uses follow the order of display, including questions shown twice and never
+        uses = ImageUses(items, order=[4, 0, 2, 4])
+        self.slicer.assertEqual(uses.questions['b'].tolist(), [0, 1, 3])
+        self.slicer.assertEqual(uses.questions['a'].tolist(), [1, 2])
+        self.slicer.assertNotIn('d', uses)
+
+    def test_simulateCache(self):
+        # Cycling through more images than fit is the worst case of least recently used
+        items = self._items([['a'], ['b'], ['c']] * 4)
+        sizes = {'a': 1, 'b': 1, 'c': 1}
+        sequence = list(range(len(items)))
+        lru = simulateCache(items, sequence, sizes, 2, 'lru')
+        belady = simulateCache(items, sequence, sizes, 2, 'belady')
+        self.slicer.assertEqual(lru['hits'], 0)
+        self.slicer.assertEqual(belady['hits'], 5)
+        self.slicer.assertEqual(belady['misses'] + belady['hits'], 12)
+        self.slicer.assertEqual(belady['bytes_read'], belady['misses'])
+
+        # Test the images of the current question are kept even over budget
+        result = simulateCache(self._items([['a', 'b', 'c']]), [0, 0], sizes, 1)
+        self.slicer.assertEqual(result['hits'], 3)
+
+        # Test next use never does worse than least recently used on a random survey
+        rng = np.random.default_rng(0)
+        names = [f"image{each}" for each in range(30)]
+        items = self._items([list(rng.choice(names, 2, replace=False)) for num in range(200)])
+        sizes = {name: int(rng.integers(1, 5)) for name in names}
+        results = compareBudgets(items, list(range(len(items))), sizes, [10, 20, sum(sizes.values())])
+        self.slicer.assertEqual([(each['budget_bytes'], each['policy']) for each in results[:2]], [(10, 'belady'), (10, 'lru')])
+        for belady, lru in zip(results[::2], results[1::2]):
+            self.slicer.assertGreaterEqual(belady['hit_rate'], lru['hit_rate'])
+        # Test both are the same once every image fits
+        self.slicer.assertEqual(results[-1]['hit_rate'], results[-2]['hit_rate'])
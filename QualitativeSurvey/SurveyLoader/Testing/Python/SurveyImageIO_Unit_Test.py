@@ -0,0 +1,149 @@
+from Resources.Lib.SurveyImageIO import *
+import Resources.Lib.SurveyImageIO as SurveyImageIO
+import numpy as np
+import os
+import tempfile
+import zlib
+
+
+class Test_SurveyImageIO():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def _voxels(self):
+        return (np.arange(4 * 5 * 6) * 7 % 300).astype('<i2').reshape(6, 5, 4)
+
+    def _writeNrrd(self, path, voxels, endian='little'):
+        header = ("NRRD0004\ntype: short\ndimension: 3\nspace: left-posterior-superior\nsizes: 4 5 6\n"
+                  "space directions: (2,0,0) (0,3,0) (0,0,4)\nspace origin: (1,2,3)\n"
+                  f"endian: {endian}\nencoding: raw\n\n")
+        with open(path, 'wb') as file:
+            file.write(header.encode() + voxels.astype('>i2' if endian == 'big' else '<i2').tobytes())
+
+    def _writeMetaImage(self, path, voxels, compressed=False):
+        header = ("ObjectType = Image\nNDims = 3\nBinaryData = True\nBinaryDataByteOrderMSB = False\n"
+                  f"CompressedData = {compressed}\nTransformMatrix = 1 0 0 0 1 0 0 0 1\nOffset = 1 2 3\n"
+                  "ElementSpacing = 2 3 4\nDimSize = 4 5 6\nElementType = MET_SHORT\nElementDataFile = LOCAL\n")
+        data = voxels.tobytes()
+        with open(path, 'wb') as file:
+            file.write(header.encode() + (zlib.compress(data) if compressed else data))
+
+    def test_memoryMappedVolumes(self):
+        voxels = self._voxels()
+        with tempfile.TemporaryDirectory() as directory:
+            nrrd_path = os.path.join(directory, 'raw.nrrd')
+            self._writeNrrd(nrrd_path, voxels)
+
+            # Test raw voxels are mapped rather than read, and stay writable without changing the file
+            volume = readImage(nrrd_path)
+            self.slicer.assertIsInstance(volume.array, np.memmap)
+            self.slicer.assertTrue(np.array_equal(volume.array, voxels))
+            volume.array[0, 0, 0] = -1
+            self.slicer.assertEqual(readImage(nrrd_path, memory_map=False).array[0, 0, 0], voxels[0, 0, 0])
+            del volume
+
+            # Test data that cannot be mapped is read into a plain array
+            big_path = os.path.join(directory, 'big.nrrd')
+            self._writeNrrd(big_path, voxels, endian='big')
+            volume = readImage(big_path)
+            self.slicer.assertNotIsInstance(volume.array, np.memmap)
+            self.slicer.assertTrue(np.array_equal(volume.array, voxels))
+
+            # Test MetaImage volumes, local and compressed, give the same voxels and geometry as NRRD
+            expected = readImage(nrrd_path).ijk_to_ras
+            for name, compressed in [('raw.mha', False), ('compressed.mha', True)]:
+                path = os.path.join(directory, name)
+                self._writeMetaImage(path, voxels, compressed)
+                volume = readImage(path)
+                self.slicer.assertEqual(isinstance(volume.array, np.memmap), not compressed)
+                self.slicer.assertTrue(np.array_equal(volume.array, voxels))
+                self.slicer.assertTrue(np.allclose(volume.ijk_to_ras, expected))
+                # Mapped files cannot be deleted on Windows
+                del volume
+            self.slicer.assertEqual(readImageHeader(os.path.join(directory, 'raw.mha'))['dimsize'], '4 5 6')
+
+            # Test truncated files are reported rather than mapped past their end
+            truncated_path = os.path.join(directory, 'truncated.nrrd')
+            self._writeNrrd(truncated_path, voxels)
+            with open(truncated_path, 'r+b') as file:
+                file.truncate(os.path.getsize(truncated_path) - 10)
+            with self.slicer.assertRaises(UnsupportedImageError):
+                readImage(truncated_path)
+            with self.slicer.assertRaises(UnsupportedImageError):
+                readImage(truncated_path, memory_map=False)
+
+            # Test headers Slicer may still read are reported as unsupported, never as other errors
+            header = ("NRRD0004\ntype: short\ndimension: 3\nspace: left-posterior-superior\nsizes: 4 5 6\n"
+                      "space directions: (2,0,0) (0,3,0) (0,0,4)\nencoding: raw\n")
+            invalid_headers = {
+                'sizes.nrrd': header.replace("sizes: 4 5 6\n", ""),
+                'dimension.nrrd': header.replace("dimension: 3\n", ""),
+                'space.nrrd': header.replace("space: left-posterior-superior\n", ""),
+                'directions.nrrd': header.replace("(0,3,0)", "(0,three,0)"),
+                'list.nrrd': header + "data file: LIST\nslice1.raw\n",
+                'pattern.nrrd': header + "data file: slice%03d.raw 1 6 1 2\n",
+                'detached.nrrd': header + "data file: missing.raw\n",
+            }
+            for name, text in invalid_headers.items():
+                path = os.path.join(directory, name)
+                with open(path, 'wb') as file:
+                    file.write(text.encode() + b"\n" + voxels.tobytes())
+                with self.slicer.assertRaises(UnsupportedImageError, msg=name):
+                    readImage(path)
+            with self.slicer.assertRaises(UnsupportedImageError):
+                readImageHeader(os.path.join(directory, 'missing.nrrd'))
+
+    def test_windowRange(self):
+        # Test outliers are left out of the window
+        voxels = np.zeros((40, 10, 10), dtype='<i2')
+        voxels[:] = np.arange(100).reshape(10, 10)
+        voxels[0, 0, 0] = 30000
+        self.slicer.assertEqual(windowRange(voxels, (0.0, 1.0)), (0.0, 30000.0))
+        low, high = windowRange(voxels)
+        self.slicer.assertLess(high, 100)
+        self.slicer.assertGreaterEqual(low, 0)
+
+        # Test the window of a volume is computed once, on sampled slices of a mapped file
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'raw.nrrd')
+            self._writeNrrd(path, self._voxels())
+            volume = readImage(path)
+            window = volume.windowRange()
+            self.slicer.assertEqual(window, (float(np.quantile(self._voxels(), 0.001)), float(np.quantile(self._voxels(), 0.999))))
+            self.slicer.assertIs(volume.windowRange(), window)
+            del volume
+
+    def test_imageStatistics(self):
+        # Test counts are gathered over several chunks, and the outlier left out of the window
+        voxels = np.zeros((40, 10, 10), dtype='<i2')
+        voxels[:] = np.arange(100).reshape(10, 10)
+        voxels[0, 0, 0] = 30000
+        chunk = SurveyImageIO.STATISTICS_CHUNK_VOXELS
+        try:
+            SurveyImageIO.STATISTICS_CHUNK_VOXELS = 300
+            statistics = imageStatistics(voxels, bins=4)
+        finally:
+            SurveyImageIO.STATISTICS_CHUNK_VOXELS = chunk
+        self.slicer.assertEqual(statistics['range'], (0.0, 30000.0))
+        self.slicer.assertEqual(sum(statistics['histogram']), voxels.size)
+        self.slicer.assertEqual(statistics['histogram'], [voxels.size - 1, 0, 0, 1])
+        low, high = statistics['window']
+        self.slicer.assertLess(high, 99 + 30000 / STATISTICS_BINS)
+        self.slicer.assertGreaterEqual(low, 0)
+
+        # Test integer images with fewer values than bins are counted exactly
+        statistics = imageStatistics(voxels[1:])
+        self.slicer.assertEqual(statistics['range'], (0.0, 99.0))
+        self.slicer.assertTrue(np.allclose(statistics['window'], np.quantile(voxels[1:], WINDOW_FRACTIONS), atol=0.5))
+
+        # Test the window of floating point images leaves out the fractions of values, ignoring NaN
+        rng = np.random.default_rng(0)
+        voxels = rng.normal(100, 20, (20, 30, 30)).astype(np.float32)
+        voxels[0, 0, :5] = np.nan
+        values = voxels[np.isfinite(voxels)]
+        low, high = imageStatistics(voxels)['window']
+        self.slicer.assertAlmostEqual(np.sum(values < low), values.size * WINDOW_FRACTIONS[0], delta=1)
+        self.slicer.assertAlmostEqual(np.sum(values > high), values.size * (1 - WINDOW_FRACTIONS[1]), delta=1)
+
+        # Test empty images have an empty window
+        self.slicer.assertEqual(imageStatistics(np.zeros((0, 2, 2)))['window'], (0.0, 0.0))
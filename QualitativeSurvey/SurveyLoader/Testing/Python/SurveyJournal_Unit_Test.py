@@ -0,0 +1,135 @@
+from Resources.Lib.SurveyJournal import *
+from Resources.Lib.SurveyAnswers import AnswerModel
+from Resources.Lib.SurveyParser import SurveyItem, IndexedSurvey
+import csv
+import os
+import tempfile
+
+
+class Test_SurveyJournal():
+    def __init__(self, slicer):
+        self.slicer = slicer
+        self.items = [
+            SurveyItem("name", 'open', [], []),
+            SurveyItem("anonymous", 'multi_single', [], ['yes', 'no']),
+            SurveyItem("which", 'multi_multi', [], ['a', 'b', 'c']),
+            SurveyItem("rate", 'rating', [], [1, 10, 1]),
+        ]
+
+    def test_AnswerJournal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'questions.csv')
+            answers = AnswerModel(self.items)
+            journal = AnswerJournal(csv_path, answers, compact_every=100)
+            self.slicer.assertEqual(journal.restore(), 0)
+            self.slicer.assertTrue(journal.open())
+            answers.setAnswers(0, ["Reader"])
+            answers.setAnswers(2, ['a', 'c'])
+            answers.setAnswers(3, ['7'])
+
+            # Test a crash, with a record cut short, only loses that record
+            journal.file.write('[1, ')
+            journal.file.close()
+            restored = AnswerModel(self.items)
+            self.slicer.assertEqual(AnswerJournal(csv_path, restored).restore(), 3)
+            self.slicer.assertEqual([restored.getValue(i) for i in range(4)], ["Reader", -1, 0b101, 7])
+
+            # Test compaction writes the results format and empties the journal, once there were
+            # as many changes as questions
+            os.remove(journalPath(csv_path))
+            answers = AnswerModel(self.items)
+            journal = AnswerJournal(csv_path, answers, compact_every=2)
+            self.slicer.assertEqual(journal.compact_after, 4)
+            journal.open()
+            answers.setAnswers(1, ['no'])
+            answers.setAnswers(3, ['2'])
+            answers.setAnswers(2, ['a'])
+            self.slicer.assertFalse(os.path.exists(autosavePath(csv_path)))
+            answers.setAnswers(2, ['b'])
+            answers.setAnswers(3, ['4'])
+            journal.file.close()
+            with open(autosavePath(csv_path)) as file:
+                self.slicer.assertEqual(file.readlines()[1], "\"'anonymous\",\"'no\"\n")
+            with open(journalPath(csv_path)) as file:
+                self.slicer.assertEqual(len(file.readlines()), 2)
+
+            restored = AnswerModel(self.items)
+            AnswerJournal(csv_path, restored).restore()
+            self.slicer.assertEqual([restored.getValue(i) for i in range(4)], ["", 1, 0b010, 4])
+
+            # Test the journal of another questionnaire is set aside
+            other = AnswerModel(self.items[:2])
+            journal = AnswerJournal(csv_path, other)
+            self.slicer.assertEqual(journal.restore(), 0)
+            journal.open()
+            journal.close()
+            self.slicer.assertTrue(os.path.exists(journalPath(csv_path) + '.old'))
+
+    def test_AnswerJournalEditedQuestionnaire(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'questions.csv')
+            answers = AnswerModel(self.items)
+            journal = AnswerJournal(csv_path, answers, compact_every=2)
+            journal.open()
+            answers.setAnswers(1, ['no'])
+            answers.setAnswers(2, ['c'])
+            answers.setAnswers(3, ['9'])
+            journal.file.close()
+
+            # Test answers are not restored once the questions changed, even with the same count
+            edited = list(self.items)
+            edited[2] = SurveyItem("which", 'multi_multi', [], ['a', 'b'])
+            restored = AnswerModel(edited)
+            self.slicer.assertEqual(AnswerJournal(csv_path, restored).restore(), 0)
+            self.slicer.assertFalse(restored.isAnswered(2))
+
+            # Test journaled values that do not fit their question are skipped, not stored
+            with open(journalPath(csv_path), 'a') as file:
+                file.write('[1, 2]\n[3, 4.5]\n[7, 0]\n[3, 5]\n')
+            restored = AnswerModel(self.items)
+            self.slicer.assertEqual(AnswerJournal(csv_path, restored).restore(), 3)
+            self.slicer.assertEqual([restored.getValue(i) for i in range(4)], ["", 1, 0b100, 5])
+            self.slicer.assertEqual(restored.getAnswers(1), ['no'])
+
+    def test_AnswerJournalDiscard(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'questions.csv')
+            answers = AnswerModel(self.items)
+            journal = AnswerJournal(csv_path, answers, compact_every=2)
+            journal.open()
+            answers.setAnswers(0, ["Reader"])
+            answers.setAnswers(1, ['no'])
+            answers.setAnswers(3, ['4'])
+
+            # Test discarded answers are not restored, and later changes are still journaled
+            journal.discard()
+            self.slicer.assertFalse(os.path.exists(autosavePath(csv_path)))
+            self.slicer.assertEqual(AnswerJournal(csv_path, AnswerModel(self.items)).restore(), 0)
+            answers.setAnswers(3, ['5'])
+            journal.file.close()
+            restored = AnswerModel(self.items)
+            self.slicer.assertEqual(AnswerJournal(csv_path, restored).restore(), 1)
+            self.slicer.assertEqual([restored.getValue(i) for i in range(4)], ["", -1, 0, 5])
+
+    def test_AnswerJournalStreaming(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'questions.csv')
+            with open(csv_path, 'w', newline='') as csvFile:
+                writer = csv.writer(csvFile)
+                writer.writerow(['question', 'type', 'images', 'choices'])
+                writer.writerows([item.text, item.type, str(item.images), str(item.choices)] for item in self.items)
+
+            # Test compacting and restoring a streamed survey reads its questions in one pass, never one by one
+            def readItem(index):
+                raise AssertionError(f"question {index + 1} was read on its own")
+            answers = AnswerModel(IndexedSurvey(csv_path))
+            answers.items._readItem = readItem
+            journal = AnswerJournal(csv_path, answers, compact_every=1)
+            journal.open()
+            for index, value in [(0, "Reader"), (2, 0b011), (3, 8), (1, 0), (3, 6)]:
+                answers.setValue(index, value)
+            journal.close()
+            restored = AnswerModel(IndexedSurvey(csv_path))
+            restored.items._readItem = readItem
+            self.slicer.assertEqual(AnswerJournal(csv_path, restored).restore(), 4)
+            self.slicer.assertEqual([restored.getValue(i) for i in range(4)], ["Reader", 0, 0b011, 6])
@@ -0,0 +1,62 @@
+"""
+Compares SurveyParser with the previous ast.literal_eval parsing of questions CSVs, on
+questionnaires built by repeating the example questionnaires. Run it with Slicer's Python:
+
+    PythonSlicer SurveyParser_Benchmark.py [number of copies]
+"""
+import ast, csv, os, sys, tempfile, time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import Resources.Lib.SurveyParser as SurveyParser
+
+example_dir = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', 'Resources', 'SurveyQuestions', 'example_questionnaire'))
+
+
+def parseWithLiteralEval(csv_path:str) -> list:
+    with open(csv_path, newline='') as csvFile:
+        reader = csv.reader(csvFile)
+        next(reader)
+        return [(text, type, ast.literal_eval(images), ast.literal_eval(choices)) for text, type, images, choices in reader]
+
+
+def writeRepeatedQuestionnaire(source_path:str, csv_path:str, copies:int) -> int:
+    with open(source_path, newline='') as csvFile:
+        rows = list(csv.reader(csvFile))
+    with open(csv_path, 'w', newline='') as csvFile:
+        writer = csv.writer(csvFile, quoting=csv.QUOTE_ALL)
+        writer.writerow(rows[0])
+        for _ in range(copies):
+            writer.writerows(rows[1:])
+    return (len(rows) - 1) * copies
+
+
+def timeCall(function, *args, repeat:int=3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmarkParser(copies:int=2500) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ['questions.csv', 'questions_more_types.csv']:
+            csv_path = os.path.join(directory, name)
+            rows = writeRepeatedQuestionnaire(os.path.join(example_dir, name), csv_path, copies)
+            results[name] = {
+                'rows': rows,
+                'literal_eval_seconds': timeCall(parseWithLiteralEval, csv_path),
+                'survey_parser_seconds': timeCall(SurveyParser.parseSurveyCSV, csv_path),
+            }
+    return results
+
+
+if __name__ == '__main__':
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 2500
+    for name, result in benchmarkParser(copies).items():
+        speedup = result['literal_eval_seconds'] / result['survey_parser_seconds']
+        print(f"{name}: {result['rows']} rows, literal_eval {result['literal_eval_seconds']:.3f}s, "
+              f"SurveyParser {result['survey_parser_seconds']:.3f}s ({speedup:.1f}x)")
@@ -0,0 +1,111 @@
+from Resources.Lib.SurveyParser import *
+import os
+import tempfile
+
+example_dir = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', 'Resources', 'SurveyQuestions', 'example_questionnaire'))
+
+
+class Test_SurveyParser():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def test_parseList(self):
+        # Test the list formats used in questionnaires
+        self.slicer.assertEqual(parseList("[]"), [])
+        self.slicer.assertEqual(parseList("['RegLib_C01_1.nrrd', 'RegLib_C01_2.nrrd']"), ['RegLib_C01_1.nrrd', 'RegLib_C01_2.nrrd'])
+        self.slicer.assertEqual(parseList("[-2, 100, 'kfc']"), [-2, 100, 'kfc'])
+        self.slicer.assertEqual(parseList("""["it\\'s", 'a, b',]"""), ["it's", 'a, b'])
+
+        # Test anything other than a list of strings and ints is rejected
+        for text in ["", "'a'", "[a]", "['a' 'b']", "[1.5]", "[__import__('os')]", "[[1]]"]:
+            self.slicer.assertRaises(ValueError, parseList, text)
+
+    def test_validateItem(self):
+        self.slicer.assertEqual(validateItem('multi_single', [], ['yes', 'no']), [])
+        self.slicer.assertEqual(validateItem('rating', ['a.nrrd'], [1, 10, 1]), [])
+        self.slicer.assertTrue(validateItem('non-existant question type', [], []))
+        self.slicer.assertTrue(validateItem('open', [], ['a']))
+        self.slicer.assertTrue(validateItem('dropdown', [], []))
+        self.slicer.assertTrue(validateItem('multi_multi', [], ['a', 'a']))
+        self.slicer.assertTrue(validateItem('slider', [], [5, 1]))
+        self.slicer.assertTrue(validateItem('rating', [], [1, 10, 0]))
+
+    def test_exampleQuestionnaires(self):
+        # Test the example questionnaires parse
+        items = readSurveyItems(os.path.join(example_dir, 'questions_more_types.csv'))
+        self.slicer.assertEqual([item.type for item in items],
+            ['open', 'multi_single', 'open', 'multi_single', 'multi_multi', 'dropdown', 'slider', 'rating'])
+        self.slicer.assertEqual(items[6].choices, [-2, 100, 'kfc'])
+        self.slicer.assertEqual(len(readSurveyItems(os.path.join(example_dir, 'questions.csv'))), 8)
+
+        # Test the invalid example reports its row
+        items, errors = parseSurveyCSV(os.path.join(example_dir, 'bad_question.csv'))
+        self.slicer.assertEqual(items, [])
+        self.slicer.assertEqual([row for row, message in errors], [2])
+
+    def test_allErrorsReported(self):
+        rows = [
+            'question,type,images,choices',
+            '"q1","open","[]","[]"',
+            '"q2","multi_single","[]","[\'yes\', no]"',
+            '"q3","rating","[\'a.nrrd\']","[1, 10]"',
+            '"q4","open","[]"',
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'questions.csv')
+            with open(csv_path, 'w') as csvFile:
+                csvFile.write("\n".join(rows))
+
+            items, errors = parseSurveyCSV(csv_path)
+            self.slicer.assertEqual(len(items), 1)
+            self.slicer.assertEqual([row for row, message in errors], [3, 4, 5])
+
+            with self.slicer.assertRaises(SurveyParseError) as context:
+                readSurveyItems(csv_path)
+            self.slicer.assertEqual(len(context.exception.errors), 3)
+
+    def test_IndexedSurvey(self):
+        # Test the index matches the full parse, including quoted line breaks and blank lines
+        rows = [
+            'question,type,images,choices',
+            '"q1","open","[]","[]"',
+            '',
+            '"q2 spans\nthree\nlines","multi_multi","[\'a.nrrd\']","[\'x\', \'y\', \'z\']"',
+            '"q3 with ""quotes""","rating","[]","[1, 10, 1]"',
+            '"q4","dropdown","[]","[\'yes\', \'no\']"',
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'questions.csv')
+            with open(csv_path, 'w', newline='') as csvFile:
+                csvFile.write("\n".join(rows))
+
+            expected = readSurveyItems(csv_path)
+            indexed = IndexedSurvey(csv_path, cache_size=2)
+            self.slicer.assertEqual(indexed.errors, [])
+            self.slicer.assertEqual(len(indexed), len(expected))
+            self.slicer.assertEqual(indexed.types, [item.type for item in expected])
+            self.slicer.assertEqual(indexed.multi_width, 3)
+            for index in [3, 0, 2, 1, -1]:
+                self.slicer.assertEqual(indexed[index].text, expected[index].text)
+                self.slicer.assertEqual(indexed[index].choices, expected[index].choices)
+            self.slicer.assertEqual([item.text for item in indexed], [item.text for item in expected])
+            self.slicer.assertRaises(IndexError, indexed.__getitem__, 4)
+
+            # Test only the last items are kept
+            self.slicer.assertEqual(len(indexed._items), 2)
+
+            # Test non-ASCII questions read the same in both modes whatever the locale, ignoring a byte order mark
+            with open(csv_path, 'w', newline='', encoding='utf-8-sig') as csvFile:
+                csvFile.write('question,type,images,choices\n"Qualité du débruitage ?","multi_single","[]","[\'très bonne\', \'nulle\']"\n')
+            expected = readSurveyItems(csv_path)
+            self.slicer.assertEqual(expected[0].text, "Qualité du débruitage ?")
+            self.slicer.assertEqual(IndexedSurvey(csv_path)[0].text, expected[0].text)
+            self.slicer.assertEqual(IndexedSurvey(csv_path)[0].choices, ['très bonne', 'nulle'])
+            with open(csv_path, 'w', newline='') as csvFile:
+                csvFile.write("\n".join(rows))
+
+            # Test invalid rows are reported with their line number
+            with open(csv_path, 'a') as csvFile:
+                csvFile.write('\n"q5","slider","[]","[5]"\n')
+            self.slicer.assertEqual([row for row, message in IndexedSurvey(csv_path).errors], [9])
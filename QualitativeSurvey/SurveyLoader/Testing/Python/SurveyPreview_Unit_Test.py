@@ -0,0 +1,63 @@
+from Resources.Lib.SurveyPreview import *
+import Resources.Lib.SurveyPreview as SurveyPreview
+from Resources.Lib.SurveyImageIO import VolumeArray, readImage, writeNrrd
+import numpy as np
+import os
+import tempfile
+
+
+class Test_SurveyPreview():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def _volume(self, path='image.nrrd'):
+        ijk_to_ras = np.array([[-2, 0, 0, 5], [0, -3, 0, 6], [0, 0, 4, 7], [0, 0, 0, 1.0]])
+        return VolumeArray(path, (np.arange(7 * 9 * 10) % 50).astype('<i2').reshape(7, 9, 10), ijk_to_ras)
+
+    def test_downsample(self):
+        volume = self._volume()
+        preview = downsample(volume, 2)
+
+        # Test blocks are averaged, including the partial blocks at the end of odd sized axes
+        self.slicer.assertEqual(preview.array.shape, (4, 5, 5))
+        self.slicer.assertEqual(preview.array.dtype, volume.array.dtype)
+        self.slicer.assertEqual(preview.array[0, 0, 0], np.rint(volume.array[:2, :2, :2].mean()))
+        self.slicer.assertEqual(preview.array[-1, -1, -1], np.rint(volume.array[6:, 8:, 8:].mean()))
+
+        # Test preview voxels are centred on the source voxels they average
+        centre = preview.ijk_to_ras @ [1, 1, 1, 1]
+        self.slicer.assertTrue(np.allclose(centre, volume.ijk_to_ras @ [2.5, 2.5, 2.5, 1]))
+
+        # Test averaging in chunks of slices gives the same preview
+        chunk = SurveyPreview.PREVIEW_CHUNK_SLICES
+        try:
+            SurveyPreview.PREVIEW_CHUNK_SLICES = 1
+            self.slicer.assertTrue(np.array_equal(downsample(volume, 2).array, preview.array))
+        finally:
+            SurveyPreview.PREVIEW_CHUNK_SLICES = chunk
+
+    def test_buildPreviews(self):
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, 'image.nrrd')
+            writeNrrd(image_path, self._volume(image_path))
+
+            # Test written volumes are read back identically, and mapped
+            volume = readImage(image_path)
+            self.slicer.assertIsInstance(volume.array, np.memmap)
+            self.slicer.assertTrue(np.array_equal(volume.array, self._volume().array))
+            self.slicer.assertTrue(np.allclose(volume.ijk_to_ras, self._volume().ijk_to_ras))
+            del volume
+
+            # Test previews are built next to the images, and listed coarsest first
+            self.slicer.assertEqual(availablePreviews(image_path), [])
+            result = buildPreviews([image_path, os.path.join(directory, 'missing.nrrd')])
+            self.slicer.assertEqual((result['built'], result['current'], len(result['skipped'])), (1, 0, 1))
+            self.slicer.assertEqual(availablePreviews(image_path), [previewPath(image_path, 4), previewPath(image_path, 2)])
+            self.slicer.assertEqual(readImage(previewPath(image_path, 4)).array.shape, (2, 3, 3))
+
+            # Test up to date previews are kept, and previews older than their image are not used
+            self.slicer.assertEqual(buildPreviews([image_path])['current'], 1)
+            os.utime(previewPath(image_path, 2), ns=(0, 0))
+            self.slicer.assertEqual(availablePreviews(image_path), [previewPath(image_path, 4)])
+            self.slicer.assertEqual(buildPreviews([image_path])['built'], 1)
+            self.slicer.assertEqual(len(availablePreviews(image_path)), 2)
@@ -0,0 +1,79 @@
+from Resources.Lib.SurveyRanking import *
+from Resources.Lib.SurveyAnswers import AnswerModel
+from Resources.Lib.SurveyParser import SurveyItem
+import numpy as np
+
+
+class Test_SurveyRanking():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def test_comparisonQuestions(self):
+        items = [
+            SurveyItem("Do you want to take this survey anonymously?", "multi_single", [], ['yes', 'no']),
+            SurveyItem("which is sharper", "multi_single", ['RegLib_C01_1.nrrd', 'RegLib_C01_2.nrrd'], ['C01_1', 'C01_2', 'Neither']),
+            SurveyItem("which is less noisy", "dropdown", ['RegLib_C01_1.nrrd', 'RegLib_C01_2.nrrd'], ['C01_2', 'C01_1']),
+            SurveyItem("comments", "open", ['RegLib_C01_1.nrrd', 'RegLib_C01_2.nrrd'], []),
+            # Choices that only appear within the image names do not make a comparison
+            SurveyItem("how many lesions", "multi_single", ['RegLib_C01_1.nrrd', 'RegLib_C01_2.nrrd'], ['0', '1', '2']),
+            SurveyItem("which series", "multi_single", ['RegLib_C01_1.nrrd', 'RegLib_C01_2.nrrd'], ['C0', 'C01']),
+        ]
+        # Test the images are ordered so that the first choice picks the first image
+        self.slicer.assertEqual(comparisonQuestions(items), [
+            (1, 'RegLib_C01_1.nrrd', 'RegLib_C01_2.nrrd'),
+            (2, 'RegLib_C01_2.nrrd', 'RegLib_C01_1.nrrd'),
+        ])
+
+        models = [AnswerModel(items), AnswerModel(items)]
+        models[0].setAnswers(1, ['C01_1'])
+        models[0].setAnswers(2, ['C01_1'])
+        models[1].setAnswers(1, ['Neither'])
+        first, second, outcome, names = pairwiseOutcomes(models, comparisonQuestions(items))
+        self.slicer.assertEqual(names, ['RegLib_C01_1', 'RegLib_C01_2'])
+        self.slicer.assertEqual(list(zip(first.tolist(), second.tolist(), outcome.tolist())),
+                                [(0, 1, FIRST_WINS), (1, 0, SECOND_WINS), (0, 1, TIE)])
+
+        # Test competitors can be what produced the images
+        first, second, outcome, names = pairwiseOutcomes(models, comparisonQuestions(items), lambda image: image[-6])
+        self.slicer.assertEqual(names, ['1', '2'])
+
+    def test_namesImage(self):
+        self.slicer.assertTrue(namesImage(' C01_1 ', 'RegLib_C01_1'))
+        self.slicer.assertTrue(namesImage('mr-head', 'MR-head'))
+        self.slicer.assertFalse(namesImage('1', 'RegLib_C01'))
+        self.slicer.assertFalse(namesImage('_1', 'RegLib_C01_1'))
+        self.slicer.assertFalse(namesImage('', 'RegLib_C01_1'))
+
+    def test_PairwiseRanking(self):
+        # Simulate comparisons from known strengths and tie parameter
+        rng = np.random.default_rng(0)
+        log_strengths = np.array([1.0, 0.5, 0.0, -1.5])
+        tie = 0.5
+        first, second = rng.integers(0, 4, 20000), rng.integers(0, 4, 20000)
+        a, b = np.exp(log_strengths[first]), np.exp(log_strengths[second])
+        draw = rng.random(len(first)) * (a + b + tie * np.sqrt(a * b))
+        outcome = np.where(draw < a, FIRST_WINS, np.where(draw < a + b, SECOND_WINS, TIE))
+
+        ranking = PairwiseRanking(['a', 'b', 'c', 'd'])
+        # Test outcomes can be added in parts
+        ranking.addOutcomes(first[:100], second[:100], outcome[:100])
+        ranking.addOutcomes(first[100:], second[100:], outcome[100:])
+        self.slicer.assertEqual(ranking.comparisons, int(np.sum(first != second)))
+        self.slicer.assertTrue(ranking.fit())
+
+        # Test the strengths are recovered within their confidence intervals
+        self.slicer.assertAlmostEqual(ranking.tie, tie, delta=0.05)
+        results = ranking.ranking()
+        self.slicer.assertEqual([name for name, *rest in results], ['a', 'b', 'c', 'd'])
+        centred = dict(zip('abcd', log_strengths - log_strengths.mean()))
+        for name, estimate, low, high in results:
+            self.slicer.assertTrue(low < centred[name] < high)
+            self.slicer.assertTrue(high - low < 0.2)
+        self.slicer.assertAlmostEqual(sum(ranking.probability(0, 3)), 1.0)
+
+        # Test a competitor that never wins keeps a finite strength
+        ranking = PairwiseRanking(['a', 'b'])
+        ranking.addOutcomes([0, 0, 1], [1, 1, 0], [FIRST_WINS, FIRST_WINS, SECOND_WINS])
+        self.slicer.assertTrue(ranking.fit())
+        self.slicer.assertTrue(np.all(np.isfinite(np.log(ranking.strengths))))
+        self.slicer.assertEqual(ranking.tie, 0.0)
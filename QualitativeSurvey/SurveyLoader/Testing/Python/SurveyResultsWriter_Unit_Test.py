@@ -0,0 +1,107 @@
+from Resources.Lib.SurveyResultsWriter import *
+from Resources.Lib.SurveyAnswers import AnswerModel
+from Resources.Lib.SurveyParser import SurveyItem, IndexedSurvey
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+
+
+class Test_SurveyResultsWriter():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def _createModel(self):
+        items = [
+            SurveyItem("What is your name?", "open", [], []),
+            SurveyItem("question 2", "multi_multi", [], ['a', 'b', 'c']),
+            SurveyItem("question 3", "rating", [], [1, 10, 1]),
+            SurveyItem("question 4", "dropdown", [], ['x', 'y']),
+        ]
+        model = AnswerModel(items)
+        model.setAnswers(0, ["Reader"])
+        model.setAnswers(1, ["a", "c"])
+        model.setAnswers(2, ["7"])
+        return model
+
+    def test_writerForPath(self):
+        self.slicer.assertIsInstance(writerForPath("results.csv"), LegacyCSVWriter)
+        self.slicer.assertIsInstance(writerForPath("results.long.csv"), LongCSVWriter)
+        self.slicer.assertIsInstance(writerForPath("results.jsonl"), JSONLinesWriter)
+        self.slicer.assertIsInstance(writerForPath("results.sqlite"), SQLiteWriter)
+        self.slicer.assertIsNone(writerForPath("results.txt"))
+        self.slicer.assertEqual(writerForPath("/tmp/reader1.long.csv").respondent, "reader1")
+
+        # Test only the legacy CSV format can be loaded back
+        self.slicer.assertTrue(canResume("Results/reader1.CSV"))
+        self.slicer.assertFalse(canResume("Results/reader1.long.csv"))
+        self.slicer.assertFalse(canResume("Results/reader1.jsonl"))
+
+    def test_ResultsWriters(self):
+        model = self._createModel()
+        with tempfile.TemporaryDirectory() as directory:
+            # Test the legacy format is unchanged
+            path = os.path.join(directory, 'reader1.csv')
+            writerForPath(path).write(model, skip={0})
+            with open(path) as file:
+                self.slicer.assertEqual(file.read(), "".join(model.toCSV(index) for index in range(1, 4)))
+
+            # Test the long format has one row per answer
+            path = os.path.join(directory, 'reader1.long.csv')
+            writerForPath(path).write(model)
+            with open(path, newline='') as file:
+                rows = list(csv.reader(file))
+            self.slicer.assertEqual(rows[0], LongCSVWriter.columns)
+            self.slicer.assertEqual(rows[2:4], [['reader1', '2', 'question 2', 'multi_multi', 'a'], ['reader1', '2', 'question 2', 'multi_multi', 'c']])
+            self.slicer.assertEqual(rows[-1], ['reader1', '4', 'question 4', 'dropdown', ''])
+
+            path = os.path.join(directory, 'reader1.jsonl')
+            writerForPath(path).write(model)
+            with open(path) as file:
+                records = [json.loads(line) for line in file]
+            self.slicer.assertEqual([record['answers'] for record in records], [["Reader"], ["a", "c"], [7], []])
+
+            path = os.path.join(directory, 'reader1.sqlite')
+            writerForPath(path, respondent='R1').write(model)
+            connection = sqlite3.connect(path)
+            rows = connection.execute("SELECT respondent, question_number, answer FROM answers ORDER BY rowid").fetchall()
+            connection.close()
+            self.slicer.assertEqual(rows, [('R1', 1, 'Reader'), ('R1', 2, 'a'), ('R1', 2, 'c'), ('R1', 3, 7), ('R1', 4, None)])
+
+            # Test an interrupted save keeps the previous file
+            def interrupted(path, answers, indices):
+                with open(path, 'w') as file:
+                    file.write("partial")
+                raise OSError("disk full")
+            writer = writerForPath(os.path.join(directory, 'reader1.csv'))
+            writer._write = interrupted
+            self.slicer.assertRaises(OSError, writer.write, model)
+            with open(writer.path) as file:
+                self.slicer.assertTrue(file.read().startswith("\"'question 2\""))
+            self.slicer.assertFalse(os.path.exists(writer.path + '.tmp'))
+
+    def test_ResultsWritersStreaming(self):
+        model = self._createModel()
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'questions.csv')
+            with open(csv_path, 'w', newline='') as csvFile:
+                writer = csv.writer(csvFile)
+                writer.writerow(['question', 'type', 'images', 'choices'])
+                writer.writerows([item.text, item.type, str(item.images), str(item.choices)] for item in model.items)
+
+            # Test saving and restoring a streamed survey reads its questions in one pass, never one by one
+            streamed = AnswerModel(IndexedSurvey(csv_path))
+            def readItem(index):
+                raise AssertionError(f"question {index + 1} was read on its own")
+            streamed.items._readItem = readItem
+            rows = [next(csv.reader([model.toCSV(index)])) for index in range(len(model))]
+            self.slicer.assertEqual(streamed.fromCSVRows(rows), [])
+            for name in ['reader1.csv', 'reader1.long.csv', 'reader1.jsonl']:
+                path = os.path.join(directory, name)
+                writerForPath(path, 'R1').write(streamed, skip={2})
+                with open(path) as file:
+                    written = file.read()
+                writerForPath(path, 'R1').write(model, skip={2})
+                with open(path) as file:
+                    self.slicer.assertEqual(written, file.read())
@@ -0,0 +1,45 @@
+from Resources.Lib.SurveySchedule import *
+from Resources.Lib.SurveyAnswers import AnswerModel
+from Resources.Lib.SurveyParser import SurveyItem
+import numpy as np
+
+
+class Test_SurveySchedule():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def _items(self, images):
+        return [SurveyItem(f"question {num}", "multi_single", names, ['yes', 'no']) for num, names in enumerate(images)]
+
+    def test_imageBlocks(self):
+        items = self._items([[], [], ['a', 'b'], ['c', 'd'], [], ['b', 'a'], ['c', 'd']])
+        preamble, blocks, images = imageBlocks(items)
+        self.slicer.assertEqual(preamble, [0, 1])
+        # Questions without images after the preamble stay with the question before them
+        self.slicer.assertEqual(blocks, [[2, 5], [3, 4, 6]])
+        self.slicer.assertEqual(images, [frozenset(['a', 'b']), frozenset(['c', 'd'])])
+
+    def test_scheduleQuestions(self):
+        rng = np.random.default_rng(0)
+        volumes = [f"volume{each}.nrrd" for each in range(40)]
+        pairs = [list(rng.choice(volumes, 2, replace=False)) for each in range(60)]
+        items = self._items([[], []] + [pairs[rng.integers(0, len(pairs))] for each in range(500)])
+
+        # Test the schedule is a reproducible permutation that keeps the preamble first
+        order = scheduleQuestions(items, seed=3)
+        self.slicer.assertEqual(sorted(order), list(range(len(items))))
+        self.slicer.assertEqual(order[:2], [0, 1])
+        self.slicer.assertEqual(order, scheduleQuestions(items, seed=3))
+        self.slicer.assertNotEqual(order, scheduleQuestions(items, seed=4))
+
+        # Test questions showing the same images are consecutive, and far fewer volumes are loaded
+        blocks = [frozenset(items[num].images) for num in order[2:]]
+        self.slicer.assertEqual(sum(each != previous for previous, each in zip(blocks, blocks[1:])) + 1, len(set(blocks)))
+        self.slicer.assertLess(volumeLoads(items, order), volumeLoads(items, range(len(items))) / 4)
+
+        # Test the next unanswered question follows the schedule
+        answers = AnswerModel(items)
+        for num in order[:10]:
+            answers.setAnswers(num, ['yes'])
+        self.slicer.assertEqual(answers.nextUnanswered(order[3], order), order[10])
+        self.slicer.assertEqual(answers.nextUnanswered(order[-1], order), order[10])
@@ -0,0 +1,37 @@
+from Resources.Lib.SurveyTrace import *
+import json
+import os
+import tempfile
+
+
+class Test_SurveyTrace():
+    def __init__(self, slicer):
+        self.slicer = slicer
+
+    def test_SpanTracer(self):
+        # Test a disabled tracer records nothing
+        tracer = SpanTracer()
+        with tracer.span('toQuestion', num=1):
+            pass
+        self.slicer.assertEqual(tracer.events, [])
+
+        # Test nested spans are recorded with their arguments and summarized per name
+        tracer = SpanTracer(enabled=True)
+        for num in range(3):
+            with tracer.span('toQuestion', num=num):
+                with tracer.span('loadNode', image='a.nrrd'):
+                    pass
+        summary = tracer.summary()
+        self.slicer.assertEqual(set(summary), {'toQuestion', 'loadNode'})
+        self.slicer.assertEqual(summary['toQuestion']['count'], 3)
+        self.slicer.assertGreaterEqual(summary['toQuestion']['total_ms'], summary['loadNode']['total_ms'])
+
+        # Test the Chrome trace has one complete event per span
+        with tempfile.TemporaryDirectory() as directory:
+            trace_path, summary_path = tracer.write(directory, 'questions')
+            with open(trace_path) as file:
+                events = json.load(file)['traceEvents']
+            self.slicer.assertEqual(len(events), 6)
+            self.slicer.assertTrue(all(event['ph'] == 'X' for event in events))
+            self.slicer.assertEqual(events[0]['args'], {'image': 'a.nrrd'})
+            self.slicer.assertTrue(os.path.exists(summary_path))
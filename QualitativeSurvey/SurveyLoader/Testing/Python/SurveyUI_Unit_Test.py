@@ -1,4 +1,6 @@
 from Resources.Lib.SurveyUI import *
+from Resources.Lib.SurveyAnswers import AnswerModel
+from Resources.Lib.SurveyParser import SurveyItem
 import sys
 import os
 
@@ -240,4 +242,93 @@ class Test_SurveyUI():
         
         #Test to csv 
         self.slicer.assertEqual(slider_question.toCSV(), "@new question test,@3\n")
-    
\ No newline at end of file
+    
+
+    def test_rebind(self):
+        # Test a recycled widget grows its choices, without keeping the previous answer
+        question = MultiSingleQuestion(1, "question 1", [], ["a", "b"])
+        question.button_group.buttons()[1].setChecked(True)
+        question.rebind(2, "question 2", ["image.nrrd"], ["c", "d", "e"])
+        self.slicer.assertEqual([button.text for button in question.button_group.buttons()], ["c", "d", "e"])
+        self.slicer.assertEqual(question.main_layout.count(), 2 + 3)
+        self.slicer.assertEqual(question.getAnswers(), [None])
+        self.slicer.assertEqual((question.getNumber(), question.getQuestion(), question.getImages()), (2, "question 2", ["image.nrrd"]))
+        self.slicer.assertTrue(question.setAnswer("e"))
+        self.slicer.assertEqual(question.getAnswers(), ["e"])
+
+        # Test shrinking removes the buttons past the new choices, even the checked one
+        question.rebind(3, "question 3", [], ["f"])
+        self.slicer.assertEqual([button.text for button in question.button_group.buttons()], ["f"])
+        self.slicer.assertEqual(question.main_layout.count(), 2 + 1)
+        self.slicer.assertEqual(question.getAnswers(), [None])
+        self.slicer.assertFalse(question.setAnswer("e"))
+
+        # Test checkboxes keep choice ids matching their position as they are added and removed
+        question = MultiMultiQuestion(1, "question 1", [], ["a", "b"])
+        self.slicer.assertTrue(question.setAnswer(["a", "b"]))
+        question.rebind(2, "question 2", [], ["c", "d", "e"])
+        self.slicer.assertEqual(question.getAnswers(), [None])
+        self.slicer.assertTrue(question.setAnswer(["c", "e"]))
+        self.slicer.assertEqual(question.getAnswers(), ["c", "e"])
+        question.rebind(3, "question 3", [], ["f", "g"])
+        self.slicer.assertEqual([button.text for button in question.button_group.buttons()], ["f", "g"])
+        self.slicer.assertEqual(question.getAnswers(), [None])
+        self.slicer.assertTrue(question.setAnswer(["g"]))
+        self.slicer.assertEqual(question.getAnswers(), ["g"])
+
+        question = RatingScaleQuestion(1, "question 1", [], 1, 5, 1)
+        self.slicer.assertTrue(question.setAnswer(3))
+        question.rebind(2, "question 2", [], [0, 10, 2])
+        self.slicer.assertEqual([button.text for button in question.button_group.buttons()], ["0", "2", "4", "6", "8", "10"])
+        self.slicer.assertEqual(question.getAnswers(), [None])
+        question.rebind(3, "question 3", [], [1, 3, 1])
+        self.slicer.assertEqual([button.text for button in question.button_group.buttons()], ["1", "2", "3"])
+        self.slicer.assertFalse(question.setAnswer(8))
+
+        question = DropDownQuestion(1, "question 1", [], ["a", "b"])
+        self.slicer.assertTrue(question.setAnswer("b"))
+        question.rebind(2, "question 2", [], ["c", "d", "e"])
+        self.slicer.assertEqual([question.combo_box.itemText(i) for i in range(question.combo_box.count)],
+                                ["Question Unanswered", "c", "d", "e"])
+        self.slicer.assertEqual(question.getAnswers(), [None])
+        question.rebind(3, "question 3", [], ["f"])
+        self.slicer.assertEqual(question.combo_box.count, 2)
+        self.slicer.assertFalse(question.setAnswer("c"))
+
+        question = SliderQuestion(1, "question 1", [], 1, 5)
+        question.setAnswers(["4"])
+        question.rebind(2, "question 2", [], [10, 20])
+        self.slicer.assertEqual(question.getSliderRange(), [10, 20])
+        self.slicer.assertEqual(question.getAnswers(), [None])
+
+        question = OpenEndedQuestion(1, "question 1", [])
+        question.setAnswer("text")
+        question.rebind(2, "question 2", [], [])
+        self.slicer.assertEqual(question.getAnswers(), [""])
+
+    def test_rebindModel(self):
+        items = [
+            SurveyItem("question 1", "multi_single", [], ["a", "b"]),
+            SurveyItem("question 2", "multi_single", [], ["c", "d", "e"]),
+        ]
+        model = AnswerModel(items)
+        model.setAnswers(1, ["e"])
+        question = MultiSingleQuestion(1, "question 1", [], list(items[0].choices))
+        question.bindModel(model, 0)
+        question.setAnswer("b")
+        self.slicer.assertEqual(model.getAnswers(0), ["b"])
+
+        # Test rebinding to another question shows its answer, and only changes that answer
+        question.unbindModel()
+        question.rebind(2, "question 2", [], list(items[1].choices))
+        self.slicer.assertEqual(model.getAnswers(0), ["b"])
+        question.bindModel(model, 1)
+        self.slicer.assertEqual(question.getAnswers(), ["e"])
+        question.setAnswer("c")
+        self.slicer.assertEqual(model.getAnswers(1), ["c"])
+        self.slicer.assertEqual(model.getAnswers(0), ["b"])
+
+        # Test an unbound widget no longer changes the model
+        question.unbindModel()
+        question.setAnswer("d")
+        self.slicer.assertEqual(model.getAnswers(1), ["c"])
@@ -0,0 +1,103 @@
+from Resources.Lib.SurveyWidgetStore import *
+from Resources.Lib.SurveyUI import MultiSingleQuestion, MultiMultiQuestion
+from Resources.Lib.SurveyAnswers import AnswerModel
+from Resources.Lib.SurveyParser import SurveyItem
+from Resources.Lib.SurveyQuestionnaire import SurveyQuestionnaire
+
+
+class Test_SurveyWidgetStore():
+    def __init__(self, slicer):
+        self.slicer = slicer
+        self.items = [
+            SurveyItem("question 1", "multi_single", [], ["a", "b"]),
+            SurveyItem("question 2", "multi_multi", [], ["m", "n"]),
+            SurveyItem("question 3", "multi_single", [], ["x", "y", "z"]),
+            SurveyItem("question 4", "multi_single", [], ["w"]),
+        ]
+
+    def test_lazyWidgets(self):
+        model = AnswerModel(self.items)
+        store = QuestionWidgetStore(self.items, SurveyQuestionnaire.createQuestionWidget, model, lazy=True, capacity=2)
+        self.slicer.assertFalse(any(store.isLoaded(index) for index in range(len(store))))
+
+        # Test widgets are only created when requested, and the least recently used is released first
+        current = store.pin(0)
+        current.setAnswer("b")
+        released = store[1]
+        released.setAnswer(["n"])
+        store[2]
+        self.slicer.assertEqual([store.isLoaded(index) for index in range(4)], [True, False, True, False])
+        self.slicer.assertIsNone(released.answer_model)
+        self.slicer.assertEqual(store.pools, {})
+
+        # Test the pinned current widget is never released, however many others are requested
+        for index in [3, 1, 2, 3, 1]:
+            store[index]
+            self.slicer.assertTrue(store.isLoaded(0))
+            self.slicer.assertLessEqual(len(store.widgets), 2)
+        self.slicer.assertIs(store[0], current)
+
+        # Test a released widget is rebuilt with its answer restored from the model
+        rebuilt = store.pin(1)
+        self.slicer.assertIsNot(rebuilt, released)
+        self.slicer.assertEqual(rebuilt.getAnswers(), ["n"])
+        self.slicer.assertEqual(model.getAnswers(0), ["b"])
+        store[2]
+        store[3]
+        self.slicer.assertTrue(store.isLoaded(1))
+        self.slicer.assertFalse(store.isLoaded(0))
+        self.slicer.assertEqual(store[0].getAnswers(), ["b"])
+
+        # Test invalidated widgets show the answers of the model when next requested
+        self.slicer.assertIs(store[1], rebuilt)
+        model.setAnswers(1, ["m", "n"])
+        self.slicer.assertEqual(rebuilt.getAnswers(), ["n"])
+        store.invalidate()
+        self.slicer.assertIs(store[1], rebuilt)
+        self.slicer.assertEqual(rebuilt.getAnswers(), ["m", "n"])
+        store.clear()
+        self.slicer.assertEqual(len(store.widgets), 0)
+
+    def test_pooledWidgets(self):
+        model = AnswerModel(self.items)
+        model.setAnswers(2, ["z"])
+        store = QuestionWidgetStore(self.items, SurveyQuestionnaire.createQuestionWidget, model, capacity=1, pooled=True)
+        first = store.pin(0)
+        first.setAnswer("b")
+        second = store.pin(2)
+        self.slicer.assertIsNot(second, first)
+        self.slicer.assertEqual(second.getAnswers(), ["z"])
+        self.slicer.assertEqual(store.pools['multi_single'], [first])
+        self.slicer.assertIsNone(first.answer_model)
+
+        # Test a released widget is recycled for a question of the same type with fewer choices
+        third = store.pin(3)
+        self.slicer.assertIs(third, first)
+        self.slicer.assertEqual([button.text for button in third.button_group.buttons()], ["w"])
+        self.slicer.assertEqual((third.getNumber(), third.getQuestion()), (4, "question 4"))
+        self.slicer.assertEqual(third.getAnswers(), [None])
+        self.slicer.assertEqual(model.getAnswers(0), ["b"])
+        third.setAnswer("w")
+        self.slicer.assertEqual(model.getAnswers(3), ["w"])
+
+        # Test a question of another type never gets a widget of the pool
+        fourth = store.pin(1)
+        self.slicer.assertIsInstance(fourth, MultiMultiQuestion)
+        self.slicer.assertEqual(len(store.pools['multi_single']), 2)
+        self.slicer.assertNotIn('multi_multi', store.pools)
+
+        # Test a recycled widget grows back its choices and shows the answer of its new question
+        fifth = store.pin(0)
+        self.slicer.assertIsInstance(fifth, MultiSingleQuestion)
+        self.slicer.assertEqual([button.text for button in fifth.button_group.buttons()], ["a", "b"])
+        self.slicer.assertEqual(fifth.getAnswers(), ["b"])
+        self.slicer.assertEqual(model.getAnswers(3), ["w"])
+        self.slicer.assertEqual(model.getAnswers(2), ["z"])
+
+        # Test pooled widgets are unbound, so changing them leaves the model alone
+        pooled = store.pools['multi_single'][0]
+        self.slicer.assertIsNone(pooled.answer_model)
+        pooled.setAnswer(pooled.getChoices()[0])
+        self.slicer.assertEqual([model.getAnswers(index) for index in range(4)], [["b"], [None], ["z"], ["w"]])
+        store.clear()
+        self.slicer.assertEqual(store.pools, {})